@@ -22,6 +22,11 @@ def test(cfg: DictConfig):
     runner.test()
 
 
+def certify(cfg: DictConfig):
+    runner = Trainer(cfg)
+    runner.certify()
+
+
 def logging_configure(cfg: DictConfig):
     # Remove all handlers associated with the root logger
     for handler in logging.root.handlers[:]:
@@ -56,6 +61,14 @@ def main(cfg: DictConfig):
     # Log setting
     logging_configure(cfg=cfg.general.logging)
 
+    # Seed and threads (e.g., one intra-op thread per worker of the multi-seed launcher)
+    if cfg.general.seed is not None:
+        np.random.seed(cfg.general.seed)
+        tf.random.set_seed(cfg.general.seed)
+    if cfg.general.num_threads is not None:
+        tf.config.threading.set_intra_op_parallelism_threads(cfg.general.num_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(cfg.general.num_threads)
+
     # Use GPU or not
     if not cfg.general.use_gpu:
         os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
@@ -76,6 +89,11 @@ def main(cfg: DictConfig):
             exit("Please load the pretrained checkpoint")
         else:
             test(cfg)
+    elif cfg.general.mode == 'certify':
+        if cfg.general.checkpoint is None:
+            exit("Please load the pretrained checkpoint")
+        else:
+            certify(cfg)
     else:
         raise RuntimeError('No such a mode, please check it')
 
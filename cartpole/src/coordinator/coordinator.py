@@ -4,12 +4,9 @@ import enum
 import copy
 import numpy as np
 from typing import List
-import matplotlib.pyplot as plt
 from numpy.linalg import inv
 from numpy import linalg as LA
 
-from src.hp_student.agents.ddpg import DDPGAgent
-from src.logger.logger import Logger, plot_trajectory
 from src.utils.utils import ActionMode, energy_value, logger
 from src.physical_design import MATRIX_P
 
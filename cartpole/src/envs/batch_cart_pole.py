@@ -0,0 +1,247 @@
+import numpy as np
+from gym.utils import seeding
+from omegaconf import DictConfig
+
+from src.physical_design import MATRIX_P
+from src.envs.initial_conditions import EllipsoidSampler
+from src.utils.utils import logger
+
+
+class BatchCartpole:
+    """
+    N independent cart-pole plants stepped together with vectorized NumPy ops.
+
+    Mirrors the dynamics of `Cartpole.step` (euler and semi-implicit euler) but keeps
+    the state as an (N, 4) array and the physical parameters as (N,) arrays so that
+    domain randomization can give every plant its own masses and frictions.
+    """
+
+    def __init__(self, config: DictConfig, num_envs: int, auto_reset: bool = True):
+        self.params = config
+        self.num_envs = int(num_envs)
+        self.auto_reset = auto_reset
+        self.safety_set = dict(config.safety_set)
+
+        # Random variable settings (same seeds as the scalar Cartpole)
+        self._reset_rand = self.seed(seed=config.random_reset.seed)
+        self._noise_rand = self.seed(seed=config.inject_disturbance.seed)
+        self._domain_rand = self.seed(seed=config.domain_random.seed)
+        self._reset_threshold = config.random_reset.threshold
+        self._reset_sampler = config.random_reset.get('sampler', 'ellipsoid')
+        self._initial_sampler = EllipsoidSampler.from_safety_set(MATRIX_P, self.safety_set)
+        self._noise_apply = config.inject_disturbance.actuator.apply
+        self._noise_mean = config.inject_disturbance.actuator.distribution.mean
+        self._noise_stddev = config.inject_disturbance.actuator.distribution.stddev
+
+        # Cart-Pole settings (per-env physical parameters)
+        n = self.num_envs
+        self.gravity = config.gravity
+        self.tau = 1 / config.frequency
+        self.half_length = config.length_pole * 0.5
+        self.with_friction = config.with_friction
+        self.mass_cart = np.full(n, config.mass_cart, dtype=np.float64)
+        self.mass_pole = np.full(n, config.mass_pole, dtype=np.float64)
+        self.friction_cart = np.full(n, config.friction_cart, dtype=np.float64)
+        self.friction_pole = np.full(n, config.friction_pole, dtype=np.float64)
+        self._f_min, self._f_max = config.force_bound
+        self._update_derived_params()
+
+        # Runtime status
+        self.state = np.zeros((n, 4), dtype=np.float64)  # x, x_dot, theta, theta_dot
+        self.failed = np.zeros(n, dtype=bool)
+        self.ut = np.zeros(n, dtype=np.float64)
+        self.state_dim = 4
+        self.state_observations_dim = 5
+        self.action_dim = 1
+
+    @staticmethod
+    def seed(seed=None):
+        np_random, seed = seeding.np_random(seed)
+        return np_random
+
+    def _update_derived_params(self):
+        self.total_mass = self.mass_cart + self.mass_pole
+        self.pole_mass_length_half = self.mass_pole * self.half_length
+
+    def step(self, actions: np.ndarray):
+        """
+        actions: the (N,) actions injected to the plants
+        return: the (N, 4) states and the (N,) failed flags after one step
+
+        With `auto_reset` enabled, plants that failed in this step are randomly reset
+        after their failed flag has been recorded, so the returned state of those envs
+        is already the initial state of their next episode.
+        """
+        x, x_dot, theta, theta_dot = self.state.T
+        tau = self.tau
+
+        # Truncate the force applied to the cartpole systems
+        force = np.clip(np.asarray(actions, dtype=np.float64).reshape(self.num_envs),
+                        a_min=self._f_min, a_max=self._f_max)
+
+        # Actual force applied to plant after random noise
+        if self._noise_apply:
+            force = force + self._noise_rand.normal(loc=self._noise_mean,
+                                                    scale=self._noise_stddev,
+                                                    size=self.num_envs)
+        self.ut = force
+
+        cos_th = np.cos(theta)
+        sin_th = np.sin(theta)
+        mplh = self.pole_mass_length_half
+        total_mass = self.total_mass
+        denominator = self.half_length * (4.0 / 3.0 - self.mass_pole * cos_th ** 2 / total_mass)
+
+        # kinematics of the inverted pendulums
+        if self.with_friction:
+            temp = (force + mplh * theta_dot ** 2 * sin_th - self.friction_cart * x_dot) / total_mass
+            th_acc = (self.gravity * sin_th - cos_th * temp
+                      - self.friction_pole * theta_dot / mplh) / denominator
+        else:
+            temp = (force + mplh * theta_dot ** 2 * sin_th) / total_mass
+            th_acc = (self.gravity * sin_th - cos_th * temp) / denominator
+        x_acc = temp - mplh * th_acc * cos_th / total_mass
+
+        if self.params.kinematics_integrator == 'euler':
+            x_new = x + tau * x_dot
+            x_dot_new = x_dot + tau * x_acc
+            theta_new = theta + tau * theta_dot
+            theta_dot_new = theta_dot + tau * th_acc
+        else:  # semi-implicit euler
+            x_dot_new = x_dot + tau * x_acc
+            x_new = x + tau * x_dot_new
+            theta_dot_new = theta_dot + tau * th_acc
+            theta_new = theta + tau * theta_dot_new
+
+        self.failed = self.is_failed(x_new, theta_new)
+        theta_rescale = np.arctan2(np.sin(theta_new), np.cos(theta_new))  # wrap to [-pi, pi]
+        self.state = np.stack([x_new, x_dot_new, theta_rescale, theta_dot_new], axis=1)
+
+        failed = self.failed.copy()
+        if self.auto_reset and failed.any():
+            logger.debug(f"Auto reset {int(failed.sum())} failed envs")
+            self.random_reset(mask=failed)
+
+        return self.state, failed
+
+    def reset(self, reset_state=None, mask=None):
+        """
+        Reset the selected envs (all by default) to `reset_state` or the configured initial condition
+        """
+        idx = self._mask_to_index(mask)
+        if reset_state is None:
+            reset_state = self.params.initial_condition[:4]
+        self.state[idx] = np.asarray(reset_state, dtype=np.float64)[..., :4]
+        self.failed[idx] = False
+
+    def random_reset(self, threshold=None, domain_random=False, mask=None):
+        """
+        Randomly reset the selected envs (all by default) inside the safety set as `Cartpole.random_reset` does,
+        i.e., uniformly over the safety box intersected with the energy sublevel set
+        """
+        if threshold is None:
+            threshold = self._reset_threshold
+
+        idx = self._mask_to_index(mask)
+
+        # Apply domain randomization
+        if domain_random:
+            self.apply_domain_randomization(mask=idx)
+
+        if self._reset_sampler == 'ellipsoid':
+            self.state[idx] = self._initial_sampler.sample(self._reset_rand, idx.size, threshold)
+            self.failed[idx] = False
+            return
+
+        low = np.array([self.safety_set[k][0] for k in ('x', 'x_dot', 'theta', 'theta_dot')])
+        high = np.array([self.safety_set[k][1] for k in ('x', 'x_dot', 'theta', 'theta_dot')])
+
+        pending = idx
+        while pending.size > 0:
+            samples = self._reset_rand.uniform(low, high, size=(pending.size, 4))
+            energy = np.einsum('ij,jk,ik->i', samples, MATRIX_P, samples)
+            accepted = energy < threshold
+            self.state[pending[accepted]] = samples[accepted]
+            pending = pending[~accepted]
+
+        self.failed[idx] = False
+
+    def keep(self, mask):
+        """
+        Drop all envs but the selected ones, e.g., finished rollouts of a large batch
+        """
+        idx = self._mask_to_index(mask)
+        self.num_envs = idx.size
+        self.state = self.state[idx]
+        self.failed = self.failed[idx]
+        self.ut = self.ut[idx]
+        self.mass_cart = self.mass_cart[idx]
+        self.mass_pole = self.mass_pole[idx]
+        self.friction_cart = self.friction_cart[idx]
+        self.friction_pole = self.friction_pole[idx]
+        self._update_derived_params()
+
+    def apply_domain_randomization(self, mask=None):
+        idx = self._mask_to_index(mask)
+        dr = self.params.domain_random
+
+        # Cart mass
+        if dr.mass_cart.apply:
+            self.mass_cart[idx] = self.params.mass_cart + self.get_values_by_distribution(
+                self._domain_rand, dr.mass_cart.distribution, size=idx.size)
+
+        # Pole mass
+        if dr.mass_pole.apply:
+            self.mass_pole[idx] = self.params.mass_pole + self.get_values_by_distribution(
+                self._domain_rand, dr.mass_pole.distribution, size=idx.size)
+
+        # Cart friction
+        if dr.friction_cart.apply:
+            self.friction_cart[idx] = self.params.friction_cart + self.get_values_by_distribution(
+                self._domain_rand, dr.friction_cart.distribution, size=idx.size)
+
+        # Pole friction
+        if dr.friction_pole.apply:
+            self.friction_pole[idx] = self.params.friction_pole + self.get_values_by_distribution(
+                self._domain_rand, dr.friction_pole.distribution, size=idx.size)
+
+        self._update_derived_params()
+
+    @staticmethod
+    def get_values_by_distribution(seed_generator, distribution: DictConfig, size: int):
+        if distribution.type == 'gaussian':
+            return seed_generator.normal(loc=distribution.mean, scale=distribution.stddev, size=size)
+        elif distribution.type == 'uniform':
+            return seed_generator.uniform(distribution.lb, distribution.ub, size=size)
+        elif distribution.type == 'constant':
+            return np.full(size, distribution.value, dtype=np.float64)
+        else:
+            raise RuntimeError(f"Undefined distribution type: {distribution.type}")
+
+    def is_trans_failed(self, x):
+        return (x <= self.safety_set['x'][0]) | (x >= self.safety_set['x'][1])
+
+    def is_theta_failed(self, theta):
+        return (theta <= self.safety_set['theta'][0]) | (theta >= self.safety_set['theta'][1])
+
+    def is_failed(self, x, theta):
+        return self.is_trans_failed(x) | self.is_theta_failed(theta)
+
+    def get_observations(self):
+        """
+        Batched `state2observations`: (N, 5) array of x, x_dot, s_theta, c_theta, theta_dot
+        """
+        return batch_state2observations(self.state)
+
+    def _mask_to_index(self, mask):
+        if mask is None:
+            return np.arange(self.num_envs)
+        mask = np.asarray(mask)
+        if mask.dtype == bool:
+            return np.flatnonzero(mask)
+        return mask.astype(np.int64).reshape(-1)
+
+
+def batch_state2observations(states: np.ndarray):
+    x, x_dot, theta, theta_dot = np.asarray(states)[..., :4].T
+    return np.stack([x, x_dot, np.sin(theta), np.cos(theta), theta_dot], axis=-1)
@@ -2,16 +2,15 @@ import os
 import gym
 import math
 import copy
-import pyglet
 import numpy as np
 
 from numpy.linalg import inv
 from gym.utils import seeding
 from numpy import linalg as LA
 from omegaconf import DictConfig
-import matplotlib.pyplot as plt
 
 from src.physical_design import MATRIX_P, MATRIX_A, MATRIX_B, F
+from src.envs.initial_conditions import EllipsoidSampler
 from src.utils.utils import energy_value, logger
 
 
@@ -33,6 +32,8 @@ class Cartpole(gym.Env):
         self._noise_rand = self.seed(seed=config.inject_disturbance.seed)
         self._domain_rand = self.seed(seed=config.domain_random.seed)
         self._reset_threshold = config.random_reset.threshold
+        self._reset_sampler = config.random_reset.get('sampler', 'ellipsoid')
+        self._initial_sampler = EllipsoidSampler.from_safety_set(MATRIX_P, self.safety_set)
         self._noise_apply = config.inject_disturbance.actuator.apply
         self._noise_mean = config.inject_disturbance.actuator.distribution.mean
         self._noise_stddev = config.inject_disturbance.actuator.distribution.stddev
@@ -54,6 +55,7 @@ class Cartpole(gym.Env):
         # Runtime status
         self.state = None
         self.viewer = None
+        self.renderer = None
         self.state_dim = 4  # x, x_dot, theta, theta_dot
         self.state_observations_dim = 5  # x, x_dot, s_theta, c_theta, theta_dot
         self.action_dim = 1  # force input or voltage
@@ -142,29 +144,44 @@ class Cartpole(gym.Env):
         if domain_random:
             self.apply_domain_randomization()
 
-        x_l, x_h = self.safety_set['x']
-        dx_l, dx_h = self.safety_set['x_dot']
-        th_l, th_h = self.safety_set['theta']
-        dth_l, dth_h = self.safety_set['theta_dot']
-
-        flag = True
-        while flag:
-            rand_x = self._reset_rand.uniform(x_l, x_h)
-            rand_dx = self._reset_rand.uniform(dx_l, dx_h)
-            rand_th = self._reset_rand.uniform(th_l, th_h)
-            rand_dth = self._reset_rand.uniform(dth_l, dth_h)
-
-            energy = energy_value(
-                state=np.array([rand_x, rand_dx, rand_th, rand_dth]), p_mat=MATRIX_P
-            )
-            if energy < threshold:
-                flag = False
-                # self._reset_cnt += 1
-                # if self._reset_cnt > self._reset_ep:
-                #     flag = False
+        if self._reset_sampler == 'ellipsoid':
+            rand_x, rand_dx, rand_th, rand_dth = self._initial_sampler.sample(self._reset_rand, 1, threshold)[0]
+
+        elif self._reset_sampler == 'rejection':
+            x_l, x_h = self.safety_set['x']
+            dx_l, dx_h = self.safety_set['x_dot']
+            th_l, th_h = self.safety_set['theta']
+            dth_l, dth_h = self.safety_set['theta_dot']
+
+            flag = True
+            while flag:
+                rand_x = self._reset_rand.uniform(x_l, x_h)
+                rand_dx = self._reset_rand.uniform(dx_l, dx_h)
+                rand_th = self._reset_rand.uniform(th_l, th_h)
+                rand_dth = self._reset_rand.uniform(dth_l, dth_h)
+
+                energy = energy_value(
+                    state=np.array([rand_x, rand_dx, rand_th, rand_dth]), p_mat=MATRIX_P
+                )
+                if energy < threshold:
+                    flag = False
+        else:
+            raise RuntimeError(f"Unknown random reset sampler: {self._reset_sampler}, "
+                               f"choose from ('ellipsoid', 'rejection')")
 
         self.state = [rand_x, rand_dx, rand_th, rand_dth, False]
 
+    def sample_initial_conditions(self, n, threshold=None, seed=None):
+        """
+        Draw n initial conditions (n, 4) inside the safety envelope and the safety set, e.g., for evaluation suites
+
+        A seed gives a reproducible suite, otherwise the reset random generator is used (and advanced)
+        """
+        if threshold is None:
+            threshold = self._reset_threshold
+        rand = self._reset_rand if seed is None else self.seed(seed=seed)
+        return self._initial_sampler.sample(rand, n, threshold)
+
     def apply_domain_randomization(self):
         # Cart mass
         if self.params.domain_random.mass_cart.apply:
@@ -215,7 +232,35 @@ class Cartpole(gym.Env):
         else:
             raise RuntimeError(f"Undefined distribution type: {distribution.type}")
 
+    def get_renderer(self):
+        """
+        Software renderer for the rgb_array frames (created on first use)
+        """
+        if self.renderer is None:
+            from src.envs.cart_pole_renderer import CartpoleRenderer  # Pillow and imageio only load for rendering
+            self.renderer = CartpoleRenderer(x_set=self.safety_set['x'],
+                                             theta_set=self.safety_set['theta'],
+                                             antialias=self.params.render.antialias,
+                                             labels=self.params.render.labels)
+        return self.renderer
+
+    def save_gif(self, path, states, fps=10, start_idx=0):
+        """
+        Stream a recorded state trajectory (N, 4) into a GIF with the software renderer
+        """
+        return self.get_renderer().save_gif(path, states, fps=fps, start_idx=start_idx)
+
     def render(self, mode='human', state=None, idx=0):
+        if mode == 'rgb_array' and self.params.render.backend == 'software':
+            s = self.state if state is None else state
+            if s is None:
+                return None
+            return self.get_renderer().render(s[:4], idx=idx).copy()
+        elif self.params.render.backend not in ('software', 'pyglet'):
+            raise RuntimeError(f"Unknown render backend: {self.params.render.backend}, choose from "
+                               f"('software', 'pyglet')")
+
+        import pyglet
         from gym.envs.classic_control import rendering
 
         class DrawText:
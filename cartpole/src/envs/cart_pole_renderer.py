@@ -0,0 +1,194 @@
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Same scene as the gym viewer in `Cartpole.render` (pixels, y-axis pointing up)
+SCREEN_WIDTH = 600
+SCREEN_HEIGHT = 400
+CART_Y = 120
+CART_WIDTH = 50.0
+CART_HEIGHT = 30.0
+POLE_WIDTH = 10.0
+POLE_LENGTH = 137
+AXLE_OFFSET = CART_HEIGHT / 4.0
+TARGET_RADIUS = 12
+
+BACKGROUND_COLOR = (255, 255, 255)
+CART_COLOR = (0, 0, 0)
+POLE_COLOR = (204, 153, 102)
+AXLE_COLOR = (128, 128, 204)
+TARGET_COLOR = (204, 204, 115)
+TRACK_COLOR = (0, 0, 0)
+FAILED_COLOR = (255, 0, 0)
+TEXT_COLOR = (0, 0, 0)
+
+FONT_NAMES = ('Times New Roman.ttf', 'times.ttf', 'DejaVuSerif.ttf')
+
+
+class CartpoleRenderer:
+    """
+    Software renderer of the cart-pole scene, no OpenGL context needed
+
+    Every frame is drawn into the same preallocated (height, width, 3) uint8 buffer. Shapes are rasterized from
+    their signed distance over their bounding box only, which also gives the anti-aliased edge coverage for free.
+    Labels are drawn with Pillow.
+    """
+
+    def __init__(self, x_set, theta_set, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, antialias=True, labels=True):
+        self.x_set = x_set
+        self.theta_set = theta_set
+        self.width = width
+        self.height = height
+        self.antialias = antialias
+        self.labels = labels
+        self.scale = width / (x_set[1] * 2 + 1)
+
+        self.buffer = np.empty((height, width, 3), dtype=np.uint8)
+        self._background = np.empty_like(self.buffer)
+        self._background[...] = BACKGROUND_COLOR
+
+        # Static target, drawn once into the background
+        self._draw_circle(self._background, width / 2.0, POLE_LENGTH + CART_Y, TARGET_RADIUS, TARGET_COLOR)
+        self._fonts = {}
+
+    def _font(self, size):
+        if size not in self._fonts:
+            font = None
+            for name in FONT_NAMES:
+                try:
+                    font = ImageFont.truetype(name, size)
+                    break
+                except OSError:
+                    continue
+            self._fonts[size] = font if font is not None else ImageFont.load_default()
+        return self._fonts[size]
+
+    def _region(self, x_min, x_max, y_min, y_max):
+        """
+        Pixel rows/cols covering the box and their center coordinates (y-axis up)
+        """
+        c0, c1 = max(int(np.floor(x_min - 1)), 0), min(int(np.ceil(x_max + 1)), self.width)
+        r0 = max(int(np.floor(self.height - y_max - 1)), 0)
+        r1 = min(int(np.ceil(self.height - y_min + 1)), self.height)
+        if c0 >= c1 or r0 >= r1:
+            return None
+        xs = np.arange(c0, c1, dtype=np.float32) + 0.5
+        ys = self.height - (np.arange(r0, r1, dtype=np.float32) + 0.5)
+        return (slice(r0, r1), slice(c0, c1)), xs[None, :], ys[:, None]
+
+    def _fill(self, image, region, sdf, color):
+        if self.antialias:
+            coverage = np.clip(0.5 - sdf, 0., 1.)
+        else:
+            coverage = (sdf <= 0.).astype(np.float32)
+        pixels = image[region]
+        blended = pixels + coverage[..., None] * (np.asarray(color, dtype=np.float32) - pixels)
+        np.rint(blended, out=blended)
+        pixels[...] = blended
+
+    def _draw_circle(self, image, cx, cy, radius, color):
+        region = self._region(cx - radius, cx + radius, cy - radius, cy + radius)
+        if region is None:
+            return
+        region, xs, ys = region
+        self._fill(image, region, np.hypot(xs - cx, ys - cy) - radius, color)
+
+    def _draw_box(self, image, cx, cy, half_length, half_width, angle, color):
+        """
+        Box centered at (cx, cy), whose length axis is rotated clockwise by `angle` from the y-axis
+        """
+        s, c = np.sin(angle), np.cos(angle)
+        ex = abs(s) * half_length + abs(c) * half_width
+        ey = abs(c) * half_length + abs(s) * half_width
+        region = self._region(cx - ex, cx + ex, cy - ey, cy + ey)
+        if region is None:
+            return
+        region, xs, ys = region
+        dx, dy = xs - cx, ys - cy
+        qu = np.abs(dx * s + dy * c) - half_length
+        qv = np.abs(dx * c - dy * s) - half_width
+        sdf = np.hypot(np.maximum(qu, 0.), np.maximum(qv, 0.)) + np.minimum(np.maximum(qu, qv), 0.)
+        self._fill(image, region, sdf, color)
+
+    def _draw_text(self, text, x, y, size, anchor_bottom=False):
+        font = self._font(size)
+        left, top, right, bottom = font.getbbox(text)
+        w, h = right - left, bottom - top
+        if w <= 0 or h <= 0:
+            return
+        mask = Image.new('L', (w, h))
+        ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=font)
+
+        r0 = int(round(self.height - y - (h if anchor_bottom else h / 2)))
+        c0 = int(round(x - w / 2))
+        rows = slice(max(r0, 0), min(r0 + h, self.height))
+        cols = slice(max(c0, 0), min(c0 + w, self.width))
+        alpha = np.asarray(mask, dtype=np.float32)[rows.start - r0:rows.stop - r0, cols.start - c0:cols.stop - c0]
+        pixels = self.buffer[rows, cols]
+        pixels[...] = pixels + (alpha[..., None] / 255.) * (np.asarray(TEXT_COLOR, dtype=np.float32) - pixels)
+
+    def _draw(self, state, idx, cart_failed, pole_failed):
+        np.copyto(self.buffer, self._background)
+
+        cart_x = state[0] * self.scale + self.width / 2.0
+        theta = state[2]
+
+        # Cart
+        self._draw_box(self.buffer, cart_x, CART_Y, CART_HEIGHT / 2, CART_WIDTH / 2, 0.,
+                       FAILED_COLOR if cart_failed else CART_COLOR)
+
+        # Pole, from -pole_width/2 to pole_length - pole_width/2 along its axis
+        axle_y = CART_Y + AXLE_OFFSET
+        center = (POLE_LENGTH - POLE_WIDTH) / 2
+        self._draw_box(self.buffer, cart_x + center * np.sin(theta), axle_y + center * np.cos(theta),
+                       POLE_LENGTH / 2, POLE_WIDTH / 2, theta, FAILED_COLOR if pole_failed else POLE_COLOR)
+
+        # Axle and track
+        self._draw_circle(self.buffer, cart_x, axle_y, POLE_WIDTH / 2, AXLE_COLOR)
+        self.buffer[self.height - CART_Y - 1] = TRACK_COLOR
+
+        if self.labels:
+            self._draw_text(f'Step: {idx}', 300, 340, 26)
+            self._draw_text(f'x: {state[0]:.2f} m', 170, 40, 20, anchor_bottom=True)
+            self._draw_text(f'theta: {state[2]:.2f} rad', 430, 40, 20, anchor_bottom=True)
+        return self.buffer
+
+    def is_failed(self, states):
+        """
+        (cart failed, pole failed) flags of the states (..., 4), the bounds count as failed (as in `Cartpole`)
+        """
+        states = np.asarray(states, dtype=np.float64)
+        x, theta = states[..., 0], states[..., 2]
+        return ((x <= self.x_set[0]) | (x >= self.x_set[1]),
+                (theta <= self.theta_set[0]) | (theta >= self.theta_set[1]))
+
+    def render(self, state, idx=0):
+        """
+        Render one state into the buffer, which is overwritten by the next call
+        """
+        cart_failed, pole_failed = self.is_failed(state)
+        return self._draw(np.asarray(state, dtype=np.float64), idx, cart_failed, pole_failed)
+
+    def render_trajectory(self, states, start_idx=0):
+        """
+        Render a recorded state trajectory (N, 4) frame by frame
+
+        The failure flags are evaluated for the whole trajectory at once, and every yielded frame is the reused buffer,
+        so the frames should be consumed (e.g., written to a file) as they come
+        """
+        states = np.asarray(states, dtype=np.float64)
+        cart_failed, pole_failed = self.is_failed(states)
+        for i, state in enumerate(states):
+            yield self._draw(state, start_idx + i, cart_failed[i], pole_failed[i])
+
+    def save_gif(self, path, states, fps=10, start_idx=0, hold_last=5):
+        """
+        Stream the rendered trajectory into a GIF, without keeping the frames in memory
+        """
+        import imageio  # Only needed for GIF export
+        with imageio.get_writer(path, mode='I', fps=fps, loop=0) as writer:
+            frame = None
+            for frame in self.render_trajectory(states, start_idx=start_idx):
+                writer.append_data(frame)
+            for _ in range(hold_last if frame is not None else 0):
+                writer.append_data(frame)
+        return path
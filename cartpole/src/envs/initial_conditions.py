@@ -0,0 +1,79 @@
+import math
+import numpy as np
+
+STATE_KEYS = ('x', 'x_dot', 'theta', 'theta_dot')
+
+
+class EllipsoidSampler:
+    """
+    Uniform sampler over the safety envelope {s : s^T P s < threshold} intersected with the safety box
+
+    With the Cholesky factor P = L L^T, the map s = sqrt(threshold) * L^-T u sends the unit ball onto the envelope, so
+    points drawn uniformly in the ball are uniform in the envelope and only the box constraint is left for rejection.
+    When the box is the smaller of the two sets, it is sampled instead and the envelope is rejected, as in the former
+    rejection loop. Both give the same distribution, uniform over the intersection.
+    """
+
+    def __init__(self, p_mat, low, high):
+        self.p_mat = np.asarray(p_mat, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.dim = len(self.low)
+
+        chol = np.linalg.cholesky(self.p_mat)
+        self.transform = np.linalg.inv(chol)  # Rows of L^-1, i.e., s = sqrt(threshold) * u @ L^-1
+
+        # Log volumes to pick the set to sample from
+        self._log_unit_ball = self.dim / 2 * math.log(math.pi) - math.lgamma(self.dim / 2 + 1)
+        self._log_det_p = float(np.linalg.slogdet(self.p_mat)[1])
+        self._log_box = float(np.sum(np.log(self.high - self.low)))
+
+    @classmethod
+    def from_safety_set(cls, p_mat, safety_set):
+        low = [safety_set[k][0] for k in STATE_KEYS]
+        high = [safety_set[k][1] for k in STATE_KEYS]
+        return cls(p_mat, low, high)
+
+    def log_envelope_volume(self, threshold):
+        return self._log_unit_ball + self.dim / 2 * math.log(threshold) - 0.5 * self._log_det_p
+
+    def energy(self, states):
+        return np.einsum('ij,jk,ik->i', states, self.p_mat, states)
+
+    def in_box(self, states):
+        return np.all((states >= self.low) & (states < self.high), axis=1)
+
+    def _sample_envelope(self, rng, n, threshold):
+        directions = rng.normal(size=(n, self.dim))
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+        radii = rng.uniform(size=(n, 1)) ** (1. / self.dim)
+        return math.sqrt(threshold) * (directions * radii) @ self.transform
+
+    def sample(self, rng, n, threshold, max_rounds=10000):
+        """
+        Draw n states (n, dim) with the random generator `rng` (numpy RandomState or Generator)
+        """
+        if threshold <= 0:
+            raise RuntimeError(f"Reset threshold must be positive, got {threshold}")
+
+        from_envelope = self.log_envelope_volume(threshold) < self._log_box
+        samples = np.empty((n, self.dim), dtype=np.float64)
+        filled = 0
+        for _ in range(max_rounds):
+            if filled == n:
+                break
+            m = 2 * (n - filled)
+            if from_envelope:
+                candidates = self._sample_envelope(rng, m, threshold)
+                candidates = candidates[self.in_box(candidates)]
+            else:
+                candidates = rng.uniform(self.low, self.high, size=(m, self.dim))
+                candidates = candidates[self.energy(candidates) < threshold]
+            k = min(len(candidates), n - filled)
+            samples[filled:filled + k] = candidates[:k]
+            filled += k
+        else:
+            if filled < n:
+                raise RuntimeError(f"Only {filled}/{n} initial conditions found after {max_rounds} rounds, the safety "
+                                   f"envelope (threshold {threshold}) may not intersect the safety box")
+        return samples
@@ -0,0 +1,74 @@
+import numpy as np
+import cvxpy as cp
+from omegaconf import DictConfig
+
+from src.physical_design import MATRIX_P
+
+
+class CvxEngine:
+    """
+    In-process counterpart of `MatEngine` which solves the patch LMIs (matlab/patch_lmi.m) with cvxpy
+    """
+
+    def __init__(self, cfg: DictConfig):
+        self.solver = cfg.get('solver', 'SCS')
+        self.verbose = cfg.get('stdout', False)
+
+        # Hyperparameters kept identical to patch_lmi.m
+        self.p_mat = MATRIX_P
+        self.p_mat_inv = np.linalg.inv(MATRIX_P)
+        self.D = np.array([[1 / 1, 0, 0, 0],
+                           [0, 0, 1 / 0.8, 0]])
+        self.C = 1 / 50
+        self.alpha = 0.999
+        self.kappa = 0.01
+        self.gamma1 = 1
+        self.gamma2 = 0.1
+
+    def system_patch(self,
+                     chi,
+                     Ak: np.ndarray,
+                     Bk: np.ndarray):
+        """
+        Solve the patch LMIs for the feedback gain F_hat
+
+        Returns (F_hat, t_min) as `MatEngine.system_patch` does, where t_min < 0 indicates that the LMIs are feasible
+        """
+        Ak = Ak.reshape(4, 4)
+        Bk = Bk.reshape(4, 1)
+
+        Q = cp.Variable((4, 4), symmetric=True)
+        R = cp.Variable((1, 4))
+        mu = cp.Variable((1, 1))
+        T = cp.Variable((1, 1), symmetric=True)
+
+        AQ_BR = Ak @ Q + Bk @ R
+        constraints = [
+            cp.bmat([[(self.alpha - self.kappa * (1 + (1 / self.gamma2))) * Q, AQ_BR.T],
+                     [AQ_BR, Q / (1 + self.gamma2)]]) >> 0,
+            mu >= 0,
+            Q - mu * self.p_mat_inv >> 0,
+            (1 - (2 * chi) + (chi / self.gamma1)) + mu * (chi * self.gamma1 - 1) <= 0,
+            np.identity(2) - self.D @ Q @ self.D.T >> 0,
+            cp.bmat([[Q, R.T],
+                     [R, T]]) >> 0,
+            1 - self.C * T * self.C >= 0,
+        ]
+
+        problem = cp.Problem(cp.Minimize(0), constraints)
+        try:
+            problem.solve(solver=self.solver, verbose=self.verbose)
+        except cp.error.SolverError:
+            return np.zeros((1, 4)), 1.
+
+        if problem.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE):
+            return np.zeros((1, 4)), 1.
+
+        F_hat = R.value @ np.linalg.inv(Q.value)
+
+        # Closed-loop stability check (same as the assertion in patch_lmi.m)
+        M = Ak + Bk @ F_hat
+        if not np.all(np.abs(np.linalg.eigvals(M)) < 1):
+            return F_hat, 1.
+
+        return F_hat, -1.
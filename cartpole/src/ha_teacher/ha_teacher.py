@@ -1,15 +1,9 @@
-import os
-import time
-import copy
+import hydra
 import numpy as np
-import matplotlib.pyplot as plt
-from numpy.linalg import inv
-from numpy import linalg as LA
+from collections import OrderedDict
 
 from src.physical_design import MATRIX_P, F, F_Simplex
-from src.ha_teacher.mat_engine import MatEngine
-from src.hp_student.agents.ddpg import DDPGAgent
-from src.logger.logger import Logger, plot_trajectory
+from src.ha_teacher.patch_table import PatchTable
 from src.utils.utils import energy_value, get_discrete_Ad_Bd, logger, ActionMode
 
 np.set_printoptions(suppress=True)
@@ -18,8 +12,24 @@ np.set_printoptions(suppress=True)
 class HATeacher:
     def __init__(self, teacher_cfg, cartpole_cfg):
 
-        # Matlab Engine
-        self.mat_engine = MatEngine(cfg=teacher_cfg.matlab_engine)
+        # Precomputed patch gain table, or a Patch Engine (Matlab or in-process cvxpy) solving it online
+        self.patch_table = None
+        self._mat_engine = None
+        self._engine_cfg = teacher_cfg.matlab_engine
+        if teacher_cfg.patch_table.enable:
+            self.patch_table = PatchTable.load(hydra.utils.to_absolute_path(teacher_cfg.patch_table.path))
+            if self.patch_table.chi != teacher_cfg.chi or self.patch_table.freq != cartpole_cfg.frequency:
+                raise RuntimeError(f"Patch table built for chi={self.patch_table.chi}, freq={self.patch_table.freq} "
+                                   f"mismatches chi={teacher_cfg.chi}, freq={cartpole_cfg.frequency}")
+        elif teacher_cfg.matlab_engine.get('eager_start', False):
+            self._mat_engine = self.make_patch_engine(cfg=self._engine_cfg)
+
+        # Patch gain cache keyed on the quantized (theta, theta_dot)
+        self._cache_enable = teacher_cfg.patch_cache.enable
+        self._cache_resolution = np.array([teacher_cfg.patch_cache.theta_resolution,
+                                           teacher_cfg.patch_cache.theta_dot_resolution])
+        self._cache_max_size = teacher_cfg.patch_cache.max_size
+        self._patch_cache = OrderedDict()
 
         # Teacher Configuration
         self.chi = teacher_cfg.chi
@@ -87,11 +97,8 @@ class HATeacher:
         if self.teacher_enable is False or self._teacher_activate is False:
             return None, False
 
-        As, Bs = self.get_As_Bs_by_state(state=self._plant_state)
-        Ak, Bk = get_discrete_Ad_Bd(Ac=As, Bc=Bs, T=1 / self.freq)
-
-        # Call Matlab Engine for patch gain (F_hat)
-        F_hat, t_min = self.mat_engine.system_patch(Ak=Ak, Bk=Bk, chi=self.chi)
+        # Call Patch Engine for patch gain (F_hat)
+        F_hat, t_min = self.system_patch(state=self._plant_state)
 
         if t_min > 0:
             print(f"LMI has no solution, use last updated patch")
@@ -123,6 +130,60 @@ class HATeacher:
 
         return teacher_action, True
 
+    @property
+    def mat_engine(self):
+        """
+        Patch Engine, started on the first patch (never when the teacher stays disabled or inactive)
+        """
+        if self._mat_engine is None:
+            self._mat_engine = self.make_patch_engine(cfg=self._engine_cfg)
+        return self._mat_engine
+
+    @staticmethod
+    def make_patch_engine(cfg):
+        backend = cfg.get('backend', 'matlab')
+        if backend == 'matlab':
+            from src.ha_teacher.mat_engine import MatEngine
+            return MatEngine(cfg=cfg)
+        elif backend == 'cvxpy':
+            from src.ha_teacher.cvx_engine import CvxEngine
+            return CvxEngine(cfg=cfg)
+        else:
+            raise RuntimeError(f"Unknown patch engine backend: {backend}")
+
+    def system_patch(self, state: np.ndarray):
+        """
+        Get the patch gain (F_hat) for the given state, reusing the cached solution of the quantized (theta, theta_dot)
+        """
+        # Bilinear interpolation from the precomputed table
+        if self.patch_table is not None:
+            return self.patch_table.lookup(theta=state[2], theta_dot=state[3])
+
+        if not self._cache_enable:
+            As, Bs = self.get_As_Bs_by_state(state=state)
+            Ak, Bk = get_discrete_Ad_Bd(Ac=As, Bc=Bs, T=1 / self.freq)
+            return self.mat_engine.system_patch(Ak=Ak, Bk=Bk, chi=self.chi)
+
+        key = tuple(np.round(np.asarray(state)[2:4] / self._cache_resolution).astype(int))
+        if key in self._patch_cache:
+            self._patch_cache.move_to_end(key)
+            logger.debug(f"Patch cache hit at quantized (theta, theta_dot): {key}")
+            return self._patch_cache[key]
+
+        # Solve at the grid point so that the cached gain is the same for the whole cell
+        quantized_state = np.zeros(4)
+        quantized_state[2:4] = np.asarray(key) * self._cache_resolution
+        As, Bs = self.get_As_Bs_by_state(state=quantized_state)
+        Ak, Bk = get_discrete_Ad_Bd(Ac=As, Bc=Bs, T=1 / self.freq)
+        F_hat, t_min = self.mat_engine.system_patch(Ak=Ak, Bk=Bk, chi=self.chi)
+        F_hat = np.asarray(F_hat).reshape(1, 4)
+
+        self._patch_cache[key] = (F_hat, t_min)
+        if len(self._patch_cache) > self._cache_max_size:
+            self._patch_cache.popitem(last=False)
+
+        return F_hat, t_min
+
     def get_As_Bs_by_state(self, state: np.ndarray):
         """
         Update the physical knowledge matrices A(s) and B(s) in real-time based on the current state
@@ -142,10 +203,11 @@ class HATeacher:
         l = self.l
 
         term = 4 / 3 * (mc + mp) - mp * np.cos(theta) * np.cos(theta)
+        sinc_theta = np.sinc(theta / np.pi)  # sin(theta) / theta, well-defined at theta = 0
 
-        As[1][2] = -mp * g * np.sin(theta) * np.cos(theta) / (theta * term)
+        As[1][2] = -mp * g * sinc_theta * np.cos(theta) / term
         As[1][3] = 4 / 3 * mp * l * np.sin(theta) * theta_dot / term
-        As[3][2] = g * np.sin(theta) * (mc + mp) / (l * theta * term)
+        As[3][2] = g * sinc_theta * (mc + mp) / (l * term)
         As[3][3] = -mp * np.sin(theta) * np.cos(theta) * theta_dot / term
 
         Bs = np.zeros((4, 1))
@@ -0,0 +1,165 @@
+import os
+import hydra
+import numpy as np
+from tqdm import tqdm
+from omegaconf import DictConfig, OmegaConf
+
+from src.utils.utils import check_dir, get_discrete_Ad_Bd, logger
+
+
+class PatchTable:
+    """
+    Precomputed patch gains (F_hat) on a uniform (theta, theta_dot) grid, looked up with bilinear interpolation
+    """
+
+    def __init__(self, theta_grid, theta_dot_grid, gains, feasible, cell_valid=None, chi=None, freq=None):
+        self.theta_grid = np.asarray(theta_grid, dtype=np.float64)
+        self.theta_dot_grid = np.asarray(theta_dot_grid, dtype=np.float64)
+        self.gains = np.asarray(gains, dtype=np.float64)  # (n_theta, n_theta_dot, 4)
+        self.feasible = np.asarray(feasible, dtype=bool)  # (n_theta, n_theta_dot)
+        if cell_valid is None:
+            cell_valid = np.ones((len(self.theta_grid) - 1, len(self.theta_dot_grid) - 1), dtype=bool)
+        self.cell_valid = np.asarray(cell_valid, dtype=bool)  # (n_theta - 1, n_theta_dot - 1)
+        self.chi = chi
+        self.freq = freq
+
+        # Uniform grid parameters for O(1) cell indexing
+        self._th0, self._dth0 = self.theta_grid[0], self.theta_dot_grid[0]
+        self._th_step = self.theta_grid[1] - self.theta_grid[0]
+        self._dth_step = self.theta_dot_grid[1] - self.theta_dot_grid[0]
+        self._n_th, self._n_dth = len(self.theta_grid), len(self.theta_dot_grid)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(theta_grid=data['theta_grid'],
+                   theta_dot_grid=data['theta_dot_grid'],
+                   gains=data['gains'],
+                   feasible=data['feasible'],
+                   cell_valid=data['cell_valid'],
+                   chi=float(data['chi']),
+                   freq=float(data['freq']))
+
+    def save(self, path):
+        check_dir(os.path.dirname(path) or '.')
+        np.savez_compressed(path,
+                            theta_grid=self.theta_grid,
+                            theta_dot_grid=self.theta_dot_grid,
+                            gains=self.gains.astype(np.float32),
+                            feasible=self.feasible,
+                            cell_valid=self.cell_valid,
+                            chi=self.chi,
+                            freq=self.freq)
+
+    def _locate(self, theta, theta_dot):
+        """
+        Index of the lower-left grid point of the cell and the local coordinates within it (clamped to the grid)
+        """
+        u = min(max((theta - self._th0) / self._th_step, 0.), self._n_th - 1.)
+        v = min(max((theta_dot - self._dth0) / self._dth_step, 0.), self._n_dth - 1.)
+        i = min(int(u), self._n_th - 2)
+        j = min(int(v), self._n_dth - 2)
+        return i, j, u - i, v - j
+
+    def lookup(self, theta, theta_dot):
+        """
+        Interpolated patch gain at (theta, theta_dot), returned as (F_hat, t_min) like the patch engines
+        """
+        i, j, a, b = self._locate(float(theta), float(theta_dot))
+
+        if self.cell_valid[i, j]:
+            g = self.gains
+            F_hat = ((1 - a) * (1 - b) * g[i, j] + a * (1 - b) * g[i + 1, j]
+                     + (1 - a) * b * g[i, j + 1] + a * b * g[i + 1, j + 1])
+            return F_hat.reshape(1, 4), -1.
+
+        # Fall back to the nearest feasible corner of a cell that failed validation
+        corners = sorted([((a ** 2 + b ** 2), i, j), (((1 - a) ** 2 + b ** 2), i + 1, j),
+                          ((a ** 2 + (1 - b) ** 2), i, j + 1), (((1 - a) ** 2 + (1 - b) ** 2), i + 1, j + 1)])
+        for _, ci, cj in corners:
+            if self.feasible[ci, cj]:
+                return self.gains[ci, cj].reshape(1, 4), -1.
+
+        logger.debug(f"No feasible patch gain in table cell ({i}, {j})")
+        return np.zeros((1, 4)), 1.
+
+
+def build_patch_table(teacher, theta_range, theta_dot_range, theta_num, theta_dot_num):
+    """
+    Solve the patch LMIs with the teacher's patch engine on a uniform (theta, theta_dot) grid
+    """
+    theta_grid = np.linspace(theta_range[0], theta_range[1], theta_num)
+    theta_dot_grid = np.linspace(theta_dot_range[0], theta_dot_range[1], theta_dot_num)
+    gains = np.zeros((theta_num, theta_dot_num, 4))
+    feasible = np.zeros((theta_num, theta_dot_num), dtype=bool)
+
+    state = np.zeros(4)
+    with tqdm(total=theta_num * theta_dot_num, desc="Solving patch LMIs") as pbar:
+        for i, theta in enumerate(theta_grid):
+            for j, theta_dot in enumerate(theta_dot_grid):
+                state[2], state[3] = theta, theta_dot
+                As, Bs = teacher.get_As_Bs_by_state(state=state)
+                Ak, Bk = get_discrete_Ad_Bd(Ac=As, Bc=Bs, T=1 / teacher.freq)
+                F_hat, t_min = teacher.mat_engine.system_patch(Ak=Ak, Bk=Bk, chi=teacher.chi)
+                feasible[i, j] = t_min <= 0
+                if feasible[i, j]:
+                    gains[i, j] = np.asarray(F_hat).reshape(4)
+                pbar.update(1)
+
+    return PatchTable(theta_grid=theta_grid, theta_dot_grid=theta_dot_grid, gains=gains, feasible=feasible,
+                      chi=teacher.chi, freq=teacher.freq)
+
+
+def validate_patch_table(table: PatchTable, teacher):
+    """
+    Flag the grid cells whose interpolated gain at the cell center does not stabilize the closed loop Ak + Bk @ F_hat
+    """
+    n_th, n_dth = len(table.theta_grid), len(table.theta_dot_grid)
+    cell_valid = np.zeros((n_th - 1, n_dth - 1), dtype=bool)
+    table.cell_valid = np.ones_like(cell_valid)
+
+    state = np.zeros(4)
+    for i in range(n_th - 1):
+        for j in range(n_dth - 1):
+            if not table.feasible[i:i + 2, j:j + 2].all():
+                continue
+            state[2] = 0.5 * (table.theta_grid[i] + table.theta_grid[i + 1])
+            state[3] = 0.5 * (table.theta_dot_grid[j] + table.theta_dot_grid[j + 1])
+            F_hat, _ = table.lookup(state[2], state[3])
+            As, Bs = teacher.get_As_Bs_by_state(state=state)
+            Ak, Bk = get_discrete_Ad_Bd(Ac=As, Bc=Bs, T=1 / teacher.freq)
+            cell_valid[i, j] = np.all(np.abs(np.linalg.eigvals(Ak + Bk @ F_hat)) < 1)
+
+    table.cell_valid = cell_valid
+    invalid = np.argwhere(~cell_valid)
+    for i, j in invalid:
+        logger.warning(f"Patch table cell theta: [{table.theta_grid[i]:.4f}, {table.theta_grid[i + 1]:.4f}], "
+                       f"theta_dot: [{table.theta_dot_grid[j]:.4f}, {table.theta_dot_grid[j + 1]:.4f}] "
+                       f"fails the closed-loop stability check")
+    print(f"Patch table validation: {len(invalid)}/{cell_valid.size} cells flagged")
+    return cell_valid
+
+
+@hydra.main(version_base=None, config_path="../../config", config_name="base_config.yaml")
+def main(cfg: DictConfig):
+    from src.ha_teacher.ha_teacher import HATeacher
+
+    # Solve with the patch engine rather than an existing table
+    teacher_cfg = OmegaConf.merge(cfg.ha_teacher, {'patch_table': {'enable': False}, 'patch_cache': {'enable': False}})
+    teacher = HATeacher(teacher_cfg=teacher_cfg, cartpole_cfg=cfg.cartpole)
+
+    table_cfg = cfg.ha_teacher.patch_table
+    table = build_patch_table(teacher=teacher,
+                              theta_range=cfg.cartpole.safety_set.theta,
+                              theta_dot_range=cfg.cartpole.safety_set.theta_dot,
+                              theta_num=table_cfg.theta_num,
+                              theta_dot_num=table_cfg.theta_dot_num)
+    validate_patch_table(table=table, teacher=teacher)
+
+    path = hydra.utils.to_absolute_path(table_cfg.path)
+    table.save(path)
+    print(f"Patch table saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
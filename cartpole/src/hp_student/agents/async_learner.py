@@ -0,0 +1,123 @@
+import threading
+
+from src.utils.utils import logger
+
+
+class AsyncLearner:
+    """
+    Background learner which trains the DDPG agent from the replay memory on its own thread
+
+    The interaction loop only inserts transitions (`add`) and picks up the latest actor weights (`sync_actor`),
+    so its latency no longer depends on the minibatch size. The learner publishes actor weight snapshots into
+    a double buffer every `publish_period` updates and is throttled to `updates_per_step` updates per
+    environment step after the prefill.
+    """
+
+    def __init__(self, agent, replay_mem, batch_size, prefill_size, updates_per_step=1., publish_period=1,
+                 prioritized=False):
+        self.agent = agent
+        self.replay_mem = replay_mem
+        self.batch_size = int(batch_size)
+        self.prefill_size = int(prefill_size)
+        self.updates_per_step = float(updates_per_step)
+        self.publish_period = max(int(publish_period), 1)
+        self.prioritized = prioritized
+
+        # Replay memory is shared with the interaction loop
+        self._mem_lock = threading.Lock()
+        self._cond = threading.Condition(self._mem_lock)
+        self._env_steps = 0  # Environment steps after prefill
+        self._updates = 0
+        self._critic_loss = None
+
+        # Double-buffered actor snapshots, published lists are never mutated afterwards
+        self._snapshots = [self.agent.actor.get_weights(), None]
+        self._front = 0
+        self._version = 0
+        self._acting_version = 0
+        self.agent.create_acting_actor()
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="async-learner", daemon=True)
+        self._thread.start()
+        logger.debug("Async learner started")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+        self.publish()
+        self.sync_actor()
+        logger.debug(f"Async learner stopped after {self._updates} updates")
+
+    def add(self, experience, teacher=False):
+        with self._cond:
+            if self.prioritized:
+                self.replay_mem.add(experience, teacher=teacher)
+            else:
+                self.replay_mem.add(experience)
+            if self.replay_mem.size > self.prefill_size:
+                self._env_steps += 1
+                self._cond.notify()
+
+    def sync_actor(self):
+        """
+        Load the latest published actor weights into the acting actor (no-op if nothing new was published)
+        """
+        version = self._version
+        if version == self._acting_version:
+            return False
+        self.agent.acting_actor.set_weights(self._snapshots[self._front])
+        self._acting_version = version
+        return True
+
+    def publish(self):
+        back = 1 - self._front
+        self._snapshots[back] = self.agent.actor.get_weights()
+        self._front = back  # Swap after the snapshot is complete
+        self._version += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                # Throttle to the configured update-to-data ratio
+                while (not self._stop.is_set()
+                       and self._updates >= self._env_steps * self.updates_per_step):
+                    self._cond.wait(timeout=0.1)
+                if self._stop.is_set():
+                    break
+                sampled = self.replay_mem.sample(self.batch_size)
+
+            if self.prioritized:
+                minibatch, weights, indices = sampled
+                self._critic_loss = self.agent.optimize(minibatch, weights=weights)
+                with self._cond:
+                    self.replay_mem.update_priorities(indices, self.agent.td_error)
+            else:
+                self._critic_loss = self.agent.optimize(sampled)
+
+            self._updates += 1
+            if self._updates % self.publish_period == 0:
+                self.publish()
+
+    @property
+    def critic_loss(self):
+        return self._critic_loss
+
+    @property
+    def updates(self):
+        return self._updates
+
+    @property
+    def env_steps(self):
+        return self._env_steps
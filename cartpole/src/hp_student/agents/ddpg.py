@@ -5,7 +5,11 @@ import tensorflow as tf
 from omegaconf import DictConfig
 from src.hp_student.networks.mlp import MLPModel
 from src.hp_student.networks.taylor import TaylorModel
+from src.hp_student.networks.actor_runtime import make_actor_runtime
 from src.hp_student.utils.utils import OrnsteinUhlenbeckActionNoise
+from src.hp_student.agents.checkpoint_manager import resolve_checkpoint, load_snapshot
+
+MODEL_NAMES = ("actor", "actor_target", "critic", "critic_target")
 
 
 class DDPGAgent:
@@ -25,6 +29,11 @@ class DDPGAgent:
         self.optimizer_critic = None
         self.taylor_params = taylor_cfg
         self.exploration_steps = 0
+        self.acting_actor = None  # Separate actor used for interaction when trained asynchronously
+        self._shape_observations = shape_observations
+        self._shape_action = shape_action
+        self.td_error = None  # TD errors of the last critic update
+        self._uniform = None  # Cached uniform importance weights
 
         # Load pretrained weights or not
         if self.params.checkpoint is not None:
@@ -35,6 +44,15 @@ class DDPGAgent:
             self.create_model(shape_observations, shape_action)
             self.hard_update()
 
+        # Exploitation runtime for deployment, training keeps acting with the Keras actor
+        self.inference_actor = None
+        if mode != 'train' and self.params.inference.backend != 'keras':
+            self.actor(tf.zeros((1, shape_observations)))  # Build the weights before extracting them
+            self.inference_actor = make_actor_runtime(backend=self.params.inference.backend,
+                                                      actor=self.actor,
+                                                      path=self.params.inference.path,
+                                                      shape_observations=shape_observations)
+
         self.add_action_noise = True
         if self.params.action.add_noise is None:
             self.add_action_noise = False
@@ -45,6 +63,7 @@ class DDPGAgent:
 
         # Cached variables for fast indexing
         self._soft_alpha = self.params.soft_alpha
+        self._soft_alpha_tf = tf.constant(self._soft_alpha, dtype=tf.float32)
         self._gamma_discount = self.params.gamma_discount
         self._buffer_batch_size = self.params.replay_buffer.batch_size
         self._action_noise_factor = self.params.action.noise_factor
@@ -57,8 +76,34 @@ class DDPGAgent:
         self.critic.save_weights(os.path.join(model_save_path, "critic"))
         self.critic_target.save_weights(os.path.join(model_save_path, "critic_target"))
 
+    def get_weights_snapshot(self):
+        """
+        In-memory copy of all model weights {model name: [arrays]}
+        """
+        return {name: [np.array(w) for w in model.get_weights()]
+                for name, model in zip(MODEL_NAMES, self._models())}
+
+    def _models(self):
+        return self.actor, self.actor_target, self.critic, self.critic_target
+
     def load_weights(self, model_path, mode='train'):
 
+        # Checkpoints written by `CheckpointManager` (npz weights, latest checkpoint of a directory)
+        model_path = resolve_checkpoint(model_path)
+        names = MODEL_NAMES if mode == "train" else MODEL_NAMES[:1]
+        snapshot = load_snapshot(model_path, names)
+        if snapshot is not None:
+            observations = tf.zeros((1, self._shape_observations))
+            inputs = [observations, observations,
+                      tf.zeros((1, self._shape_observations + self._shape_action)),
+                      tf.zeros((1, self._shape_observations + self._shape_action))]
+            for name, model, x in zip(MODEL_NAMES, self._models(), inputs):
+                if name in snapshot:
+                    model(x)  # Build the weights before setting them
+                    model.set_weights(snapshot[name])
+            print(f"Pretrained weights are loaded from {model_path}")
+            return
+
         self.actor.load_weights(os.path.join(model_path, "actor"))
 
         if mode == "train":
@@ -87,13 +132,26 @@ class DDPGAgent:
             self.actor.summary()
             self.critic.summary()
 
+    def create_acting_actor(self):
+        """
+        Create a copy of the actor for interaction, so the actor itself can be trained on another thread
+        """
+        if self.params.use_taylor_nn:
+            self.acting_actor = TaylorModel(self.taylor_params, self._shape_observations, self._shape_action,
+                                            output_activation='tanh')
+        else:
+            self.acting_actor = MLPModel(self._shape_observations, self._shape_action, name="acting_actor",
+                                         output_activation='tanh').model
+        self.acting_actor(tf.zeros((1, self._shape_observations)))  # Build the weights before copying
+        self.acting_actor.set_weights(self.actor.get_weights())
+        return self.acting_actor
+
     def hard_update(self):
         self.actor_target.set_weights(self.actor.get_weights())
         self.critic_target.set_weights(self.critic.get_weights())
 
     def soft_update(self):
-        soft_alpha = tf.convert_to_tensor(self._soft_alpha, dtype=tf.float32)
-        self._soft_update(soft_alpha)
+        self._soft_update(self._soft_alpha_tf)
 
     @tf.function
     def _soft_update(self, soft_alpha):
@@ -123,8 +181,9 @@ class DDPGAgent:
             action_noise = self.action_noise.sample() * self._action_noise_factor
             action_noise = np.squeeze(action_noise)
 
+        actor = self.actor if self.acting_actor is None else self.acting_actor
         observations_tensor = tf.expand_dims(observations, 0)
-        action = tf.squeeze(self.actor(observations_tensor)).numpy()  # squeeze to kill batch_size
+        action = tf.squeeze(actor(observations_tensor)).numpy()  # squeeze to kill batch_size
 
         action_saturated = np.clip((action + action_noise), a_min=-1, a_max=1, dtype=float)
 
@@ -134,33 +193,97 @@ class DDPGAgent:
         return action_saturated
 
     def get_exploitation_action(self, observations):
+        if self.inference_actor is not None:
+            return self.inference_actor(observations)
+        actor = self.actor if self.acting_actor is None else self.acting_actor
         observations_tensor = tf.expand_dims(observations, 0)
-        action_exploitation = self.actor(observations_tensor)
+        action_exploitation = actor(observations_tensor)
         return tf.squeeze(action_exploitation).numpy()
 
     def noise_factor_decay(self):
         decay_rate = 0.693 / self._noise_half_decay_time
         self._action_noise_factor *= math.exp(-decay_rate * self.exploration_steps)
 
-    def optimize(self, mini_batch):
+    def optimize(self, mini_batch, weights=None):
+        """
+        One critic/actor/target update on the minibatch
+
+        weights: optional importance-sampling weights (batch_size, 1) from prioritized replay, uniform by default.
+        The per-sample TD errors of the update are kept in `self.td_error` for priority updates.
+        """
         if self.optimizer_critic is None:
             self.optimizer_critic = tf.keras.optimizers.Adam(learning_rate=self.params.learning_rate_critic)
         if self.optimizer_actor is None:
             self.optimizer_actor = tf.keras.optimizers.Adam(learning_rate=self.params.learning_rate_actor)
 
-        ob1_tf = tf.convert_to_tensor(mini_batch[0], dtype=tf.float32)
-        a1_tf = tf.convert_to_tensor(mini_batch[1], dtype=tf.float32)
-        r1_tf = tf.convert_to_tensor(mini_batch[2], dtype=tf.float32)
-        ob2_tf = tf.convert_to_tensor(mini_batch[3], dtype=tf.float32)
-        cra_tf = tf.convert_to_tensor(mini_batch[4], dtype=tf.float32)
+        # Optimizer slots must exist before the update step is traced
+        self.optimizer_critic.build(self.critic.trainable_variables)
+        self.optimizer_actor.build(self.actor.trainable_variables)
 
-        loss_critic = self._optimize_critic(ob1_tf, a1_tf, r1_tf, ob2_tf, cra_tf)
-        self._optimize_actor(ob1_tf)
-        self.soft_update()
+        # The float32 replay arrays go straight into the compiled step, no per-field conversion ops
+        if weights is None:
+            weights = self._uniform_weights((len(mini_batch[0]),))
+        loss_critic, td_error = self._optimize_step(*mini_batch[:5], weights)
+        self.td_error = td_error.numpy()
         return loss_critic.numpy().mean()
 
+    def _uniform_weights(self, batch_shape):
+        """
+        Cached importance weights of ones with shape (*batch_shape, 1)
+        """
+        shape = tuple(batch_shape) + (1,)
+        if self._uniform is None or self._uniform.shape != shape:
+            self._uniform = np.ones(shape, dtype=np.float32)
+        return self._uniform
+
+    @tf.function(input_signature=[tf.TensorSpec(shape=[None, None], dtype=tf.float32)] * 6)
+    def _optimize_step(self, ob1, a1, r1, ob2, cra, weights):
+        loss_critic, td_error = self._optimize_critic(ob1, a1, r1, ob2, cra, weights)
+        self._optimize_actor(ob1)
+        self._soft_update(self._soft_alpha_tf)
+        return loss_critic, td_error
+
+    def optimize_k(self, batches, k=None, weights=None):
+        """
+        k critic/actor/target updates inside one compiled graph
+
+        batches: minibatches stacked along a leading axis, i.e., (k, batch_size, ...) for each field
+        weights: optional importance-sampling weights (k, batch_size, 1), uniform by default.
+        The per-sample TD errors (k, batch_size, 1) are kept in `self.td_error`.
+        """
+        if self.optimizer_critic is None:
+            self.optimizer_critic = tf.keras.optimizers.Adam(learning_rate=self.params.learning_rate_critic)
+        if self.optimizer_actor is None:
+            self.optimizer_actor = tf.keras.optimizers.Adam(learning_rate=self.params.learning_rate_actor)
+
+        # Optimizer slots must exist before the update loop is traced
+        self.optimizer_critic.build(self.critic.trainable_variables)
+        self.optimizer_actor.build(self.actor.trainable_variables)
+
+        if k is None:
+            k = len(batches[0])
+        ob1, a1, r1, ob2, cra = [b[:k] for b in batches[:5]]
+        weights = self._uniform_weights(r1.shape[:-1]) if weights is None else weights[:k]
+
+        losses, td_error = self._optimize_k(ob1, a1, r1, ob2, cra, weights)
+        self.td_error = td_error.numpy()
+        return losses.numpy().mean()
+
+    @tf.function
+    def _optimize_k(self, ob1, a1, r1, ob2, cra, weights):
+        k = tf.shape(ob1)[0]
+        losses = tf.TensorArray(tf.float32, size=k)
+        td_errors = tf.TensorArray(tf.float32, size=k)
+        for i in tf.range(k):
+            loss_critic, td_error = self._optimize_critic(ob1[i], a1[i], r1[i], ob2[i], cra[i], weights[i])
+            self._optimize_actor(ob1[i])
+            self._soft_update(self._soft_alpha_tf)
+            losses = losses.write(i, tf.reduce_mean(loss_critic))
+            td_errors = td_errors.write(i, td_error)
+        return losses.stack(), td_errors.stack()
+
     @tf.function
-    def _optimize_critic(self, ob1, a1, r1, ob2, cra):
+    def _optimize_critic(self, ob1, a1, r1, ob2, cra, weights):
 
         # ---------------------- optimize critic ----------------------
         with tf.GradientTape() as tape:
@@ -179,11 +302,13 @@ class DDPGAgent:
             critic_input = tf.concat([ob1, a1], axis=-1)
             y_pre = self.critic(critic_input)
 
-            loss_critic = tf.keras.losses.mean_squared_error(y_exp, y_pre)
+            # Importance-weighted squared TD error (weights are ones for uniform replay)
+            td_error = y_exp - y_pre
+            loss_critic = tf.squeeze(weights, axis=-1) * tf.keras.losses.mean_squared_error(y_exp, y_pre)
 
         q_grads = tape.gradient(loss_critic, self.critic.trainable_variables)
         self.optimizer_critic.apply_gradients(zip(q_grads, self.critic.trainable_variables))
-        return loss_critic
+        return loss_critic, td_error
 
     @tf.function
     def _optimize_actor(self, ob1):
@@ -8,28 +8,16 @@ def clip_or_wrap_func(a, a_min, a_max, clip_or_wrap):
     return (a - a_min) % (a_max - a_min) + a_min
 
 
-def type_of(exp):
-    if type(exp) is bool:
-        return bool
-    else:
-        return float
-
-
-def shape(exp):
-    if type(exp) is list:
-        return len(exp)
-    if type(exp) is np.ndarray:
-        return len(exp)
-    else:
-        return 1
-
-
 class ReplayMemory(object):
     """
     Replay memory class to store trajectories
+
+    Transitions (observations, action, reward, observations_next, failed) are kept in preallocated, contiguous
+    float32 arrays (one per field), so that sampled minibatches can be fed to `DDPGAgent.optimize` directly.
     """
 
-    def __init__(self, buffer_size, combined_experience_replay=False):
+    def __init__(self, buffer_size, combined_experience_replay=False, shape_observations=None, shape_action=None,
+                 seed=None):
         """
         initializing the replay memory
         """
@@ -40,22 +28,36 @@ class ReplayMemory(object):
         self.full = False
         self.buffer_size = int(buffer_size)
         self.memory = None
+        # Without a seed, drawn from the global NumPy state so that `np.random.seed` still makes runs reproducible
+        self._rng = np.random.default_rng(seed if seed is not None else np.random.randint(2 ** 31 - 1))
+        self._batch = None  # Preallocated minibatch arrays
 
-    def initialize(self, experience):
+        # Allocate upfront when the shapes are known, otherwise on the first insertion
+        if shape_observations is not None and shape_action is not None:
+            self.allocate(shape_observations, shape_action)
 
-        self.memory = [np.zeros(shape=(self.buffer_size, shape(exp)), dtype=type_of(exp)) for exp in experience]
-        self.memory.append(np.zeros(shape=self.buffer_size, dtype=float))
+    def allocate(self, shape_observations, shape_action):
+        n = self.buffer_size
+        self.memory = [np.zeros(shape=(n, shape_observations), dtype=np.float32),  # observations
+                       np.zeros(shape=(n, shape_action), dtype=np.float32),  # action
+                       np.zeros(shape=(n, 1), dtype=np.float32),  # reward
+                       np.zeros(shape=(n, shape_observations), dtype=np.float32),  # observations_next
+                       np.zeros(shape=(n, 1), dtype=np.float32)]  # failed (as float for (1 - failed))
+        self._batch = None
+
+    def initialize(self, experience):
+        self.allocate(shape_observations=np.size(experience[0]), shape_action=np.size(experience[1]))
 
     def add(self, experience):
         if self.memory is None:
             self.initialize(experience)
             print("initialized done")
 
-        if len(experience) + 1 != len(self.memory):
+        if len(experience) != len(self.memory):
             raise Exception('Experiment not the same size as memory', len(experience), '!=', len(self.memory))
 
         for e, mem in zip(experience, self.memory):
-            mem[self.k] = e
+            mem[self.k] = np.reshape(e, mem.shape[1:])
 
         self.head = self.k
         self.new_head = True
@@ -64,17 +66,72 @@ class ReplayMemory(object):
             self.k = 0  # replace the oldest one with the latest one
             self.full = True
 
+    def add_many(self, experiences):
+        """
+        Insert a batch of transitions at once, e.g., a whole episode
+
+        experiences: (observations, action, reward, observations_next, failed) with a leading batch dimension each
+        """
+        fields = [np.asarray(e, dtype=np.float32) for e in experiences]
+        n = len(fields[0])
+        if n == 0:
+            return
+        if self.memory is None:
+            self.allocate(shape_observations=fields[0].reshape(n, -1).shape[1],
+                          shape_action=fields[1].reshape(n, -1).shape[1])
+
+        if len(fields) != len(self.memory):
+            raise Exception('Experiment not the same size as memory', len(fields), '!=', len(self.memory))
+
+        # Only the latest transitions that fit in the memory survive
+        if n > self.buffer_size:
+            fields = [f[-self.buffer_size:] for f in fields]
+            self.k = (self.k + n - self.buffer_size) % self.buffer_size
+            n = self.buffer_size
+
+        idx = (self.k + np.arange(n)) % self.buffer_size
+        for f, mem in zip(fields, self.memory):
+            mem[idx] = f.reshape((n,) + mem.shape[1:])
+
+        self.head = int(idx[-1])
+        self.new_head = True
+        if self.k + n >= self.buffer_size:
+            self.full = True
+        self.k = (self.k + n) % self.buffer_size
+
     def sample(self, batch_size):
+        """
+        Sample a minibatch without replacement in O(batch_size)
+
+        The returned float32 arrays are reused by the next call to `sample`
+        """
         r = self.buffer_size
         if not self.full:
             r = self.k
-        random_idx = np.random.choice(r, size=batch_size, replace=False)
+        random_idx = self._rng.choice(r, size=batch_size, replace=False, shuffle=False)
 
         if self.combined_experience_replay:
             if self.new_head:
                 random_idx[0] = self.head  # always add the latest one
                 self.new_head = False
 
+        if self._batch is None or len(self._batch[0]) != batch_size:
+            self._batch = [np.empty((batch_size,) + mem.shape[1:], dtype=mem.dtype) for mem in self.memory]
+
+        for mem, out in zip(self.memory, self._batch):
+            np.take(mem, random_idx, axis=0, out=out)
+        return self._batch
+
+    def sample_stacked(self, batch_size, k):
+        """
+        Sample k minibatches at once, stacked as (k, batch_size, ...) for `DDPGAgent.optimize_k`
+
+        Indices are drawn with replacement, which is negligible once the memory is much larger than the batch
+        """
+        r = self.buffer_size
+        if not self.full:
+            r = self.k
+        random_idx = self._rng.integers(0, r, size=(k, batch_size))
         return [mem[random_idx] for mem in self.memory]
 
     def get(self, start, length):
@@ -93,26 +150,146 @@ class ReplayMemory(object):
         self.k = 0
         self.head = -1
         self.full = False
-        self.memory = None
         self.new_head = False
 
     def shuffle(self):
         """
         to shuffle the whole memory
         """
-        self.memory = self.sample(self.buffer_size)
+        perm = self._rng.permutation(self.size)
+        for mem in self.memory:
+            mem[:self.size] = mem[perm]
 
     def save2file(self, file_path):
         with open(file_path, 'wb') as fp:
-            pickle.dump(self.memory, fp)
+            pickle.dump([mem[:self.size] for mem in self.memory], fp)
 
     def load_memory_caches(self, path):
 
         with open(path, 'rb') as fp:
             memory = pickle.load(fp)
-            if self.memory is None:
-                self.memory = memory
-            else:
-                self.memory = np.hstack((self.memory, memory))
+            # Caches saved by the former list-of-arrays memory may carry an extra trailing field
+            self.add_many([np.asarray(m) for m in memory[:5]])
 
         print("Load memory caches, pre-filled replay memory!")
+
+
+class SumTree(object):
+    """
+    Array-based binary sum tree over `capacity` leaf priorities
+
+    Node i has children 2i and 2i + 1, the root is node 1 and the leaves start at `self.offset`. Updates and
+    prefix-sum searches are vectorized over a batch of indices and cost O(log capacity) each.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.offset = 1 << max(int(self.capacity - 1).bit_length(), 0)
+        self.depth = self.offset.bit_length() - 1
+        self.tree = np.zeros(2 * self.offset, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices, dtype=np.int64) + self.offset
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes >> 1)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        Leaf indices whose prefix-sum interval contains each of the values
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values >= left_sum
+            values -= left_sum * go_right
+            nodes = left + go_right
+        return nodes - self.offset
+
+    def get(self, indices):
+        return self.tree[np.asarray(indices, dtype=np.int64) + self.offset]
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    """
+    Prioritized experience replay (proportional variant) backed by a sum tree
+
+    Priorities come from the critic's TD errors, transitions labeled by the HA-Teacher get their priority boosted
+    by `teacher_boost`, and `sample` returns the importance-sampling weights consumed by the critic loss.
+    """
+
+    def __init__(self, buffer_size, alpha=0.6, beta=0.4, beta_annealing_steps=1e5, eps=1e-6, teacher_boost=1.,
+                 shape_observations=None, shape_action=None, seed=None):
+        super().__init__(buffer_size, shape_observations=shape_observations, shape_action=shape_action, seed=seed)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = (1. - beta) / max(float(beta_annealing_steps), 1.)
+        self.eps = eps
+        self.teacher_boost = teacher_boost
+        self.sum_tree = SumTree(self.buffer_size)
+        self.teacher_flags = np.zeros(self.buffer_size, dtype=bool)
+        self.max_priority = 1.
+
+    def _new_priorities(self, teacher):
+        return self.max_priority * np.where(teacher, self.teacher_boost ** self.alpha, 1.)
+
+    def add(self, experience, teacher=False):
+        k = self.k
+        super().add(experience)
+        self.teacher_flags[k] = teacher
+        self.sum_tree.update([k], self._new_priorities(np.asarray([teacher])))
+
+    def add_many(self, experiences, teacher=None):
+        n = len(experiences[0])
+        if n == 0:
+            return
+        teacher = np.zeros(n, dtype=bool) if teacher is None else np.asarray(teacher, dtype=bool)
+        n_kept = min(n, self.buffer_size)
+        start = (self.k + n - n_kept) % self.buffer_size
+        super().add_many(experiences)
+        idx = (start + np.arange(n_kept)) % self.buffer_size
+        self.teacher_flags[idx] = teacher[-n_kept:]
+        self.sum_tree.update(idx, self._new_priorities(teacher[-n_kept:]))
+
+    def sample(self, batch_size):
+        """
+        Stratified proportional sampling
+
+        return: (minibatch, importance weights with shape (batch_size, 1), sampled indices)
+        """
+        total = self.sum_tree.total
+        segment = total / batch_size
+        values = (np.arange(batch_size) + self._rng.random(batch_size)) * segment
+        indices = np.minimum(self.sum_tree.find(np.minimum(values, total * (1 - 1e-12))), self.size - 1)
+
+        # Importance-sampling weights, normalized by the largest one in the batch
+        probs = self.sum_tree.get(indices) / total
+        weights = (self.size * np.maximum(probs, 1e-12)) ** -self.beta
+        weights = (weights / weights.max()).astype(np.float32).reshape(-1, 1)
+        self.beta = min(1., self.beta + self.beta_increment)
+
+        if self._batch is None or len(self._batch[0]) != batch_size:
+            self._batch = [np.empty((batch_size,) + mem.shape[1:], dtype=mem.dtype) for mem in self.memory]
+        for mem, out in zip(self.memory, self._batch):
+            np.take(mem, indices, axis=0, out=out)
+
+        return self._batch, weights, indices
+
+    def update_priorities(self, indices, td_errors):
+        priorities = (np.abs(np.asarray(td_errors, dtype=np.float64).reshape(-1)) + self.eps) ** self.alpha
+        priorities *= np.where(self.teacher_flags[indices], self.teacher_boost ** self.alpha, 1.)
+        self.sum_tree.update(indices, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+    def reset(self):
+        super().reset()
+        self.sum_tree.tree.fill(0)
+        self.teacher_flags.fill(False)
+        self.max_priority = 1.
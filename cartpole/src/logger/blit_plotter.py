@@ -0,0 +1,179 @@
+import threading
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from src.utils.utils import ActionMode
+from src.logger.fig_plotter import FigPlotter, STUDENT_COLOR, TEACHER_COLOR
+
+
+class StepRingBuffer:
+    """
+    Single-producer/single-consumer ring buffer of step records without locks
+
+    The producer writes a row and only then advances the head, so the consumer never reads an unfinished row. A read
+    is retried if the producer lapped the copied rows in the meantime.
+    """
+
+    def __init__(self, capacity, width):
+        self.capacity = int(capacity)
+        self._data = np.zeros((self.capacity, width), dtype=np.float64)
+        self._head = 0  # Number of rows pushed so far
+
+    @property
+    def head(self):
+        return self._head
+
+    def push(self, row):
+        self._data[self._head % self.capacity] = row
+        self._head += 1  # Publish the row
+
+    def latest(self, n):
+        """
+        Copy of the latest (at most n) rows and the head they end at
+        """
+        while True:
+            head = self._head
+            k = min(n, head, self.capacity)
+            window = self._data[np.arange(head - k, head) % self.capacity]
+            if self._head - head <= self.capacity - k:
+                return window, head
+
+
+class BlitLivePlotter:
+    """
+    Live trajectory plot rendered with Agg blitting on its own thread
+
+    The control loop only pushes step records into a ring buffer. The plotter thread keeps the static parts of the
+    figure (axes, ticks, legends) as a cached background and only redraws the six persistent line collections onto it.
+    The x-axis shows the steps relative to the latest one, so the background only has to be redrawn when an
+    autoscaled y-axis grows. Rendered frames are kept for GIF export, and no GUI backend is needed for that.
+    """
+
+    def __init__(self, window_size, x_set, theta_set, action_set, fps=10, record_frames=True):
+        self.window_size = int(window_size)
+        self.period = 1. / fps
+        self.record_frames = record_frames
+        self.frames = []
+
+        # Record: x, x_dot, theta, theta_dot, action, energy, action mode
+        self.ring = StepRingBuffer(capacity=4 * self.window_size, width=7)
+
+        self._setup_figure(x_set, theta_set, action_set)
+        self._latest_frame = None
+        self._shown_frame = None
+        self._image = None
+        self._rendered_head = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _setup_figure(self, x_set, theta_set, action_set):
+        x_ticks = np.linspace(x_set[0], x_set[1], 5)
+        th_ticks = np.linspace(theta_set[0], theta_set[1], 5)
+        f_ticks = np.linspace(action_set[0], action_set[1], 5)
+
+        self.fig = Figure(figsize=(10, 6))
+        self.canvas = FigureCanvasAgg(self.fig)
+        axes = self.fig.subplots(3, 2)
+        FigPlotter.legend_and_label(axes, x_ticks, th_ticks, f_ticks)
+
+        self.axes = axes.flatten()
+        self.line_collections = []
+        for ax in self.axes:
+            ax.set_xlim(-(self.window_size - 1), 0)
+            line_collection = LineCollection([], animated=True)
+            ax.add_collection(line_collection)
+            self.line_collections.append(line_collection)
+
+        # Autoscaled axes (x_dot, theta_dot, energy) only grow, the others keep their ticks
+        self._autoscaled = (1, 3, 5)
+        for i in self._autoscaled:
+            self.axes[i].set_ylim(-1, 1)
+        self.fig.tight_layout()
+        self._draw_background()
+
+    def _draw_background(self):
+        self.canvas.draw()
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+    def push(self, state, action, action_mode, energy):
+        self.ring.push((state[0], state[1], state[2], state[3], np.squeeze(action), energy, action_mode.value))
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="live-plotter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.render()  # Catch up with the latest steps
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            self.render()
+
+    def render(self):
+        window, head = self.ring.latest(self.window_size)
+        if head == self._rendered_head or len(window) < 2:
+            return
+        self._rendered_head = head
+
+        n = len(window)
+        steps = np.arange(-(n - 1), 1, dtype=np.float64)
+        teacher = window[:-1, 6] == ActionMode.TEACHER.value
+        colors = np.where(teacher[:, None], TEACHER_COLOR, STUDENT_COLOR)
+
+        redraw = False
+        for i, (ax, line_collection) in enumerate(zip(self.axes, self.line_collections)):
+            values = window[:, i]
+            points = np.stack([steps, values], axis=1)
+            line_collection.set_segments(np.stack([points[:-1], points[1:]], axis=1))
+            line_collection.set_color(colors)
+
+            if i in self._autoscaled:
+                lo, hi = ax.get_ylim()
+                v_min, v_max = values.min() - 1, values.max() + 1
+                if v_min < lo or v_max > hi:
+                    ax.set_ylim(min(lo, v_min), max(hi, v_max))
+                    redraw = True
+
+        if redraw:
+            self._draw_background()
+
+        self.canvas.restore_region(self._background)
+        for ax, line_collection in zip(self.axes, self.line_collections):
+            ax.draw_artist(line_collection)
+
+        frame = np.asarray(self.canvas.buffer_rgba())[..., :3].copy()
+        self._latest_frame = frame
+        if self.record_frames:
+            self.frames.append(frame)
+
+    def poll(self):
+        """
+        Show the latest rendered frame on screen, must be called from the GUI (main) thread
+        """
+        frame = self._latest_frame
+        if frame is None or frame is self._shown_frame:
+            return
+        import matplotlib.pyplot as plt
+
+        if self._image is None:
+            fig = plt.figure(num='Live Trajectory', figsize=(10, 6))
+            ax = fig.add_axes([0, 0, 1, 1])
+            ax.axis('off')
+            self._image = ax.imshow(frame)
+            plt.show(block=False)
+        else:
+            self._image.set_data(frame)
+        self._image.figure.canvas.draw_idle()
+        self._image.figure.canvas.flush_events()
+        self._shown_frame = frame
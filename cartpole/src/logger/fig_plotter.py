@@ -2,10 +2,15 @@ import os
 import re
 import sys
 import copy
+import multiprocessing
 import numpy as np
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 import matplotlib.lines as mlines
+from matplotlib.figure import Figure
+from matplotlib.colors import to_rgba
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from concurrent.futures import ProcessPoolExecutor
 from numpy.linalg import inv
 from numpy import linalg as LA
 from src.utils.utils import check_dir, ActionMode, PlotMode
@@ -37,6 +42,13 @@ class FigPlotter:
 
         self.line_collections = []
 
+        # Trajectory figures are rendered in background processes if workers are given
+        self._pool = None
+        self._futures = []
+        workers = plotter_cfg.trajectory.get('workers', 0)
+        if workers > 0:
+            self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
     def reset_live_variables(self):
         self.last_live_state = []
         self.last_live_action = 0
@@ -133,6 +145,70 @@ class FigPlotter:
 
     def plot_trajectory(self, state_list, action_list, action_mode_list, energy_list, x_set, theta_set, action_set,
                         freq, fig_idx):
+        if self.params.trajectory.get('renderer', 'collection') == 'segments':
+            self.plot_trajectory_segments(state_list=state_list,
+                                          action_list=action_list,
+                                          action_mode_list=action_mode_list,
+                                          energy_list=energy_list,
+                                          x_set=x_set,
+                                          theta_set=theta_set,
+                                          action_set=action_set,
+                                          freq=freq,
+                                          fig_idx=fig_idx)
+            return
+
+        # Figure name
+        fig_name = f'{self.trajectory_dir}/trajectory{fig_idx}.png'
+        print(f"Plotting Trajectory to: {fig_name}...")
+
+        n = len(state_list)
+        assert n == len(action_list) == len(action_mode_list) == len(energy_list)
+
+        # Copied into arrays, so the logs can be cleared while the figure renders in the background
+        trajectory = dict(fig_name=fig_name,
+                          states=np.asarray(state_list, dtype=np.float64)[:, :4],
+                          actions=np.asarray(action_list, dtype=np.float64).reshape(n),
+                          action_modes=np.array([mode.value for mode in action_mode_list], dtype=np.int8),
+                          energies=np.asarray(energy_list, dtype=np.float64).reshape(n),
+                          x_set=list(x_set),
+                          theta_set=list(theta_set),
+                          action_set=list(action_set),
+                          freq=freq,
+                          max_points=self.params.trajectory.get('max_points', None))
+
+        if self._pool is None:
+            render_trajectory(**trajectory)
+        else:
+            self._futures = [f for f in self._futures if not self._finished(f)]
+            self._futures.append(self._pool.submit(render_trajectory, **trajectory))
+
+    @staticmethod
+    def _finished(future):
+        if not future.done():
+            return False
+        if future.exception() is not None:
+            print(f"Failed to plot trajectory: {future.exception()}")
+        return True
+
+    def wait(self):
+        """
+        Block until all trajectory figures in the background are saved
+        """
+        for future in self._futures:
+            future.result()
+        self._futures.clear()
+
+    def close(self):
+        if self._pool is not None:
+            self.wait()
+            self._pool.shutdown()
+            self._pool = None
+
+    def plot_trajectory_segments(self, state_list, action_list, action_mode_list, energy_list, x_set, theta_set,
+                                 action_set, freq, fig_idx):
+        """
+        Former renderer drawing six line artists per step
+        """
         # Figure name
         fig_name = f'{self.trajectory_dir}/trajectory{fig_idx}.png'
         print(f"Plotting Trajectory to: {fig_name}...")
@@ -334,5 +410,72 @@ class FigPlotter:
         # plt.plot(tx_hpc1, tx_hpc2, 'b--', linewidth=0.8, label=r"$\partial\Omega_{HPC}$")
 
 
+STUDENT_COLOR = to_rgba([0, 0.4470, 0.7410])
+TEACHER_COLOR = to_rgba('red')
+
+
+def minmax_decimate(values, max_points=None):
+    """
+    Indices which keep the min and max of every bucket (and both ends), so spikes survive the decimation
+    """
+    n = len(values)
+    if max_points is None or n <= max_points:
+        return np.arange(n)
+
+    n_buckets = max(int(max_points) // 2, 1)
+    size = int(np.ceil(n / n_buckets))
+    padded = np.concatenate([values, np.full(size * n_buckets - n, values[-1])]).reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    indices = np.concatenate([offsets + padded.argmin(axis=1), offsets + padded.argmax(axis=1), [0, n - 1]])
+    return np.unique(np.minimum(indices, n - 1))
+
+
+def mode_line_collection(values, action_modes, max_points=None):
+    """
+    One LineCollection of the step-wise trajectory, each segment coloured by the action mode at its start
+    """
+    indices = minmax_decimate(values, max_points)
+    points = np.stack([indices, values[indices]], axis=1)
+    segments = np.stack([points[:-1], points[1:]], axis=1)
+    teacher = action_modes[indices[:-1]] == ActionMode.TEACHER.value
+    colors = np.where(teacher[:, None], TEACHER_COLOR, STUDENT_COLOR)
+    return LineCollection(segments, colors=colors)
+
+
+def render_trajectory(fig_name, states, actions, action_modes, energies, x_set, theta_set, action_set, freq,
+                      max_points=None):
+    """
+    Render the trajectory figure with one LineCollection per subplot
+
+    Uses the Agg canvas directly rather than pyplot, so it can run in a worker process
+    """
+    unknown = ~np.isin(action_modes, [ActionMode.STUDENT.value, ActionMode.TEACHER.value])
+    if unknown.any():
+        raise RuntimeError(f"Unrecognized action mode: {action_modes[unknown][0]}")
+
+    x_ticks = np.linspace(x_set[0], x_set[1], 5)
+    th_ticks = np.linspace(theta_set[0], theta_set[1], 5)
+    f_ticks = np.linspace(action_set[0], action_set[1], 5)
+
+    fig = Figure(figsize=(12, 6))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(3, 2)
+    fig.suptitle(f'Inverted Pendulum Trajectories ($f = {freq} Hz$)', fontsize=11, ha='center', y=0.97)
+
+    # x, x_dot, theta, theta_dot, force/action and system energy
+    series = [states[:, 0], states[:, 1], states[:, 2], states[:, 3], actions, energies]
+    for ax, values in zip(axes.flat, series):
+        ax.add_collection(mode_line_collection(values, action_modes, max_points=max_points))
+        ax.autoscale_view()
+
+    # Add legend and label
+    FigPlotter.legend_and_label(axes, x_ticks, th_ticks, f_ticks)
+
+    fig.tight_layout()  # Adjust spacing between subplots
+    fig.savefig(fig_name, dpi=150)
+    print(f"Successfully plot trajectory: {fig_name}")
+    return fig_name
+
+
 if __name__ == '__main__':
     pass
@@ -1,3 +1,5 @@
+import os
+import sys
 import time
 import numpy as np
 from PIL import Image
@@ -8,15 +10,25 @@ import matplotlib.animation as animation
 from matplotlib.collections import LineCollection
 
 from src.logger.fig_plotter import FigPlotter
+from src.logger.blit_plotter import BlitLivePlotter
 from src.utils.utils import ActionMode
 
-matplotlib.use('TkAgg')  # Use TkAgg as the matplotlib backend
+# Use TkAgg as the matplotlib backend, headless servers keep the default (Agg) one
+if sys.platform in ('win32', 'darwin') or os.environ.get('DISPLAY'):
+    matplotlib.use('TkAgg')
 
 
 class LivePlotter:
     def __init__(self, live_cfg):
         self.params = live_cfg
         self.window_size = live_cfg.live_trajectory.window_size
+        self.mode = live_cfg.live_trajectory.get('mode', 'animation')
+        self.display = live_cfg.live_trajectory.get('display', True)
+        if self.mode not in ('animation', 'blit'):
+            raise RuntimeError(f"Unknown live trajectory mode: {self.mode}, choose from ('animation', 'blit')")
+
+        # For live plot (blit mode)
+        self.blit_plotter = None
 
         # For live plot
         self.animation = None
@@ -35,6 +47,8 @@ class LivePlotter:
         self.energies = deque(maxlen=self.window_size)
 
     def reset(self):
+        self.stop()
+        self.blit_plotter = None
         self.animation = None
         self.live_plot_flag = False
         self.live_plot_counter = 0
@@ -141,6 +155,21 @@ class LivePlotter:
         return self.line_collections[:]
 
     def animation_run(self, x_set, theta_set, action_set, state, action, action_mode, energy):
+        if self.mode == 'blit':
+            if self.blit_plotter is None:
+                print(f"Setting up blitting live plot")
+                self.blit_plotter = BlitLivePlotter(window_size=self.window_size,
+                                                    x_set=x_set,
+                                                    theta_set=theta_set,
+                                                    action_set=action_set,
+                                                    fps=self.params.live_trajectory.fps,
+                                                    record_frames=self.params.live_trajectory.save_to_gif)
+                self.frames = self.blit_plotter.frames
+                self.blit_plotter.start()
+            self.blit_plotter.push(state=state, action=action, action_mode=action_mode, energy=energy)
+            self.live_plot_counter += 1
+            return
+
         if self.live_plot_flag is False:
             self.live_plot_flag = True
             plt.clf()
@@ -181,6 +210,23 @@ class LivePlotter:
 
         self.update(state=state, action=action, action_mode=action_mode, energy=energy)
 
+    def poll(self):
+        """
+        Refresh the live plot from the main loop
+        """
+        if self.mode == 'blit':
+            if self.display and self.blit_plotter is not None:
+                self.blit_plotter.poll()
+        else:
+            plt.pause(0.01)
+
+    def stop(self):
+        """
+        Stop the plotting thread (blit mode), its frames stay in `self.frames`
+        """
+        if self.blit_plotter is not None:
+            self.blit_plotter.stop()
+
     @staticmethod
     def line_segment(axes, action_mode, i):
         y1 = np.random.rand()
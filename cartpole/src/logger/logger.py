@@ -7,9 +7,9 @@ from collections import deque
 from omegaconf import DictConfig
 
 from src.physical_design import MATRIX_P
-from src.logger.fig_plotter import FigPlotter
-from src.logger.live_plotter import LivePlotter
+from src.logger.trajectory_recorder import TrajectoryRecorder
 from src.utils.utils import check_dir, is_dir_empty, ActionMode
+from src.utils.profiler import profiler
 
 class Logger:
     def __init__(self, logger_cfg: DictConfig):
@@ -24,15 +24,24 @@ class Logger:
         self.training_log_writer = tf.summary.create_file_writer(self.log_dir + '/training')
         self.evaluation_log_writer = tf.summary.create_file_writer(self.log_dir + '/eval')
 
-        # Figure plotter
-        self.fig_plotter = FigPlotter(
-            plotter_cfg=logger_cfg.fig_plotter
-        )
-
-        # Live plotter
-        self.live_plotter = LivePlotter(
-            live_cfg=logger_cfg.live_plotter
-        )
+        # Figure plotter (matplotlib is only imported when some figure is plotted)
+        self.fig_plotter = None
+        if logger_cfg.fig_plotter.phase.plot or logger_cfg.fig_plotter.trajectory.plot:
+            from src.logger.fig_plotter import FigPlotter
+            self.fig_plotter = FigPlotter(
+                plotter_cfg=logger_cfg.fig_plotter
+            )
+
+        # Live plotter (live trajectory only, the animation is rendered by the cartpole)
+        self.live_plotter = None
+        if logger_cfg.live_plotter.live_trajectory.show or logger_cfg.live_plotter.live_trajectory.save_to_gif:
+            from src.logger.live_plotter import LivePlotter
+            self.live_plotter = LivePlotter(
+                live_cfg=logger_cfg.live_plotter
+            )
+
+        # Hot path profiler (see src/utils/profiler.py)
+        profiler.enabled = self.params.profiler.apply
 
         # Status record
         self.state_list = []
@@ -40,6 +49,20 @@ class Logger:
         self.action_mode_list = []
         self.energy_list = []
 
+        # Trajectory recorder (all episodes streamed to disk, the lists above only hold the current one)
+        self.episode = 0
+        self.recorder = None
+        if self.params.recorder.apply:
+            self.recorder = TrajectoryRecorder(
+                path=self.params.recorder.save_dir,
+                schema={'episode': ((), np.int32),
+                        'state': ((4,), np.float32),
+                        'action': ((), np.float32),
+                        'action_mode': ((), np.int8),
+                        'energy': ((), np.float32)},
+                chunk_size=self.params.recorder.chunk_size
+            )
+
     def create_thread(self):
         self.p = threading.Thread(target=self.animation_run)
         self.p.setDaemon(True)
@@ -73,6 +96,7 @@ class Logger:
         self.action_list.clear()
         self.action_mode_list.clear()
         self.energy_list.clear()
+        self.episode += 1
 
     def update_logs(self, state, action, action_mode, energy):
         self.state_list.append(state)
@@ -80,6 +104,19 @@ class Logger:
         self.action_mode_list.append(action_mode)
         self.energy_list.append(energy)
 
+        if self.recorder is not None:
+            self.recorder.record({'episode': self.episode,
+                                  'state': state[:4],
+                                  'action': action,
+                                  'action_mode': action_mode,
+                                  'energy': energy})
+
+    def close(self):
+        if self.fig_plotter is not None:
+            self.fig_plotter.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
     def check_dir(self):
         print(f"checking logger directories...")
         check_dir(self.log_dir)
@@ -93,6 +130,18 @@ class Logger:
             tf.summary.scalar('train_eval/distance_score_and_survived', average_distance_score * (1 - failed),
                               global_steps)
 
+    def log_profile(self, global_steps):
+        if not profiler.enabled:
+            return
+        with self.training_log_writer.as_default():
+            profiler.write_scalars(tf.summary.scalar, global_steps)
+
+    def save_profile(self):
+        if not profiler.enabled:
+            return
+        print(f"Hot path profile:\n{profiler}")
+        profiler.save_json(self.params.profiler.report_path)
+
     def log_evaluation_data(self, average_reward, average_distance_score, failed, global_steps):
         with self.evaluation_log_writer.as_default():
             tf.summary.scalar('train_eval/Average_Reward', average_reward, global_steps)
@@ -116,7 +165,8 @@ class Logger:
 
     def change_mode(self, mode):
         current_mode = self.mode
-        self.fig_plotter.change_dir(old_dir=str(current_mode), new_dir=str(mode))
+        if self.fig_plotter is not None:
+            self.fig_plotter.change_dir(old_dir=str(current_mode), new_dir=str(mode))
         self.mode = mode
 
 
@@ -133,6 +183,7 @@ def plot_trajectory(trajectory_tensor, reference_trajectory_tensor=None):
 
     y_label_list = ["safety", "x", "x_dot", "theta", "theta_dot"]
 
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(9, 6))
 
     for i in range(c):
@@ -0,0 +1,228 @@
+import json
+import math
+import time
+import numpy as np
+import tensorflow as tf
+
+from src.physical_design import MATRIX_P, F, F_Simplex
+from src.envs.batch_cart_pole import BatchCartpole, batch_state2observations
+from src.utils.utils import logger
+
+
+def _beta_cf(a, b, x, max_iter=300, eps=1e-14):
+    """
+    Continued fraction of the regularized incomplete beta function (modified Lentz)
+    """
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1., a - 1.
+    c, d = 1., 1. - qab * x / qap
+    d = 1. / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, max_iter + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1. + aa * d
+        d = 1. / (d if abs(d) > tiny else tiny)
+        c = 1. + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1. + aa * d
+        d = 1. / (d if abs(d) > tiny else tiny)
+        c = 1. + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.) < eps:
+            break
+    return h
+
+
+def beta_cdf(x, a, b):
+    """
+    Regularized incomplete beta function I_x(a, b)
+    """
+    if x <= 0.:
+        return 0.
+    if x >= 1.:
+        return 1.
+    log_front = math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log1p(-x)
+    if x < (a + 1.) / (a + b + 2.):
+        return math.exp(log_front) * _beta_cf(a, b, x) / a
+    return 1. - math.exp(log_front) * _beta_cf(b, a, 1. - x) / b
+
+
+def beta_ppf(q, a, b, tol=1e-12):
+    """
+    Quantile of the Beta(a, b) distribution by bisection
+    """
+    lo, hi = 0., 1.
+    while hi - lo > tol:
+        mid = 0.5 * (lo + hi)
+        if beta_cdf(mid, a, b) < q:
+            lo = mid
+        else:
+            hi = mid
+    return 0.5 * (lo + hi)
+
+
+def clopper_pearson(k, n, confidence=0.95):
+    """
+    Exact (Clopper-Pearson) two-sided confidence interval of a binomial proportion with k successes out of n
+    """
+    if n == 0:
+        return 0., 1.
+    alpha = 1. - confidence
+    lower = 0. if k == 0 else beta_ppf(alpha / 2, k, n - k + 1)
+    upper = 1. if k == n else beta_ppf(1. - alpha / 2, k + 1, n - k)
+    return lower, upper
+
+
+class SafetyCertifier:
+    """
+    Monte-Carlo estimate of the probability that the closed loop (HP-Student + HA-Teacher) leaves the safety set
+
+    Every round runs `batch_size` evaluation episodes at once on a `BatchCartpole`: initial conditions, domain
+    randomization and actuator noise are sampled from the cartpole config, the actor is evaluated on the whole batch,
+    and the HA-Teacher/Coordinator switching logic is applied per episode with array masks. Rounds stop once the
+    Clopper-Pearson interval of the violation probability is narrower than `target_width`, or after `max_episodes`.
+    """
+
+    def __init__(self, config, agent, ha_teacher, cartpole_cfg=None):
+        self.params = config.certification
+        self.agent = agent
+        self.ha_teacher = ha_teacher
+        self.cartpole_cfg = cartpole_cfg if cartpole_cfg is not None else config.cartpole
+
+        self.gamma = config.hp_student.phydrl.gamma
+        self.action_magnitude = config.hp_student.agents.action.magnitude
+        self.unknown_distribution = config.hp_student.agents.unknown_distribution.apply
+        self.terminate_on_failure = self.cartpole_cfg.terminate_on_failure
+
+        self.epsilon = ha_teacher.epsilon
+        self.chi = ha_teacher.chi
+        self.max_dwell_steps = ha_teacher.max_dwell_steps
+        self.teacher_enable = ha_teacher.teacher_enable
+
+    def _student_actions(self, states):
+        observations = batch_state2observations(states).astype(np.float32)
+        drl_raw_action = np.reshape(self.agent.actor(tf.convert_to_tensor(observations)).numpy(), -1)
+
+        # Unknown unknowns as in `Cartpole.get_unknown_distribution`
+        if self.unknown_distribution:
+            n = len(states)
+            rng = np.random.default_rng(seed=0)
+            a, b = 11 * np.random.random(n), 11 * np.random.random(n)
+            drl_raw_action = np.clip(drl_raw_action + 2.5 * (rng.beta(a, b) - rng.beta(a, b)), -1, 1)
+
+        return drl_raw_action * self.action_magnitude + self.gamma * states @ F
+
+    def run_batch(self, env, max_steps):
+        """
+        Run one batch of episodes (one per env), returns per-episode
+        (violated, teacher activations, teacher steps, max energy, steps)
+        """
+        env.random_reset(domain_random=True)
+
+        n = env.num_envs
+        running = np.ones(n, dtype=bool)
+        violated = np.zeros(n, dtype=bool)
+        activations = np.zeros(n, dtype=np.int64)
+        teacher_steps = np.zeros(n, dtype=np.int64)
+        steps = np.zeros(n, dtype=np.int64)
+        energy = np.einsum('ij,jk,ik->i', env.state, MATRIX_P, env.state)
+        max_energy = energy.copy()
+
+        # HA-Teacher and Coordinator status (see `HATeacher.update/get_action` and `Coordinator`)
+        teacher_active = np.zeros(n, dtype=bool)
+        dwell = np.zeros(n, dtype=np.int64)
+        patch_center = np.zeros((n, 4))
+        patch_gain = np.tile(F_Simplex, (n, 1))
+        teacher_mode = energy >= self.epsilon
+
+        for _ in range(max_steps):
+            states = env.state
+
+            # Teacher update: deactivate after the dwell time, activate outside the envelope
+            activate = ~teacher_active & (energy >= self.epsilon) & running
+            teacher_active &= dwell < self.max_dwell_steps
+            dwell[activate] = 0
+            teacher_active |= activate
+            activations += activate
+            patch_center[activate] = states[activate] * self.chi
+
+            # Coordinator: keep the teacher within its dwell time, switch to it when leaving the envelope
+            has_teacher = teacher_active & self.teacher_enable
+            teacher_mode = has_teacher & (teacher_mode | (energy >= self.epsilon))
+
+            actions = self._student_actions(states)
+            for i in np.flatnonzero(has_teacher & running):
+                F_hat, t_min = self.ha_teacher.system_patch(state=states[i])
+                if t_min <= 0:
+                    patch_gain[i] = np.asarray(F_hat).reshape(-1)
+                if teacher_mode[i]:
+                    actions[i] = patch_gain[i] @ (states[i] - patch_center[i])
+            dwell += has_teacher
+            teacher_steps += teacher_mode & running
+
+            states, failed = env.step(actions)
+            energy = np.einsum('ij,jk,ik->i', states, MATRIX_P, states)
+            max_energy = np.where(running, np.maximum(max_energy, energy), max_energy)
+            steps += running
+            violated |= failed & running
+            if self.terminate_on_failure:
+                running &= ~failed
+            if not running.any():
+                break
+
+        return violated, activations, teacher_steps, max_energy, steps
+
+    def certify(self):
+        max_episodes = int(self.params.max_episodes)
+        max_steps = int(self.params.max_steps)
+        min_episodes = int(self.params.min_episodes)
+        confidence = self.params.confidence
+        target_width = self.params.target_width
+
+        # One batch of plants for all rounds, each round draws fresh initial conditions and domain parameters
+        env = BatchCartpole(self.cartpole_cfg, num_envs=min(int(self.params.batch_size), max_episodes),
+                            auto_reset=False)
+
+        results = [[] for _ in range(5)]
+        n, k = 0, 0
+        lower, upper = 0., 1.
+        start_time = time.time()
+        while n < max_episodes:
+            for result, values in zip(results, self.run_batch(env, max_steps)):
+                result.append(values[:max_episodes - n])
+            violated = np.concatenate(results[0])
+            n, k = len(violated), int(violated.sum())
+            lower, upper = clopper_pearson(k, n, confidence)
+            print(f"Certification: {k}/{n} violations, p in [{lower:.5f}, {upper:.5f}] "
+                  f"({confidence:.0%} Clopper-Pearson)")
+            if n >= min_episodes and upper - lower <= target_width:
+                print(f"Interval width {upper - lower:.5f} <= {target_width}, stop early")
+                break
+
+        violated, activations, teacher_steps, max_energy, steps = [np.concatenate(r) for r in results]
+        report = {'episodes': n,
+                  'violations': k,
+                  'violation_probability': k / n,
+                  'ci_lower': lower,
+                  'ci_upper': upper,
+                  'confidence': confidence,
+                  'teacher_activation_rate': float(np.mean(activations > 0)),
+                  'mean_teacher_activations': float(np.mean(activations)),
+                  'mean_teacher_steps': float(np.mean(teacher_steps)),
+                  'max_energy': float(np.max(max_energy)),
+                  'mean_max_energy': float(np.mean(max_energy)),
+                  'mean_steps': float(np.mean(steps)),
+                  'wall_time': time.time() - start_time}
+        logger.debug(f"Certification report: {report}")
+        return report
+
+    @staticmethod
+    def save_report(report, path):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Certification report saved to {path}")
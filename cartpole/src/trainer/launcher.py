@@ -0,0 +1,219 @@
+import os
+import sys
+import csv
+import json
+import time
+import queue
+import argparse
+import itertools
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+CARTPOLE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Two-sided 95% Student-t quantiles by degrees of freedom (normal quantile beyond the table)
+T_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+SEED_KEYS = ('general.seed', 'cartpole.random_reset.seed', 'cartpole.domain_random.seed',
+             'cartpole.inject_disturbance.seed')
+
+
+def parse_grid(grid):
+    """
+    Hydra multirun style axes ['key=a,b', ...] to [(key, [a, b]), ...]
+    """
+    axes = []
+    for item in grid:
+        if '=' not in item:
+            raise RuntimeError(f"Grid axis should be key=value1,value2,...: {item}")
+        key, values = item.split('=', 1)
+        axes.append((key, values.split(',')))
+    return axes
+
+
+def make_runs(name, axes, seeds, out_dir, base_overrides=()):
+    """
+    One run spec per (cell, seed), with its own log/model/hydra directories under `out_dir`
+    """
+    runs = []
+    keys = [key for key, _ in axes]
+    for cell_idx, values in enumerate(itertools.product(*[values for _, values in axes])):
+        cell = dict(zip(keys, values))
+        for seed in seeds:
+            run_id = f"{name}_c{cell_idx}_s{seed}"
+            run_dir = os.path.join(out_dir, 'runs', run_id)
+            defaults = {'general.id': run_id,
+                        'general.mode': 'train',
+                        'general.use_gpu': 'false',
+                        'general.num_threads': 1,
+                        'logger.log_dir': f"{run_dir}/logs",
+                        'logger.model_save_dir': f"{run_dir}/models",
+                        'hydra.run.dir': f"{run_dir}/hydra",
+                        **{k: seed for k in SEED_KEYS}}
+            overrides = list(base_overrides) + [f"{k}={v}" for k, v in cell.items()]
+            given = {item.split('=', 1)[0] for item in overrides}
+            overrides += [f"{k}={v}" for k, v in defaults.items() if k not in given]  # Each key only once for hydra
+            runs.append({'run_id': run_id, 'cell': cell_idx, 'seed': seed, 'params': cell,
+                         'run_dir': run_dir, 'overrides': overrides})
+    return runs
+
+
+def _run_env():
+    env = dict(os.environ)
+    env.update({'CUDA_VISIBLE_DEVICES': '-1',
+                'TF_NUM_INTRAOP_THREADS': '1',
+                'TF_NUM_INTEROP_THREADS': '1',
+                'OMP_NUM_THREADS': '1',
+                'MKL_NUM_THREADS': '1',
+                'OPENBLAS_NUM_THREADS': '1',
+                'TF_CPP_MIN_LOG_LEVEL': '2'})
+    return env
+
+
+def execute_run(run, free_cores=None):
+    """
+    Run main.py for one spec and read back its summary, the output goes to <run_dir>/stdout.log
+    """
+    os.makedirs(run['run_dir'], exist_ok=True)
+    core = free_cores.get() if free_cores is not None else None
+
+    start = time.time()
+    try:
+        with open(os.path.join(run['run_dir'], 'stdout.log'), 'w') as log_file:
+            process = subprocess.Popen([sys.executable, 'main.py'] + run['overrides'],
+                                       cwd=CARTPOLE_ROOT, env=_run_env(), stdout=log_file, stderr=subprocess.STDOUT)
+            # Pinned from the parent, preexec_fn is not safe with the launcher threads
+            if core is not None:
+                try:
+                    os.sched_setaffinity(process.pid, {core})
+                except ProcessLookupError:
+                    pass  # Already exited
+            process.wait()
+    finally:
+        if core is not None:
+            free_cores.put(core)
+
+    row = {'run_id': run['run_id'], 'cell': run['cell'], 'seed': run['seed'], **run['params'],
+           'returncode': process.returncode, 'elapsed': time.time() - start}
+
+    # Trainer.train always ends with exit(msg), so the summary (not the return code) tells whether the run finished
+    summary_path = os.path.join(run['run_dir'], 'logs', 'summary.json')
+    if os.path.exists(summary_path):
+        with open(summary_path, 'r') as f:
+            row.update(json.load(f))
+        row['status'] = 'done'
+    else:
+        row['status'] = 'failed'
+    print(f"[{row['status']}] {run['run_id']} ({row['elapsed']:.1f}s)")
+    return row
+
+
+def run_all(runs, workers=None, pin_cores=True):
+    workers = workers or os.cpu_count()
+    free_cores = None
+    if pin_cores and hasattr(os, 'sched_setaffinity'):
+        free_cores = queue.Queue()
+        for core in sorted(os.sched_getaffinity(0))[:workers]:
+            free_cores.put(core)
+        workers = min(workers, free_cores.qsize())
+
+    # Threads only supervise the subprocesses, every run is a separate process
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda run: execute_run(run, free_cores), runs))
+
+
+def confidence_interval(values, level_table=T_95):
+    """
+    (mean, std, half width of the 95% t-interval) of the finite values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    n = len(values)
+    if n == 0:
+        return np.nan, np.nan, np.nan
+    mean = float(values.mean())
+    if n == 1:
+        return mean, np.nan, np.nan
+    std = float(values.std(ddof=1))
+    t = level_table[n - 2] if n - 1 <= len(level_table) else 1.96
+    return mean, std, t * std / np.sqrt(n)
+
+
+def aggregate(rows, axes):
+    """
+    Mean, std and 95% CI of every metric per cell of the override matrix
+    """
+    keys = [key for key, _ in axes]
+    reserved = {'run_id', 'cell', 'seed', 'status', 'returncode'} | set(keys)
+    metrics = sorted({k for row in rows for k, v in row.items()
+                      if k not in reserved and isinstance(v, (int, float))})
+
+    summary = []
+    for cell in sorted({row['cell'] for row in rows}):
+        cell_rows = [row for row in rows if row['cell'] == cell]
+        done = [row for row in cell_rows if row['status'] == 'done']
+        entry = {'cell': cell, **{k: cell_rows[0][k] for k in keys}, 'n_seeds': len(cell_rows), 'n_done': len(done)}
+        for metric in metrics:
+            mean, std, half_width = confidence_interval([row.get(metric, np.nan) for row in done])
+            entry.update({f"{metric}_mean": mean, f"{metric}_std": std,
+                          f"{metric}_ci_low": mean - half_width, f"{metric}_ci_high": mean + half_width})
+        summary.append(entry)
+    return summary
+
+
+def write_table(rows, path):
+    """
+    Write rows (list of dicts) as CSV, or as Parquet for a .parquet path (needs pandas with pyarrow, falls back to CSV)
+    """
+    if path.endswith('.parquet'):
+        try:
+            import pandas as pd  # Only needed for Parquet output
+            pd.DataFrame(rows).to_parquet(path, index=False)
+            return path
+        except ImportError as e:
+            path = path[:-len('.parquet')] + '.csv'
+            print(f"Parquet output needs pandas and pyarrow ({e}), writing {path} instead")
+
+    columns = list(dict.fromkeys(k for row in rows for k in row))
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a matrix of hydra overrides over several seeds in parallel")
+    parser.add_argument('--name', type=str, default='sweep', help='Experiment name')
+    parser.add_argument('--grid', type=str, action='append', default=[],
+                        help='Override axis key=value1,value2,... (repeatable)')
+    parser.add_argument('--set', type=str, action='append', default=[], help='Override shared by all runs')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2, 3, 4])
+    parser.add_argument('--workers', type=int, default=None, help='Parallel runs (all cores by default)')
+    parser.add_argument('--no_pin', action='store_true', help='Do not pin every run to its own core')
+    parser.add_argument('--out_dir', type=str, default=None, help='Defaults to results/sweeps/<name>')
+    parser.add_argument('--format', type=str, default='csv', choices=['csv', 'parquet'])
+    args = parser.parse_args()
+
+    out_dir = os.path.abspath(args.out_dir or os.path.join(CARTPOLE_ROOT, 'results', 'sweeps', args.name))
+    os.makedirs(out_dir, exist_ok=True)
+
+    axes = parse_grid(args.grid)
+    runs = make_runs(args.name, axes, args.seeds, out_dir, base_overrides=args.set)
+    print(f"Launching {len(runs)} runs ({len(runs) // len(args.seeds)} cells x {len(args.seeds)} seeds)")
+
+    start = time.time()
+    rows = run_all(runs, workers=args.workers, pin_cores=not args.no_pin)
+    elapsed = time.time() - start
+    print(f"Finished {len(rows)} runs in {elapsed:.1f}s ({len(rows) / elapsed * 3600:.1f} runs/h)")
+
+    runs_path = write_table(rows, os.path.join(out_dir, f"runs.{args.format}"))
+    summary_path = write_table(aggregate(rows, axes), os.path.join(out_dir, f"summary.{args.format}"))
+    print(f"Per-seed results saved to {runs_path}, summary saved to {summary_path}")
+
+
+if __name__ == '__main__':
+    main()
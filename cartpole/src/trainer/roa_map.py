@@ -0,0 +1,161 @@
+import os
+import time
+import hydra
+import numpy as np
+import tensorflow as tf
+from omegaconf import DictConfig
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from src.physical_design import MATRIX_P, F, F_Simplex
+from src.envs.batch_cart_pole import BatchCartpole, batch_state2observations
+from src.hp_student.networks.actor_runtime import NumpyActor
+from src.utils.utils import check_dir
+
+CONTROLLERS = ('actor', 'F', 'F_Simplex')
+
+
+def make_batch_controller(controller, actor=None, backend='numpy', gamma=1., action_magnitude=1.):
+    """
+    Batched state feedback (N, 4) -> (N,) forces, the actor is the HP-Student action (drl + gamma * F s) without the
+    HA-Teacher
+    """
+    if controller == 'F':
+        return lambda states: states @ F
+    elif controller == 'F_Simplex':
+        return lambda states: states @ F_Simplex
+    elif controller != 'actor':
+        raise RuntimeError(f"Unknown controller: {controller}, choose from {CONTROLLERS}")
+
+    if backend == 'numpy':
+        predict = NumpyActor.from_keras(actor).predict
+    elif backend == 'keras':
+        predict = lambda observations: actor(tf.convert_to_tensor(observations)).numpy()
+    else:
+        raise RuntimeError(f"Unknown actor backend for the batched rollout: {backend}, choose from ('numpy', 'keras')")
+
+    def student(states):
+        observations = batch_state2observations(states).astype(np.float32)
+        drl_action = np.reshape(predict(observations), -1) * action_magnitude
+        return drl_action + gamma * (states @ F)
+
+    return student
+
+
+def rollout_roa(cartpole_cfg, controller, initial_states, max_steps, energy_tol, compact_ratio=0.1):
+    """
+    Roll out all initial states (N, 4) at once
+
+    A rollout converges once s^T P s drops below `energy_tol` within the safety set and fails when it leaves the set.
+    Finished rollouts are dropped from the batch, so the cost shrinks as the batch converges.
+    return: converged (N,), steps to convergence (N,) (-1 if not converged), peak s^T P s (N,)
+    """
+    n = len(initial_states)
+    env = BatchCartpole(cartpole_cfg, num_envs=n, auto_reset=False)
+    env.reset(reset_state=np.asarray(initial_states, dtype=np.float64))
+
+    alive = np.arange(n)  # Original indices of the rollouts still in the batch
+    converged = np.zeros(n, dtype=bool)
+    steps = np.full(n, -1, dtype=np.int64)
+    energy = np.einsum('ij,jk,ik->i', env.state, MATRIX_P, env.state)
+    peak_energy = energy.copy()
+
+    failed = env.is_failed(env.state[:, 0], env.state[:, 2])
+    done = failed | (energy < energy_tol)
+    converged[done & ~failed] = True
+    steps[done & ~failed] = 0
+
+    for step in range(1, max_steps + 1):
+        # Drop finished rollouts once enough of them piled up
+        if done.mean() >= compact_ratio:
+            keep = ~done
+            env.keep(keep)
+            alive, energy, done = alive[keep], energy[keep], done[keep]
+        if alive.size == 0:
+            break
+
+        states, failed = env.step(controller(env.state))
+        energy = np.einsum('ij,jk,ik->i', states, MATRIX_P, states)
+        running = ~done
+        peak_energy[alive[running]] = np.maximum(peak_energy[alive[running]], energy[running])
+
+        reached = running & ~failed & (energy < energy_tol)
+        converged[alive[reached]] = True
+        steps[alive[reached]] = step
+        done |= failed | reached
+
+    return converged, steps, peak_energy
+
+
+def plot_roa(x_grid, theta_grid, converged, steps, peak_energy, title, path):
+    extent = [x_grid[0], x_grid[-1], theta_grid[0], theta_grid[-1]]
+    fig = Figure(figsize=(15, 4.5))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(1, 3)
+    panels = [(converged.astype(float), 'Converged', 'Greens'),
+              (np.where(steps >= 0, steps, np.nan), 'Steps to convergence', 'viridis'),
+              (np.log10(np.maximum(peak_energy, 1e-12)), r'Peak $\log_{10}(s^T P s)$', 'magma')]
+    for ax, (values, name, cmap) in zip(axes, panels):
+        image = ax.imshow(values, origin='lower', extent=extent, aspect='auto', cmap=cmap, interpolation='nearest')
+        fig.colorbar(image, ax=ax)
+        ax.set_title(name)
+        ax.set_xlabel(r'$x$')
+        ax.set_ylabel(r'$\theta$')
+    fig.suptitle(title)
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+
+
+@hydra.main(version_base=None, config_path="../../config", config_name="base_config.yaml")
+def main(cfg: DictConfig):
+    from src.hp_student.agents.ddpg import DDPGAgent
+
+    roa_cfg = cfg.roa
+    actor = None
+    if roa_cfg.controller == 'actor':
+        if cfg.hp_student.agents.checkpoint is None:
+            exit("Please load the pretrained checkpoint")
+        shape_observations, shape_action = 5, 1
+        agent = DDPGAgent(agent_cfg=cfg.hp_student.agents,
+                          taylor_cfg=cfg.hp_student.taylor,
+                          shape_observations=shape_observations,
+                          shape_action=shape_action,
+                          mode='test')
+        actor = agent.actor
+        actor(tf.zeros((1, shape_observations)))
+
+    controller = make_batch_controller(roa_cfg.controller, actor=actor, backend=roa_cfg.backend,
+                                       gamma=cfg.hp_student.phydrl.gamma,
+                                       action_magnitude=cfg.hp_student.agents.action.magnitude)
+
+    # Dense grid over the (x, theta) safety set, starting at rest
+    x_grid = np.linspace(*cfg.cartpole.safety_set.x, roa_cfg.x_num)
+    theta_grid = np.linspace(*cfg.cartpole.safety_set.theta, roa_cfg.theta_num)
+    xx, tt = np.meshgrid(x_grid, theta_grid)
+    initial_states = np.zeros((xx.size, 4))
+    initial_states[:, 0], initial_states[:, 2] = xx.ravel(), tt.ravel()
+
+    start_time = time.time()
+    results = [[], [], []]
+    chunk_size = int(roa_cfg.chunk_size)
+    for start in range(0, len(initial_states), chunk_size):
+        chunk = rollout_roa(cfg.cartpole, controller, initial_states[start:start + chunk_size],
+                            max_steps=roa_cfg.max_steps, energy_tol=roa_cfg.energy_tol)
+        for result, values in zip(results, chunk):
+            result.append(values)
+    converged, steps, peak_energy = [np.concatenate(r).reshape(xx.shape) for r in results]
+    print(f"Rolled out {converged.size} initial states in {time.time() - start_time:.1f}s, "
+          f"{converged.mean():.2%} converged")
+
+    save_dir = hydra.utils.to_absolute_path(roa_cfg.save_dir)
+    check_dir(save_dir)
+    name = f"roa_{roa_cfg.controller}"
+    np.savez_compressed(os.path.join(save_dir, f"{name}.npz"), x_grid=x_grid, theta_grid=theta_grid,
+                        converged=converged, steps=steps, peak_energy=peak_energy)
+    plot_roa(x_grid, theta_grid, converged, steps, peak_energy, title=f"Region of attraction ({roa_cfg.controller})",
+             path=os.path.join(save_dir, f"{name}.png"))
+    print(f"Region of attraction map saved to {save_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+CARTPOLE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules a minimal evaluation should never load (plotting, rendering, GIF export, patch engines)
+HEAVY_MODULES = ('matplotlib.pyplot', 'pyglet', 'imageio', 'cvxpy', 'matlab.engine')
+
+# Test mode without HA-Teacher, plots, live visualization or GIFs
+MINIMAL_EVAL_OVERRIDES = ('general.mode=test',
+                          'general.use_gpu=false',
+                          'ha_teacher.teacher_enable=false',
+                          'logger.fig_plotter.phase.plot=false',
+                          'logger.fig_plotter.trajectory.plot=false',
+                          'logger.live_plotter.animation.show=false',
+                          'logger.live_plotter.animation.save_to_gif=false',
+                          'logger.live_plotter.live_trajectory.show=false',
+                          'logger.live_plotter.live_trajectory.save_to_gif=false',
+                          'logger.force_override=true')
+
+# Runs in a fresh interpreter, so that nothing is imported beforehand
+_PROBE = r"""
+import sys, json, time
+start = time.perf_counter()
+from src.trainer.trainer import Trainer
+import_time = time.perf_counter() - start
+
+from hydra import compose, initialize_config_dir
+with initialize_config_dir(config_dir=sys.argv[1], version_base=None):
+    cfg = compose(config_name='base_config.yaml', overrides=sys.argv[3:])
+start = time.perf_counter()
+Trainer(cfg)
+init_time = time.perf_counter() - start
+
+heavy = json.loads(sys.argv[2])
+print(json.dumps({'import_time': import_time, 'init_time': init_time,
+                  'loaded': [m for m in heavy if m in sys.modules]}))
+"""
+
+
+def measure_startup(overrides=MINIMAL_EVAL_OVERRIDES, heavy_modules=HEAVY_MODULES):
+    """
+    Import and construct the Trainer in a subprocess, returns {import_time, init_time, loaded heavy modules}
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        overrides = list(overrides) + [f"logger.log_dir={tmp_dir}/logs", f"logger.model_save_dir={tmp_dir}/models"]
+        env = dict(os.environ, CUDA_VISIBLE_DEVICES='-1', TF_CPP_MIN_LOG_LEVEL='2')
+        process = subprocess.run([sys.executable, '-c', _PROBE, os.path.join(CARTPOLE_ROOT, 'config'),
+                                  json.dumps(list(heavy_modules))] + overrides,
+                                 cwd=CARTPOLE_ROOT, env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Startup probe failed:\n{process.stderr}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time of a minimal evaluation (test mode, no teacher/plots)")
+    parser.add_argument('--budget', type=float, default=10., help='Maximum import + init time in seconds')
+    parser.add_argument('--repeat', type=int, default=3, help='Best of N cold starts')
+    parser.add_argument('--set', type=str, action='append', default=[], help='Additional hydra override')
+    args = parser.parse_args()
+
+    results = [measure_startup(overrides=list(MINIMAL_EVAL_OVERRIDES) + args.set) for _ in range(args.repeat)]
+    best = min(results, key=lambda r: r['import_time'] + r['init_time'])
+    total = best['import_time'] + best['init_time']
+    print(f"Import: {best['import_time']:.2f}s, Trainer init: {best['init_time']:.2f}s, total: {total:.2f}s "
+          f"(best of {args.repeat})")
+
+    assert not best['loaded'], f"Heavy modules loaded by a minimal evaluation: {best['loaded']}"
+    assert total <= args.budget, f"Startup took {total:.2f}s, over the {args.budget:.2f}s budget"
+    print("Startup benchmark passed")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,24 @@
 import logging
 import os
+import json
 import time
 import copy
-import imageio
 import warnings
 import numpy as np
 from tqdm import tqdm
-import matplotlib.pyplot as plt
 
 from src.physical_design import MATRIX_P, F
 from src.ha_teacher.ha_teacher import HATeacher
 from src.hp_student.agents.ddpg import DDPGAgent
-from src.hp_student.agents.replay_mem import ReplayMemory
+from src.hp_student.agents.async_learner import AsyncLearner
+from src.hp_student.agents.checkpoint_manager import CheckpointManager
+from src.hp_student.agents.replay_mem import ReplayMemory, PrioritizedReplayMemory
 from src.coordinator.coordinator import Coordinator
 from src.utils.utils import ActionMode, energy_value, logger
+from src.utils.profiler import profiler
 from src.envs.cart_pole import observations2state, state2observations
 from src.envs.cart_pole import Cartpole
-from src.logger.logger import Logger, plot_trajectory
+from src.logger.logger import Logger
 
 np.set_printoptions(suppress=True)
 
@@ -34,13 +36,45 @@ class Trainer:
         self.agent_params = config.hp_student.agents
         self.shape_observations = self.cartpole.state_observations_dim
         self.shape_action = self.cartpole.action_dim
-        self.replay_mem = ReplayMemory(config.hp_student.agents.replay_buffer.buffer_size)
+        per_params = config.hp_student.agents.replay_buffer.prioritized
+        if per_params.apply:
+            self.replay_mem = PrioritizedReplayMemory(config.hp_student.agents.replay_buffer.buffer_size,
+                                                      alpha=per_params.alpha,
+                                                      beta=per_params.beta,
+                                                      beta_annealing_steps=per_params.beta_annealing_steps,
+                                                      eps=per_params.eps,
+                                                      teacher_boost=per_params.teacher_boost,
+                                                      shape_observations=self.shape_observations,
+                                                      shape_action=self.shape_action,
+                                                      seed=config.general.seed)
+        else:
+            self.replay_mem = ReplayMemory(config.hp_student.agents.replay_buffer.buffer_size,
+                                           shape_observations=self.shape_observations,
+                                           shape_action=self.shape_action,
+                                           seed=config.general.seed)
         self.agent = DDPGAgent(agent_cfg=config.hp_student.agents,
                                taylor_cfg=config.hp_student.taylor,
                                shape_observations=self.shape_observations,
                                shape_action=self.shape_action,
                                mode=config.logger.mode)
 
+        # Background learner (optimize decoupled from the interaction loop)
+        self.async_learner = None
+        if self.agent_params.async_learner.apply:
+            self.async_learner = AsyncLearner(agent=self.agent,
+                                              replay_mem=self.replay_mem,
+                                              batch_size=self.agent_params.replay_buffer.batch_size,
+                                              prefill_size=self.agent_params.replay_buffer.experience_prefill_size,
+                                              updates_per_step=self.agent_params.async_learner.updates_per_step,
+                                              publish_period=self.agent_params.async_learner.publish_period,
+                                              prioritized=per_params.apply)
+
+        # Checkpoints written on a background thread
+        self.checkpoint_manager = None
+        if self.agent_params.checkpoint_manager.apply:
+            self.checkpoint_manager = CheckpointManager(agent=self.agent,
+                                                        keep_last=self.agent_params.checkpoint_manager.keep_last)
+
         # HA-Teacher
         self.ha_params = config.ha_teacher
         self.ha_teacher = HATeacher(teacher_cfg=config.ha_teacher, cartpole_cfg=config.cartpole)
@@ -58,6 +92,8 @@ class Trainer:
         self._terminate_on_failure = self.params.cartpole.terminate_on_failure
         self._exp_prefill_size = self.agent_params.replay_buffer.experience_prefill_size
         self._batch_size = self.agent_params.replay_buffer.batch_size
+        self._prioritized_replay = per_params.apply
+        self._updates_per_step = int(self.agent_params.updates_per_step)
 
         self.failed_times = 0
 
@@ -66,7 +102,8 @@ class Trainer:
         current_state = copy.deepcopy(self.cartpole.state)
         observations, _ = state2observations(current_state)
 
-        self.ha_teacher.update(state=np.asarray(current_state[:4]))  # Teacher update
+        with profiler.span('teacher_update'):
+            self.ha_teacher.update(state=np.asarray(current_state[:4]))  # Teacher update
 
         terminal_action, nominal_action = self.get_terminal_action(state=current_state, mode=mode)
         # Update logs
@@ -78,7 +115,8 @@ class Trainer:
         )
 
         # Inject Terminal Action
-        next_state = self.cartpole.step(action=terminal_action)
+        with profiler.span('env_step'):
+            next_state = self.cartpole.step(action=terminal_action)
 
         observations_next, failed = state2observations(next_state)
 
@@ -96,6 +134,11 @@ class Trainer:
         best_dsas = 0.0  # Best distance score and survived
         moving_average_dsas = 0.0
         optimize_time = 0
+        eval_metrics = {}  # Latest evaluation
+        start_time = time.time()
+
+        if self.async_learner is not None:
+            self.async_learner.start()
 
         # Run for max training episodes
         for ep_i in range(int(self.agent_params.max_training_episodes)):
@@ -132,13 +175,13 @@ class Trainer:
                     # Test Learning efficiency for Runtime Learning Machine
                     logger.debug("HP-Student doesn't learn from HA-Teacher, skip model updating...")
                 else:
-                    self.replay_mem.add((observations, action, r, observations_next, failed))
-                    if self.replay_mem.size > self._exp_prefill_size:
-                        minibatch = self.replay_mem.sample(self._batch_size)
-                        critic_loss = self.agent.optimize(minibatch)
-                        optimize_time += 1
-                    else:
+                    with profiler.span('optimize'):
+                        critic_loss = self.optimize_step((observations, action, r, observations_next, failed),
+                                                         ha_flag)
+                    if critic_loss is None:
                         critic_loss = self._initial_loss
+                    elif self.async_learner is None:
+                        optimize_time += self._updates_per_step
                     critic_loss_list.append(critic_loss)
                     reward_list.append(r)
                     distance_score_list.append(distance_score)
@@ -178,6 +221,7 @@ class Trainer:
             mean_critic_loss = np.mean(critic_loss_list)
 
             self.logger.log_training_data(mean_reward, mean_distance_score, mean_critic_loss, failed, global_steps)
+            self.logger.log_profile(global_steps)
 
             print(f"Average_reward: {mean_reward:.6}\n"
                   f"Distance_score: {mean_distance_score:.6}\n"
@@ -185,7 +229,7 @@ class Trainer:
                   f"Total_steps_ep: {ep_steps} ")
 
             # Save weights per episode
-            self.agent.save_weights(self.logger.model_dir)
+            self.save_weights(self.logger.model_dir, global_steps)
 
             if (ep_i + 1) % self.hp_params.agents.evaluation_period == 0:
                 eval_mean_reward, eval_mean_distance_score, eval_failed = self.evaluation(mode='eval', idx=ep_i)
@@ -193,8 +237,11 @@ class Trainer:
                 self.logger.log_evaluation_data(eval_mean_reward, eval_mean_distance_score, eval_failed,
                                                 global_steps)
                 moving_average_dsas = 0.95 * moving_average_dsas + 0.05 * eval_mean_distance_score
+                eval_metrics = {'eval_reward': eval_mean_reward,
+                                'eval_distance_score': eval_mean_distance_score,
+                                'eval_failed': eval_failed}
                 if moving_average_dsas > best_dsas:
-                    self.agent.save_weights(self.logger.model_dir + '-best')
+                    self.save_weights(self.logger.model_dir + '-best', global_steps, best=True)
                     best_dsas = moving_average_dsas
 
             episode += 1
@@ -202,17 +249,93 @@ class Trainer:
 
             # Whether to terminate training based on training_steps
             if global_steps > self.agent_params.max_training_steps and self.agent_params.training_by_steps:
-                np.savetxt(f"{self.logger.log_dir}/failed_times.txt",
-                           [self.failed_times, episode, self.failed_times / episode])
-                print(f"Final_optimize time: {optimize_time}")
-                print("Total failed:", self.failed_times)
+                self.finish_training(episode, global_steps, optimize_time, best_dsas, eval_metrics, start_time)
                 exit("Reach maximum steps, exit...")
 
+        self.finish_training(episode, global_steps, optimize_time, best_dsas, eval_metrics, start_time)
+        exit("Reach maximum episodes, exit...")
+
+    def save_weights(self, path, global_steps, best=False):
+        if self.checkpoint_manager is not None:
+            self.checkpoint_manager.save(path, step=global_steps, best=best)
+        else:
+            self.agent.save_weights(path)
+
+    def finish_training(self, episode, global_steps, optimize_time, best_dsas, eval_metrics, start_time):
+        """
+        Stop the background learner and checkpoint writer, save the run summary (failed_times.txt and summary.json) to the log dir
+        """
         np.savetxt(f"{self.logger.log_dir}/failed_times.txt",
                    [self.failed_times, episode, self.failed_times / episode])
+        if self.async_learner is not None:
+            self.async_learner.stop()
+            optimize_time = self.async_learner.updates
+        if self.checkpoint_manager is not None:
+            self.checkpoint_manager.close()
         print(f"Final_optimize time: {optimize_time}")
         print("Total failed:", self.failed_times)
-        exit("Reach maximum episodes, exit...")
+
+        summary = {'failed_times': self.failed_times,
+                   'episodes': episode,
+                   'failure_rate': self.failed_times / episode,
+                   'global_steps': global_steps,
+                   'optimize_time': optimize_time,
+                   'best_dsas': best_dsas,
+                   'wall_time': time.time() - start_time,
+                   **eval_metrics}
+        with open(f"{self.logger.log_dir}/summary.json", 'w') as f:
+            json.dump({k: float(v) for k, v in summary.items()}, f, indent=2)
+        self.logger.save_profile()
+        self.logger.close()
+
+    def optimize_step(self, experience, ha_flag=False):
+        """
+        Store the transition and run one agent update once the replay memory is prefilled, return the critic loss
+
+        With the async learner the update runs in the background, and the latest published actor is picked up instead
+        """
+        if self.async_learner is not None:
+            self.async_learner.add(experience, teacher=ha_flag)
+            self.async_learner.sync_actor()
+            return self.async_learner.critic_loss
+
+        if self._prioritized_replay:
+            self.replay_mem.add(experience, teacher=ha_flag)
+        else:
+            self.replay_mem.add(experience)
+
+        if self.replay_mem.size <= self._exp_prefill_size:
+            return None
+
+        # Several updates per step run fused in one compiled graph
+        if self._updates_per_step > 1:
+            return self.optimize_k_step(k=self._updates_per_step)
+
+        if self._prioritized_replay:
+            minibatch, weights, indices = self.replay_mem.sample(self._batch_size)
+            critic_loss = self.agent.optimize(minibatch, weights=weights)
+            self.replay_mem.update_priorities(indices, self.agent.td_error)
+        else:
+            minibatch = self.replay_mem.sample(self._batch_size)
+            critic_loss = self.agent.optimize(minibatch)
+        return critic_loss
+
+    def optimize_k_step(self, k):
+        if self._prioritized_replay:
+            minibatches, weights, indices = [], [], []
+            for _ in range(k):
+                minibatch, w, idx = self.replay_mem.sample(self._batch_size)
+                minibatches.append([field.copy() for field in minibatch])  # Sampled arrays are reused
+                weights.append(w)
+                indices.append(idx)
+            batches = [np.stack(fields) for fields in zip(*minibatches)]
+            critic_loss = self.agent.optimize_k(batches, k=k, weights=np.stack(weights))
+            for idx, td_error in zip(indices, self.agent.td_error):
+                self.replay_mem.update_priorities(idx, td_error)
+        else:
+            batches = self.replay_mem.sample_stacked(self._batch_size, k)
+            critic_loss = self.agent.optimize_k(batches, k=k)
+        return critic_loss
 
     def evaluation(self, reset_state=None, mode=None, idx=0):
 
@@ -226,7 +349,6 @@ class Trainer:
         reward_list = []
         distance_score_list = []
         failed = False
-        ani_frames = []
 
         self.logger.change_mode(mode=mode)  # Change mode
         self.logger.clear_logs()  # Clear logs
@@ -236,6 +358,7 @@ class Trainer:
                        or self.params.logger.live_plotter.live_trajectory.show)
 
         if visual_flag:
+            import matplotlib.pyplot as plt
             plt.ion()
 
         for step in range(self.agent_params.max_evaluation_steps):
@@ -244,8 +367,7 @@ class Trainer:
 
             # Visualize Cart-pole animation
             if self.params.logger.live_plotter.animation.show:
-                frame = self.cartpole.render(mode='rgb_array', idx=step)
-                ani_frames.append(frame)
+                self.cartpole.render(mode='human', idx=step)
 
             # Visualize Live trajectory
             if self.params.logger.live_plotter.live_trajectory.show:
@@ -258,7 +380,7 @@ class Trainer:
                     action_mode=self.logger.action_mode_list[-1],
                     energy=self.logger.energy_list[-1],
                 )
-                plt.pause(0.01)
+                self.logger.live_plotter.poll()
             reward_list.append(r)
             distance_score_list.append(distance_score)
 
@@ -267,38 +389,37 @@ class Trainer:
 
         mean_reward = np.mean(reward_list)
         mean_distance_score = np.mean(distance_score_list)
+        live_plotter = self.logger.live_plotter
+        if live_plotter is not None:
+            live_plotter.stop()
 
-        # Save as a GIF (Cart-pole animation)
+        # Save as a GIF (Cart-pole animation), rendered from the logged states after each step
         if self.params.logger.live_plotter.animation.save_to_gif:
-            if len(ani_frames) == 0:
-                warnings.warn("Failed to save animation as gif, please set animation.show to True")
-            else:
-                logger.debug(f"Animation frames: {ani_frames}")
-                last_frame = ani_frames[-1]
-                for _ in range(5):
-                    ani_frames.append(last_frame)
-                gif_path = self.params.logger.live_plotter.animation.gif_path
-                fps = self.params.logger.live_plotter.animation.fps
-                print(f"Saving animation frames to {gif_path}")
-                imageio.mimsave(gif_path, ani_frames, fps=fps, loop=0)
+            states = self.logger.state_list[1:] + [self.cartpole.state[:4]]
+            gif_path = self.params.logger.live_plotter.animation.gif_path
+            fps = self.params.logger.live_plotter.animation.fps
+            print(f"Saving animation frames to {gif_path}")
+            self.cartpole.save_gif(gif_path, np.asarray(states, dtype=np.float64), fps=fps)
 
         # Save as a GIF (Cart-pole trajectory)
         if self.params.logger.live_plotter.live_trajectory.save_to_gif:
-            if len(ani_frames) == 0:
+            if len(live_plotter.frames) == 0:
                 warnings.warn("Failed to save live trajectory as gif, please set live_trajectory.show to True")
             else:
-                last_frame = self.logger.live_plotter.frames[-1]
+                import imageio  # Only needed for GIF export
+                last_frame = live_plotter.frames[-1]
                 for _ in range(5):
-                    self.logger.live_plotter.frames.append(last_frame)
+                    live_plotter.frames.append(last_frame)
                 gif_path = self.params.logger.live_plotter.live_trajectory.gif_path
                 fps = self.params.logger.live_plotter.live_trajectory.fps
                 print(f"Saving live trajectory frames to {gif_path}")
-                imageio.mimsave(gif_path, self.logger.live_plotter.frames, fps=fps, loop=0)
+                imageio.mimsave(gif_path, live_plotter.frames, fps=fps, loop=0)
 
         # Close and reset
         if visual_flag:
             self.cartpole.close()
-            self.logger.live_plotter.reset()
+            if live_plotter is not None:
+                live_plotter.reset()
             plt.ioff()
             plt.close()
 
@@ -323,7 +444,8 @@ class Trainer:
             )
 
         # Reset live plotter
-        self.logger.live_plotter.reset()
+        if live_plotter is not None:
+            live_plotter.reset()
 
         return mean_reward, mean_distance_score, failed
 
@@ -333,6 +455,19 @@ class Trainer:
 
     def test(self):
         self.evaluation(mode='test', reset_state=self.params.cartpole.initial_condition)
+        self.logger.save_profile()
+        self.logger.close()
+
+    def certify(self):
+        """
+        Monte-Carlo safety certification of the closed loop, without any plotting
+        """
+        from src.trainer.certification import SafetyCertifier
+        certifier = SafetyCertifier(self.params, agent=self.agent, ha_teacher=self.ha_teacher)
+        report = certifier.certify()
+        certifier.save_report(report, os.path.join(self.logger.log_dir, 'certification.json'))
+        self.logger.close()
+        return report
 
     def get_terminal_action(self, state, mode=None):
 
@@ -340,7 +475,8 @@ class Trainer:
         s = np.asarray(state[:4])
 
         # DRL Action
-        drl_raw_action = self.agent.get_action(observations, mode)
+        with profiler.span('actor'):
+            drl_raw_action = self.agent.get_action(observations, mode)
 
         # Add unknown unknowns
         if self.agent_params.unknown_distribution.apply:
@@ -357,15 +493,17 @@ class Trainer:
         # Student Action (Residual form)
         hp_action = drl_action * 1 + phy_action * self.gamma
 
-        # Teacher Action
-        ha_action, dwell_flag = self.ha_teacher.get_action()
+        # Teacher Action (system patch solve when activated)
+        with profiler.span('teacher_action'):
+            ha_action, dwell_flag = self.ha_teacher.get_action()
 
         # Terminal Action by Coordinator
-        terminal_action, action_mode = self.coordinator.get_terminal_action(hp_action=hp_action,
-                                                                            ha_action=ha_action,
-                                                                            plant_state=s,
-                                                                            dwell_flag=dwell_flag,
-                                                                            epsilon=self.ha_teacher.epsilon)
+        with profiler.span('coordinator'):
+            terminal_action, action_mode = self.coordinator.get_terminal_action(hp_action=hp_action,
+                                                                                ha_action=ha_action,
+                                                                                plant_state=s,
+                                                                                dwell_flag=dwell_flag,
+                                                                                epsilon=self.ha_teacher.epsilon)
         logger.debug(f"ha_action: {ha_action}")
         logger.debug(f"hp_action: {hp_action}")
         logger.debug(f"terminal_action: {terminal_action}")
@@ -12,6 +12,7 @@ python -m examples.a1_locomotion_example --show_gui=False --max_time_secs=15 --u
 """
 
 import time
+import atexit
 import hydra
 import pybullet
 import numpy as np
@@ -74,25 +75,19 @@ def mp_patch_start():
     default_kd = np.diag((40., 30., 10., 10., 10., 30.))
 
 
-    lock = mp.Lock()
-    triggered_roll = mp.Value('d', 0)
-    triggered_pitch = mp.Value('d', 0)
-    triggered_yaw = mp.Value('d', 0)
-    # state_update_flag = manager.Value('b', 0)
-    # _f_kp = manager.list(copy.deepcopy(default_kp.reshape(36)))
-    # _f_kd = manager.list(copy.deepcopy(default_kd.reshape(36)))
-    _f_kp = None
-    _f_kd = None
     from src.ha_teacher.ha_teacher import HATeacher
+    from src.ha_teacher.gain_exchange import SharedPatchGain
+    shared_gain = SharedPatchGain(kp=default_kp, kd=default_kd)
+    atexit.register(shared_gain.close)  # Unlink the shared memory block at exit
     print("creating process for patch computing")
     patch_process = mp.Process(
-        # target=HATeacher.patch_compute, args=(triggered_roll, triggered_pitch, triggered_yaw, _f_kp, _f_kd, lock)
-        target=HATeacher.patch_compute, args=()
+        target=HATeacher.patch_compute, args=(shared_gain.name,)
     )
     patch_process.daemon = True
     print("starting patch process")
     patch_process.start()
     print(f"Pid of patch process: {patch_process.pid}")
+    return shared_gain, patch_process
 
 
 @hydra.main(version_base=None, config_path="../config", config_name="base_config.yaml")
@@ -5,6 +5,7 @@ import enum
 import copy
 import time
 import pickle
+import shutil
 import pybullet
 import threading
 import numpy as np
@@ -19,6 +20,7 @@ from omegaconf import DictConfig
 
 # from robot.robot import a1
 from src.hp_student.agents.ddpg import DDPGAgent
+from src.hp_student.networks.actor_runtime import make_actor_runtime
 from src.envs.simulator.worlds import plane_world, abstract_world
 from src.envs.robot.unitree_a1.motors import MotorCommand
 from src.envs.robot.unitree_a1.motors import MotorControlMode
@@ -27,8 +29,10 @@ from src.envs.robot.state_estimator import com_velocity_estimator
 from src.envs.robot.mpc_controller import swing_leg_controller
 from src.envs.robot.mpc_controller import stance_leg_controller_mpc
 from src.envs.robot.mpc_controller import stance_leg_controller_quadprog
-import tensorflow as tf
 from src.hp_student.agents.replay_mem import ReplayMemory
+from src.logger.trajectory_recorder import TrajectoryRecorder
+from src.utils.profiler import profiler
+from src.utils.rt_scheduler import PeriodicScheduler
 
 
 class ControllerMode(enum.Enum):
@@ -66,6 +70,7 @@ class LocomotionController(object):
             vel_estimator_config: DictConfig = None,
             swing_config: DictConfig = None,
             stance_config: DictConfig = None,
+            scheduler_config: DictConfig = None,
             logdir: str = 'logs/',
     ):
         """Initializes the class.
@@ -81,6 +86,7 @@ class LocomotionController(object):
                             coordinate frame has x-forward and z-up.
           swing_params: Parameters for swing leg controller.
           stance_params: Parameters for stance leg controller.
+          scheduler_config: Real-time settings of the control loop in `run` (see `PeriodicScheduler`).
         """
 
         self._robot = robot
@@ -93,6 +99,8 @@ class LocomotionController(object):
         self._swing_config = swing_config
         self._stance_config = stance_config
         self._vel_estimator_config = vel_estimator_config
+        self._scheduler_config = scheduler_config
+        self._scheduler = None
 
         from src.ha_teacher.ha_teacher import HATeacher
         from src.coordinator.coordinator import Coordinator
@@ -111,8 +119,8 @@ class LocomotionController(object):
         # self._prefill_size = 512
         # self._minibatch_size = 512
 
-        # Logs
-        self._logs = []
+        # Logs (streamed to disk by the trajectory recorder)
+        self._recorder = None
         self._logdir = logdir
 
         # Desired v/w
@@ -160,16 +168,18 @@ class LocomotionController(object):
         if self._ddpg_agent is not None:
             self._action_magnitude = np.array(self._ddpg_agent.params.action.magnitude)
 
-        TFLITE_FILE_PATH = 'tf_models/tf_lite/model.tflite'
-        # Load the TFLite model and allocate tensors.
-        self.actor_lite = tf.lite.Interpreter(model_path=TFLITE_FILE_PATH)
-        self.actor_lite.allocate_tensors()
-        # Get input and output tensors.
-        self.lite_input_details = self.actor_lite.get_input_details()
-        self.lite_output_details = self.actor_lite.get_output_details()
+        # Actor runtime for the PhyDRL action (TFLite by default)
+        self.actor_runtime = None
+        if self._ddpg_agent is not None:
+            inference = self._ddpg_agent.params.inference
+            self.actor_runtime = make_actor_runtime(backend=inference.backend,
+                                                    actor=self._ddpg_agent.actor,
+                                                    path=inference.path,
+                                                    shape_observations=len(self._robot_state))
 
         self.hp_action = np.array([0., 0., 0., 0., 0., 0.])
         self.ha_action = np.array([0., 0., 0., 0., 0., 0.])
+        self._last_drl_action = None
         self.reset_controllers()
         self.beta_distribution_noise = np.random.beta(a=0.5, b=0.5, size=6) * 0.5
 
@@ -414,41 +424,39 @@ class LocomotionController(object):
             # Observation
             observation = self.tracking_error
 
-            # s_drl = time.time()
             # drl_action = self._ddpg_agent.get_action(observation, mode='test')
-            drl_action = self.get_action_from_lite(observations=observation)
+            with profiler.span('actor'):
+                drl_action = self.get_action_from_runtime(observations=observation)
             drl_action *= self._action_magnitude
+            self._last_drl_action = drl_action
 
             # print(f"drl_action magnitude: {self._action_magnitude}")
             # print(f"drl_action: {drl_action}")
-            # e_drl = time.time()
-            # print(f"get drl action time: {e_drl - s_drl}")
 
-        # s = time.time()
-        swing_action = self._swing_controller.get_action()
-        # e_swing = time.time()
-        phy_ddq = self._stance_controller.get_model_action()
+        with profiler.span('swing'):
+            swing_action = self._swing_controller.get_action()
+        with profiler.span('model_action'):
+            phy_ddq = self._stance_controller.get_model_action()
         if drl_action is not None:
             self.hp_action = phy_ddq + drl_action
         else:
             self.hp_action = phy_ddq
-        self.ha_action, dwell_flag = self.ha_teacher.get_action()
+        with profiler.span('teacher_action'):
+            self.ha_action, dwell_flag = self.ha_teacher.get_action()
         # print(f"hp_action: {hp_action}")
         # print(f"ha_action: {ha_action}")
-        terminal_stance_ddq, action_mode = self.coordinator.get_terminal_action(hp_action=self.hp_action,
-                                                                                ha_action=self.ha_action,
-                                                                                plant_state=self.tracking_error,
-                                                                                dwell_flag=dwell_flag,
-                                                                                epsilon=self.ha_teacher.epsilon)
-        stance_action, _ = self.stance_leg_controller.map_ddq_to_action(ddq=terminal_stance_ddq)
+        with profiler.span('coordinator'):
+            terminal_stance_ddq, action_mode = self.coordinator.get_terminal_action(hp_action=self.hp_action,
+                                                                                    ha_action=self.ha_action,
+                                                                                    plant_state=self.tracking_error,
+                                                                                    dwell_flag=dwell_flag,
+                                                                                    epsilon=self.ha_teacher.epsilon)
+        with profiler.span('stance_qp'):
+            stance_action, _ = self.stance_leg_controller.map_ddq_to_action(ddq=terminal_stance_ddq)
 
         motor_action = self.get_motor_action(swing_action=swing_action, stance_action=stance_action)
 
         # stance_action, qp_sol = self._stance_controller.get_action(drl_action=drl_action)
-        # e_stance = time.time()
-        # print(f"swing_action time: {e_swing - s}")
-        # print(f"stance_action time: {e_stance - e_swing}")
-        # print(f"total get_action time: {e_stance - s}")
         qp_sol = None
         return motor_action, dict(qp_sol=qp_sol)
 
@@ -480,45 +488,52 @@ class LocomotionController(object):
             self._clear_logging()
 
     def _clear_logging(self):
-        self._logs = []
+        if self._recorder is not None:
+            try:
+                self._recorder.close()
+            except RuntimeError:
+                pass  # Discarded anyway
+            shutil.rmtree(self._recorder.path, ignore_errors=True)  # Discard the records not dumped yet
+            self._recorder = None
 
     def _update_logging(self):
+        if self._recorder is None:
+            log_path = os.path.join(self._logdir, 'log_{}'.format(datetime.now().strftime('%Y_%m_%d_%H_%M_%S')))
+            self._recorder = TrajectoryRecorder(path=log_path)
+
         frame = dict(
             timestamp=self._time_since_reset,
             tracking_error=self.tracking_error,
-            desired_speed=(self._swing_controller.desired_speed,
-                           self._swing_controller.desired_twisting_speed),
+            desired_speed=self._swing_controller.desired_speed,
+            desired_twisting_speed=self._swing_controller.desired_twisting_speed,
             desired_com_height=self._desired_com_height,
-            # step_counter=self._robot.step_counter,
-            # action_counter=self._robot.action_counter,
             base_position=self._robot.base_position,
             base_rpy=self._robot.base_orientation_rpy,
-            # base_vel=self._robot.motor_velocities,
             base_linear_vel_in_body_frame=self._velocity_estimator.com_velocity_in_body_frame,
             base_angular_vel_in_body_frame=self._robot.base_angular_velocity_in_body_frame,
             motor_angles=self._robot.motor_angles,
             motor_vels=self._robot.motor_velocities,
             motor_torques=self._robot.motor_torques,
             foot_contacts=self._robot.foot_contacts,
-            swing_action=self._swing_controller.swing_action,
-            stance_action=self._stance_controller.stance_action,
             stance_ddq=self._stance_controller.stance_ddq,
             stance_ddq_limit=self._stance_controller.stance_ddq_limit,
-            desired_ground_reaction_forces=self._stance_controller.ground_reaction_forces,
-            gait_scheduler_phase=self._gait_scheduler.current_phase.copy(),
-            leg_states=self._gait_scheduler.leg_states,
+            # Forces of all 4 legs (NaN before the first stance solution)
+            desired_ground_reaction_forces=np.broadcast_to(
+                np.asarray(self._stance_controller.ground_reaction_forces, dtype=float), (4, 3)),
+            gait_scheduler_phase=self._gait_scheduler.current_phase,
+            leg_states=[leg_state.value for leg_state in self._gait_scheduler.leg_states],
             ground_orientation=self._velocity_estimator.ground_orientation_in_world_frame,
             student_ddq=self.hp_action,
             teacher_ddq=self.ha_action,
         )
-        self._logs.append(frame)
+        self._recorder.record(frame)
 
     def _flush_logging(self):
-        if not os.path.exists(self._logdir):
-            os.makedirs(self._logdir)
-        filename = 'log_{}.pkl'.format(datetime.now().strftime('%Y_%m_%d_%H_%M_%S'))
-        pickle.dump(self._logs, open(os.path.join(self._logdir, filename), 'wb'))
-        logging.info("Data logged to: {}".format(os.path.join(self._logdir, filename)))
+        if self._recorder is None:
+            return
+        self._recorder.close()
+        logging.info("Data logged to: {}".format(self._recorder.path))
+        self._recorder = None
 
     def _handle_gait_switch(self):
         print("Entering _handle_gait_switch")
@@ -544,18 +559,25 @@ class LocomotionController(object):
 
     def run(self):
         # logging.info("Low level thread started...")
-        curr_time = time.time()
         # print(f"control_thread: {self.control_thread}")
+        cfg = self._scheduler_config if self._scheduler_config is not None else {}
+        scheduler = PeriodicScheduler(period=self._robot.control_timestep, **cfg)
+        self._scheduler = scheduler
+        scheduler.setup()
+        scheduler.start()
+        curr_time = time.time()
 
         while self._is_control:
 
             # self._handle_mode_switch()
             # self._handle_gait_switch()
-            self.update()
+            with scheduler.stage('controller_update'):
+                self.update()
 
             s = self.tracking_error
             # print(f"self._robot_state: {self._robot_state}")
-            self.ha_teacher.update(error_state=s)  # Teacher update
+            with scheduler.stage('teacher_update'):
+                self.ha_teacher.update(error_state=s)  # Teacher update
 
             # logging.debug(f"vx: {self._stance_controller.desired_speed}")
             # logging.debug(f"mode is: {self.mode}")
@@ -571,13 +593,15 @@ class LocomotionController(object):
             #     # time.sleep(0.001)
 
             if self._mode == ControllerMode.WALK:
-                s_action = time.time()
-                if self._ddpg_agent is not None:
-                    # action, qp_sol = self.get_phydrl_action()
-                    action, qp_sol = self.get_action(phydrl=True)
-                else:
-                    action, qp_sol = self.get_action(phydrl=False)
-                e_action = time.time()
+                with scheduler.stage('get_action'):
+                    if self._ddpg_agent is not None:
+                        # Late on the deadline: keep the last PhyDRL action instead of running the actor again
+                        if scheduler.skip('reuse_drl_action') and self._last_drl_action is not None:
+                            action, qp_sol = self.get_action(phydrl=True, drl_action=self._last_drl_action)
+                        else:
+                            action, qp_sol = self.get_action(phydrl=True)
+                    else:
+                        action, qp_sol = self.get_action(phydrl=False)
 
                 # s3 = time.time()
                 # Terminal Action by Coordinator
@@ -585,30 +609,30 @@ class LocomotionController(object):
                 # logger.debug(f"hp_action: {hp_action}")
 
                 # time.sleep(0.001)
-                ss = time.time()
-                self._robot.step(action)
-                ee = time.time()
+                with scheduler.stage('robot_step'):
+                    self._robot.step(action)
 
-                # s_log = time.time()
-                self._update_logging()
-                # e_log = time.time()
-                # print(f"log update time: {e_log - s_log}")
-                print(f"get action duration: {e_action - s_action}")
-                print(f"step duration: {ee - ss}")
+                if not scheduler.skip('skip_logging'):
+                    with scheduler.stage('logging'):
+                        self._update_logging()
 
             else:
                 logging.info("Running loop terminated, exiting...")
                 break
 
+            # Sleep until the next absolute deadline (no drift from the time spent in this tick)
+            scheduler.wait()
             final_time = time.time()
-            duration = final_time - curr_time
+            profiler.record('control_period', (final_time - curr_time) * 1e9)
             curr_time = final_time
-            print(f"running times in this loop:{duration}")
-            if duration < self._robot.control_timestep:
-                compensate_time = self._robot.control_timestep - duration
-                time.sleep(compensate_time)
             # print("+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
 
+        print(f"Control loop timing:\n{scheduler}")
+
+    @property
+    def scheduler(self):
+        return self._scheduler
+
     def set_controller_mode(self, mode):
         self._desired_mode = mode
 
@@ -747,20 +771,8 @@ class LocomotionController(object):
     def set_foot_landing_clearance(self, foot_landing_clearance):
         raise NotImplementedError()
 
-    def get_action_from_lite(self, observations):
-        # print("entering get_exploitation_action!")
-        import time
-        s = time.time()
-
-        observations = tf.cast([observations], tf.float16)
-        # observations_tensor = tf.expand_dims(observations, 0)
-        self.actor_lite.set_tensor(self.lite_input_details[0]['index'], observations)
-        self.actor_lite.invoke()
-        action_exploitation = self.actor_lite.get_tensor(self.lite_output_details[0]['index'])
-        print(f"action_exploitation: {action_exploitation}")
-        e = time.time()
-        print(f"get exploitation action time:{e - s}")
-        action = np.array(np.squeeze(action_exploitation))
+    def get_action_from_runtime(self, observations):
+        action = np.array(self.actor_runtime(observations), dtype=float)
 
         action += self.beta_distribution_noise
         action = np.clip(action, -1.0, 1.0)
@@ -0,0 +1,108 @@
+"""Micro-benchmark of the QPTorqueOptimizer backends at a 500 Hz control rate.
+
+Replays (foot_positions, desired_acc, contacts) tuples through every backend and
+reports the per-tick latency (problem setup and solve) and the solve alone (the
+`qp_solve` span) against the 2 ms control period, along with the largest
+deviation from the cold-started quadprog solution.
+
+    python -m src.envs.robot.mpc_controller.qp_benchmark
+    python -m src.envs.robot.mpc_controller.qp_benchmark --data qp_problems.npz
+
+The recorded problems are an npz file with `foot_positions` (N, 4, 3),
+`desired_acc` (N, 6) and `contacts` (N, 4). Without one, a trotting sequence
+around the nominal A1 stance is synthesized.
+"""
+
+import time
+import argparse
+import numpy as np
+
+from src.envs.robot.mpc_controller.qp_torque_optimizer import QPTorqueOptimizer, QP_BACKENDS
+from src.utils.profiler import profiler
+
+CONTROL_FREQUENCY = 500
+
+BODY_MASS = 110 / 9.8
+BODY_INERTIA = np.array((0.07335, 0, 0, 0, 0.25068, 0, 0, 0, 0.25447))
+ACC_WEIGHTS = np.array([1, 1, 1, 10, 10, 1])
+NOMINAL_FOOT_POSITIONS = np.array([[0.17, -0.135, -0.24],
+                                   [0.17, 0.135, -0.24],
+                                   [-0.195, -0.135, -0.24],
+                                   [-0.195, 0.135, -0.24]])
+
+
+def synthesize_problems(num_steps, gait_period=0.3, seed=0):
+    """Trotting gait: diagonal leg pairs alternate, with a short four-leg stance in between."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_steps) / CONTROL_FREQUENCY
+    phase = (t / gait_period) % 1.
+
+    contacts = np.ones((num_steps, 4), dtype=np.int32)
+    swing_a = (phase > 0.05) & (phase < 0.5)
+    swing_b = phase > 0.55
+    contacts[swing_a, 0] = contacts[swing_a, 3] = 0
+    contacts[swing_b, 1] = contacts[swing_b, 2] = 0
+
+    sway = np.stack([0.02 * np.sin(2 * np.pi * t / gait_period),
+                     0.01 * np.cos(2 * np.pi * t / gait_period),
+                     0.01 * np.sin(4 * np.pi * t / gait_period)], axis=1)
+    foot_positions = NOMINAL_FOOT_POSITIONS[None] + sway[:, None] + rng.normal(0, 2e-3, (num_steps, 4, 3))
+
+    desired_acc = np.stack([0.5 * np.sin(2 * np.pi * t), 0.2 * np.cos(2 * np.pi * t),
+                            0.5 * np.sin(4 * np.pi * t / gait_period),
+                            2. * np.sin(2 * np.pi * t / gait_period),
+                            2. * np.cos(2 * np.pi * t / gait_period),
+                            0.3 * np.sin(np.pi * t)], axis=1)
+    desired_acc += rng.normal(0, 0.05, desired_acc.shape)
+    return foot_positions, desired_acc, contacts
+
+
+def load_problems(path):
+    with np.load(path) as data:
+        return data['foot_positions'], data['desired_acc'], data['contacts']
+
+
+def run_backend(backend, problems, friction_coef, reg_weight):
+    optimizer = QPTorqueOptimizer(robot_mass=BODY_MASS, robot_inertia=BODY_INERTIA,
+                                  friction_coef=friction_coef, backend=backend)
+    profiler.reset()
+    latencies = np.zeros(len(problems[0]))
+    forces = np.zeros((len(problems[0]), 4, 3))
+    for i, (foot_positions, desired_acc, contacts) in enumerate(zip(*problems)):
+        start = time.perf_counter_ns()
+        forces[i] = optimizer.compute_contact_force(foot_positions, desired_acc, contacts,
+                                                    acc_weights=ACC_WEIGHTS, reg_weight=reg_weight)
+        latencies[i] = time.perf_counter_ns() - start
+    return latencies / 1e3, profiler.summary()['qp_solve'], forces, optimizer.solver
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-solve latency of the QP torque optimizer backends")
+    parser.add_argument('--data', type=str, default=None, help='Recorded problems (.npz), synthesized if not given')
+    parser.add_argument('--steps', type=int, default=5000, help='Number of synthesized control steps')
+    parser.add_argument('--friction', type=float, default=0.45, help='Friction coefficient')
+    parser.add_argument('--reg_weight', type=float, default=1e-4, help='Force regularization weight')
+    args = parser.parse_args()
+
+    profiler.enabled = True
+    problems = load_problems(args.data) if args.data else synthesize_problems(args.steps)
+    budget_us = 1e6 / CONTROL_FREQUENCY
+    print(f"{len(problems[0])} problems, {budget_us:.0f} us control period at {CONTROL_FREQUENCY} Hz")
+    print(f"{'backend':<12}{'mean (us)':>12}{'p50 (us)':>12}{'p99 (us)':>12}{'max (us)':>12}"
+          f"{'budget (%)':>12}{'solve p50':>12}{'solve p99':>12}{'max |df| (N)':>14}")
+
+    reference = None
+    for backend in QP_BACKENDS:
+        latencies, solve, forces, solver = run_backend(backend, problems, args.friction, args.reg_weight)
+        if reference is None:
+            reference = forces
+        print(f"{backend:<12}{latencies.mean():>12.1f}{np.percentile(latencies, 50):>12.1f}"
+              f"{np.percentile(latencies, 99):>12.1f}{latencies.max():>12.1f}"
+              f"{100 * np.percentile(latencies, 99) / budget_us:>12.1f}{solve['p50_us']:>12.1f}"
+              f"{solve['p99_us']:>12.1f}{np.abs(forces - reference).max():>14.2e}")
+        if solver is not None:
+            print(f"{'':<12}warm solves: {solver.warm_solves}, quadprog fallbacks: {solver.cold_solves}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,15 +4,121 @@ For details, please refer to this paper:
 https://arxiv.org/abs/2009.10019
 """
 
-import time
 import numpy as np
 import quadprog  # pytype:disable=import-error
 
+from src.utils.profiler import profiler
+
 np.set_printoptions(precision=3, suppress=True)
 
 
 # ACC_WEIGHT = np.array([1., 1., 1., 10., 10, 1.])
 
+QP_BACKENDS = ('quadprog', 'warm_start')
+
+
+def contact_pattern(contacts):
+    return (np.asarray(contacts) != 0).tobytes()
+
+
+class WarmStartQPSolver:
+    """Active-set solver for the contact force QP, warm-started across control ticks.
+
+    Solves min 1/2 x^T G x - a^T x s.t. A x >= b for the constant constraint matrix A
+    of QPTorqueOptimizer. The bounds pin swing legs to (almost) zero force, so for a
+    given contact pattern the QP reduces to the forces and constraint rows of the
+    stance legs. Each solve starts from the previous tick's working set and runs a
+    few primal active-set steps on the reduced KKT system; at 500 Hz the working set
+    rarely changes between ticks. A point is only returned if it satisfies the KKT
+    conditions within `tol`, with swing forces exactly zero (quadprog keeps them
+    within +-1e-7 N). On a new contact pattern, or without convergence within
+    `max_iter` steps, it falls back to a cold quadprog solve of the full problem.
+    """
+
+    def __init__(self, A, max_iter=4, tol=1e-9):
+        self.A = A
+        self.C = np.ascontiguousarray(A.T)
+        self.max_iter = max_iter
+        self.tol = tol
+
+        self._reduced_problems = {}  # Contact pattern -> (stance columns, their G block index, stance rows, A block)
+        self._pattern = None
+        self._reduced = None
+        self._active = None  # Working set, as rows of the reduced problem
+        self.warm_solves = 0
+        self.cold_solves = 0
+
+    def reset(self):
+        self._pattern = None
+        self._reduced = None
+        self._active = None
+
+    def _reduced_problem(self, pattern, contacts):
+        reduced = self._reduced_problems.get(pattern)
+        if reduced is None:
+            legs = np.flatnonzero(contacts)[:, None]
+            cols = (legs * 3 + np.arange(3)).ravel()
+            rows = np.concatenate(((legs * 2 + np.arange(2)).ravel(), (8 + legs * 4 + np.arange(4)).ravel()))
+            reduced = self._reduced_problems[pattern] = (cols, np.ix_(cols, cols), rows, self.A[np.ix_(rows, cols)])
+        return reduced
+
+    def solve(self, G, a, b, contacts, pattern=None):
+        pattern = contact_pattern(contacts) if pattern is None else pattern
+        if pattern == self._pattern:
+            try:
+                x = self._warm_solve(G, a, b)
+            except np.linalg.LinAlgError:
+                x = None
+            if x is not None:
+                self.warm_solves += 1
+                return x
+
+        result = quadprog.solve_qp(G, a, self.C, b)
+        self._pattern = pattern
+        self._reduced = self._reduced_problem(pattern, contacts)
+        self._active = np.flatnonzero(result[4][self._reduced[2]] > 0)
+        self.cold_solves += 1
+        return result[0]
+
+    def _warm_solve(self, G, a, b):
+        cols, cols_ix, rows, A_s = self._reduced
+        x = np.zeros(len(a))
+        if not cols.size:
+            return x
+
+        G_s, a_s, b_s = G[cols_ix], a[cols], b[rows]
+        n = len(cols)
+        active = self._active
+        for _ in range(self.max_iter):
+            if active.size:
+                # Equality-constrained QP on the working set: [G, -A_w^T; A_w, 0] [x; lambda] = [a; b_w]
+                A_w = A_s[active]
+                kkt = np.zeros((n + active.size, n + active.size))
+                kkt[:n, :n] = G_s
+                kkt[:n, n:] = -A_w.T
+                kkt[n:, :n] = A_w
+                solution = np.linalg.solve(kkt, np.concatenate((a_s, b_s[active])))
+                x_s, lagrangian = solution[:n], solution[n:]
+
+                worst = lagrangian.argmin()
+                if lagrangian[worst] < -self.tol:
+                    active = np.delete(active, worst)
+                    continue
+            else:
+                x_s = np.linalg.solve(G_s, a_s)
+
+            violation = b_s - A_s.dot(x_s)
+            worst = violation.argmax()
+            if violation[worst] > self.tol * (1. + abs(b_s[worst])):
+                active = np.append(active, worst)
+                continue
+
+            self._active = active
+            x[cols] = x_s
+            return x
+
+        return None
+
 
 class QPTorqueOptimizer:
     """QP Torque Optimizer Class."""
@@ -22,7 +128,8 @@ class QPTorqueOptimizer:
                  robot_inertia,
                  friction_coef=0.45,
                  f_min_ratio=0.1,
-                 f_max_ratio=10.):
+                 f_max_ratio=10.,
+                 backend='quadprog'):
         self.mpc_body_mass = robot_mass
         self.inv_mass = np.eye(3) / robot_mass
 
@@ -64,55 +171,63 @@ class QPTorqueOptimizer:
             self.A[row_id + 3,
             col_id:col_id + 3] = np.array([0, -1, self.friction_coef])
 
-    def compute_mass_matrix(self, foot_positions):
-        mass_mat = np.zeros((6, 12))
-        mass_mat[:3] = np.concatenate([self.inv_mass] * 4, axis=1)
+        # Constant parts reused by every solve
+        self.C = np.ascontiguousarray(self.A.T)
+        self.g = np.array([0., 0., 9.8, 0., 0., 0.])
+        self._mass_mat = np.zeros((6, 12))
+        self._mass_mat[:3] = np.concatenate([self.inv_mass] * 4, axis=1)
 
+        # The angular rows inv_inertia * skew(foot_position) are linear in the foot positions, keep that map (36, 12)
+        self._skew_map = np.zeros((3, 12, 12))
         for leg_id in range(4):
-            x = foot_positions[leg_id]
-            foot_position_skew = np.array([[0, -x[2], x[1]], [x[2], 0, -x[0]],
-                                           [-x[1], x[0], 0]])
-            mass_mat[3:6, leg_id * 3:leg_id * 3 + 3] = \
-                self.inv_inertia.dot(foot_position_skew)
+            for axis in range(3):
+                x = np.zeros(3)
+                x[axis] = 1
+                foot_position_skew = np.array([[0, -x[2], x[1]], [x[2], 0, -x[0]],
+                                               [-x[1], x[0], 0]])
+                self._skew_map[:, leg_id * 3:leg_id * 3 + 3, leg_id * 3 + axis] = \
+                    self.inv_inertia.dot(foot_position_skew)
+        self._skew_map = self._skew_map.reshape((36, 12))
+
+        self._lower_bounds = {}  # Contact pattern -> lb
+        self._G_reg = 1e-4 * np.eye(12)
+
+        if backend == 'quadprog':
+            self.solver = None
+        elif backend == 'warm_start':
+            self.solver = WarmStartQPSolver(self.A)
+        else:
+            raise RuntimeError(f"Unknown QP backend: {backend}, choose from {QP_BACKENDS}")
+
+    def compute_mass_matrix(self, foot_positions):
+        mass_mat = self._mass_mat.copy()
+        mass_mat[3:6] = self._skew_map.dot(np.ravel(foot_positions)).reshape((3, 12))
         return mass_mat
 
-    def compute_constraint_matrix(self, contacts):
-        f_min = self.f_min_ratio * self.mpc_body_mass * 9.8
-        f_max = self.f_max_ratio * self.mpc_body_mass * 9.8
-        lb = np.ones(24) * (-1e-7)
-        contact_ids = np.nonzero(contacts)[0]
-        lb[contact_ids * 2] = f_min
-        lb[contact_ids * 2 + 1] = -f_max
-        return self.A.T, lb
+    def compute_constraint_matrix(self, contacts, key=None):
+        key = contact_pattern(contacts) if key is None else key
+        lb = self._lower_bounds.get(key)
+        if lb is None:
+            f_min = self.f_min_ratio * self.mpc_body_mass * 9.8
+            f_max = self.f_max_ratio * self.mpc_body_mass * 9.8
+            lb = np.ones(24) * (-1e-7)
+            contact_ids = np.nonzero(contacts)[0]
+            lb[contact_ids * 2] = f_min
+            lb[contact_ids * 2 + 1] = -f_max
+            self._lower_bounds[key] = lb
+        return self.C, lb
 
     def compute_objective_matrix(self, mass_matrix, desired_acc, acc_weights,
                                  reg_weight):
-        s = time.time()
-
-        g = np.array([0., 0., 9.8, 0., 0., 0.])
-        e11 = time.time()
-        Q = np.diag(acc_weights)
-        e12 = time.time()
+        # Q = diag(acc_weights), applied as a row scaling of the mass matrix
+        weighted_mass_matrix = np.asarray(acc_weights)[:, None] * mass_matrix
 
-        R = np.ones(12) * reg_weight
-        e13 = time.time()
+        # R = np.ones(12) * reg_weight, broadcast over all entries
         # R = np.ones(12) * reg_weight * 0.001
 
-        e1 = time.time()
-
-        quad_term = mass_matrix.T.dot(Q).dot(mass_matrix) + R
-
-        e2 = time.time()
-
-        linear_term = 1 * (g + desired_acc).T.dot(Q).dot(mass_matrix)
+        quad_term = mass_matrix.T.dot(weighted_mass_matrix) + reg_weight
 
-        e3 = time.time()
-        # print(f"compute_objective time 1: {e1 - s}")
-        # print(f"compute_objective time 11: {e11 - s}")
-        # print(f"compute_objective time 12: {e12 - e11}")
-        # print(f"compute_objective time 13: {e13 - e12}")
-        # print(f"compute_objective time 2: {e2 - e1}")
-        # print(f"compute_objective time 3: {e3 - e2}")
+        linear_term = 1 * (self.g + desired_acc).dot(weighted_mass_matrix)
 
         # g = np.array([0., 0., 9.8, 0., 0., 0.])
         # Q = np.diag(acc_weights)
@@ -138,10 +253,15 @@ class QPTorqueOptimizer:
         mass_matrix = self.compute_mass_matrix(foot_positions)
         G, a = self.compute_objective_matrix(mass_matrix, desired_acc, acc_weights,
                                              reg_weight)
-        C, b = self.compute_constraint_matrix(contacts)
-        G += 1e-4 * np.eye(12)
+        pattern = contact_pattern(contacts)
+        C, b = self.compute_constraint_matrix(contacts, pattern)
+        G += self._G_reg
 
-        result = quadprog.solve_qp(G, a, C, b)
+        with profiler.span('qp_solve'):
+            if self.solver is None:
+                x = quadprog.solve_qp(G, a, C, b)[0]
+            else:
+                x = self.solver.solve(G, a, b, contacts, pattern)
 
         # print(f"contacts: {contacts}")
         # print(f"mpc_body_mass: {self.mpc_body_mass}")
@@ -149,6 +269,6 @@ class QPTorqueOptimizer:
         # print(f"a: {a}")
         # print(f"C: {C}")
         # print(f"b: {b}")
-        # print(f"result: {result}")
+        # print(f"x: {x}")
 
-        return -result[0].reshape((4, 3))
+        return -x.reshape((4, 3))
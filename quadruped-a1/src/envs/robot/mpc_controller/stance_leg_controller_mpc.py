@@ -16,6 +16,7 @@ import time
 
 from src.envs.robot.unitree_a1.motors import MotorCommand
 from src.envs.robot.gait_scheduler import gait_scheduler as gait_scheduler_lib
+from src.utils.profiler import profiler
 
 try:
     import mpc_osqp as convex_mpc  # pytype: disable=import-error
@@ -169,7 +170,7 @@ class TorqueStanceLegController:
         """Computes the torque for stance legs."""
 
         ############################################## Part 1 ##############################################
-        s1 = time.time()
+        s1 = profiler.tic()
         desired_com_position = np.array(
             (0., 0., self._desired_body_height), dtype=np.float64)
 
@@ -196,11 +197,10 @@ class TorqueStanceLegController:
             logging.info("No foot in contact...")
             return {}, None
 
-        e1 = time.time()
-        print(f".....................................part 1 time: {e1 - s1}")
+        profiler.toc('mpc_targets', s1)
 
         ############################################## Part 2 ##############################################
-        s2 = time.time()
+        s2 = profiler.tic()
         if self._future_contact_estimate is not None:
             contact_estimates = self._future_contact_estimate.copy()
             contact_estimates[0] = foot_contact_states
@@ -212,11 +212,10 @@ class TorqueStanceLegController:
             # print(f"foot_contact_state is: {foot_contact_state}")
             # print(f"contact_estimates is: {contact_estimates}")
 
-        e2 = time.time()
-        print(f".....................................part 2 time: {e2 - s2}")
+        profiler.toc('mpc_contacts', s2)
 
         ############################################## Part 3 ##############################################
-        s3 = time.time()
+        s3 = profiler.tic()
         # com_position = np.array(self._robot.base_position)
         robot_com_position = np.array(self._state_estimator.com_position_in_ground_frame)
 
@@ -247,14 +246,13 @@ class TorqueStanceLegController:
         # print("Gravity projection: {}".format(gravity_projection_vec))
         # print("Com RPY Rate: {}".format(self._robot.base_rpy_rate))
         p.submitProfileTiming("predicted_contact_forces")
-        e3 = time.time()
-        print(f".....................................part 3 time: {e3 - s3}")
+        profiler.toc('mpc_state', s3)
 
         robot_q = np.hstack((robot_com_position, robot_com_roll_pitch_yaw))
         robot_dq = np.hstack((robot_com_velocity, robot_com_roll_pitch_yaw_rate))
 
         ############################################## Part 4 ##############################################
-        s4 = time.time()
+        s4 = profiler.tic()
 
         # All computations are conducted under the body ground frame
         predicted_contact_forces = self._cpp_mpc.compute_contact_forces(
@@ -306,11 +304,10 @@ class TorqueStanceLegController:
         # pdb.set_trace()
         # input("Any Key...")
 
-        e4 = time.time()
-        print(f".....................................part 4 time: {e4 - s4}")
+        profiler.toc('mpc_solve', s4)
 
         ############################################## Part 5 ##############################################
-        s5 = time.time()
+        s5 = profiler.tic()
 
         contact_forces = {}
         contact_forces_record = []
@@ -335,8 +332,7 @@ class TorqueStanceLegController:
                                                 kd=0,
                                                 desired_torque=torque)
         # print("After IK: {}".format(time.time() - start_time))
-        e5 = time.time()
-        print(f".....................................part 5 time: {e5 - s5}")
+        profiler.toc('mpc_torques', s5)
 
         # Save values for record
         self._stance_action = action
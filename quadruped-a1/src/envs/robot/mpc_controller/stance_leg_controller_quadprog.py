@@ -85,7 +85,8 @@ class TorqueStanceLegController:
         self._qp_torque_optimizer = qp_torque_optimizer.QPTorqueOptimizer(
             robot_mass=self._body_mass,
             robot_inertia=self._body_inertia,
-            friction_coef=self._params.friction_coeff
+            friction_coef=self._params.friction_coeff,
+            backend=self._params.qp_backend
         )
 
         # Variables for recording
@@ -103,6 +103,7 @@ class A1(QuadrupedRobot):
             swing_config=self._swing_params,
             stance_config=self._stance_params,
             vel_estimator_config=self._vel_estimator_params,
+            scheduler_config=self._a1_params.get('scheduler', None),
             logdir=logdir
         )
 
@@ -0,0 +1,124 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+# Layout of the shared block in 8-byte words
+REQUEST_SEQ = 0  # Seqlock of the request slot (odd while the control loop writes it)
+REQUEST_RPY = 1  # Triggered roll, pitch, yaw (float64 x 3)
+LATEST = 4  # Index of the most recently published gain buffer
+VERSION = 5  # Number of published gains
+HEADER_WORDS = 8
+
+# Gain buffer: seqlock, version, answered request seq, kp (36), kd (36)
+BUFFER_SEQ = 0
+BUFFER_VERSION = 1
+BUFFER_REQUEST = 2
+BUFFER_GAINS = 3
+BUFFER_WORDS = BUFFER_GAINS + 72
+NUM_BUFFERS = 2
+
+SHM_SIZE = 8 * (HEADER_WORDS + NUM_BUFFERS * BUFFER_WORDS)
+
+
+class SharedPatchGain:
+    """
+    Lock-free exchange of the HA-Teacher patch between the control loop and the patch process
+
+    One `multiprocessing.shared_memory` block holds a request slot (roll, pitch, yaw of the triggered state, written
+    by the control loop) and two gain buffers (kp, kd, written by the patch process). Every slot has a single writer
+    and is guarded by a seqlock: the writer makes the sequence odd, writes, then makes it even again, and readers
+    retry if the sequence was odd or changed while copying. The patch process writes the buffer that is not the
+    latest one and then flips `LATEST`, so a reader only has to retry if two gains were published while it copied.
+
+    The seqlocks rely on stores becoming visible to the other process in program order, as on x86. Create the block
+    in the control process, then attach to it by `name` in the patch process.
+    """
+
+    def __init__(self, kp=None, kd=None, name=None):
+        self._owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self._owner, size=SHM_SIZE)
+        num_words = SHM_SIZE // 8
+        self._words = np.ndarray((num_words,), dtype=np.uint64, buffer=self.shm.buf)
+        self._values = np.ndarray((num_words,), dtype=np.float64, buffer=self.shm.buf)
+
+        if self._owner:
+            self._words[:] = 0
+            if kp is not None and kd is not None:
+                self.publish(kp, kd)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @staticmethod
+    def _base(buffer):
+        return HEADER_WORDS + buffer * BUFFER_WORDS
+
+    # Control loop side
+    def request(self, roll, pitch, yaw):
+        """
+        Ask the patch process for a gain at the triggered (roll, pitch, yaw), returns the request seq
+        """
+        self._words[REQUEST_SEQ] += 1
+        self._values[REQUEST_RPY:REQUEST_RPY + 3] = (roll, pitch, yaw)
+        self._words[REQUEST_SEQ] += 1
+        return int(self._words[REQUEST_SEQ])
+
+    @property
+    def version(self):
+        """
+        Number of gains published so far, cheap to poll before `read`
+        """
+        return int(self._words[VERSION])
+
+    def read(self, max_retries=100):
+        """
+        Latest consistent gain as (kp (6, 6), kd (6, 6), version, answered request seq), without taking locks
+        """
+        for _ in range(max_retries):
+            base = self._base(int(self._words[LATEST]))
+            seq = int(self._words[base + BUFFER_SEQ])
+            if seq & 1:
+                continue
+            gains = self._values[base + BUFFER_GAINS:base + BUFFER_WORDS].copy()
+            version = int(self._words[base + BUFFER_VERSION])
+            request_seq = int(self._words[base + BUFFER_REQUEST])
+            if int(self._words[base + BUFFER_SEQ]) == seq:
+                return gains[:36].reshape(6, 6), gains[36:].reshape(6, 6), version, request_seq
+        raise RuntimeError(f"No consistent patch gain after {max_retries} retries")
+
+    # Patch process side
+    def poll_request(self, last_seq=0):
+        """
+        The request newer than `last_seq` as (seq, (roll, pitch, yaw)), or None
+        """
+        seq = int(self._words[REQUEST_SEQ])
+        if seq == last_seq or seq & 1:
+            return None
+        roll, pitch, yaw = self._values[REQUEST_RPY:REQUEST_RPY + 3].tolist()
+        if int(self._words[REQUEST_SEQ]) != seq:
+            return None
+        return seq, (roll, pitch, yaw)
+
+    def publish(self, kp, kd, request_seq=0):
+        """
+        Write the gain into the spare buffer and make it the latest one
+        """
+        buffer = 1 - int(self._words[LATEST])
+        base = self._base(buffer)
+        version = int(self._words[VERSION]) + 1
+        self._words[base + BUFFER_SEQ] += 1
+        self._words[base + BUFFER_VERSION] = version
+        self._words[base + BUFFER_REQUEST] = request_seq
+        self._values[base + BUFFER_GAINS:base + BUFFER_GAINS + 36] = np.ravel(kp)
+        self._values[base + BUFFER_GAINS + 36:base + BUFFER_WORDS] = np.ravel(kd)
+        self._words[base + BUFFER_SEQ] += 1
+        self._words[LATEST] = buffer
+        self._words[VERSION] = version
+        return version
+
+    def close(self):
+        # Drop the views before closing, the buffer cannot be released while they are alive
+        self._words = self._values = None
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
@@ -0,0 +1,111 @@
+"""Latency of the patch gain exchange: multiprocessing.Manager proxies vs. SharedPatchGain.
+
+A writer process keeps publishing gains filled with its version number (as the patch
+process would, only much faster), while the control side reads them. Reads that mix
+two versions are counted as torn.
+
+    python -m src.ha_teacher.gain_exchange_benchmark
+"""
+
+import time
+import argparse
+import numpy as np
+import multiprocessing as mp
+
+from src.ha_teacher.gain_exchange import SharedPatchGain
+
+
+def _manager_writer(f_kp, f_kd, stop, interval):
+    version = 0
+    while not stop.is_set():
+        version += 1
+        for i in range(36):
+            f_kp[i] = float(version)
+            f_kd[i] = float(version)
+        time.sleep(interval)
+
+
+def _shared_writer(shm_name, stop, interval):
+    shared_gain = SharedPatchGain(name=shm_name)
+    version = 0
+    while not stop.is_set():
+        version += 1
+        shared_gain.publish(np.full(36, float(version)), np.full(36, float(version)))
+        time.sleep(interval)
+    shared_gain.close()
+
+
+def time_reads(read, num_reads):
+    latencies = np.zeros(num_reads)
+    torn = 0
+    for i in range(num_reads):
+        start = time.perf_counter_ns()
+        kp, kd = read()
+        latencies[i] = time.perf_counter_ns() - start
+        torn += not (np.all(kp == kp.flat[0]) and np.all(kd == kp.flat[0]))
+    return latencies / 1e3, torn
+
+
+def time_calls(call, num_calls):
+    latencies = np.zeros(num_calls)
+    for i in range(num_calls):
+        start = time.perf_counter_ns()
+        call(i)
+        latencies[i] = time.perf_counter_ns() - start
+    return latencies / 1e3
+
+
+def report(name, latencies, torn=None):
+    line = (f"{name:<28}{np.percentile(latencies, 50):>12.1f}{np.percentile(latencies, 99):>12.1f}"
+            f"{latencies.max():>12.1f}")
+    print(line + (f"{torn:>8d}/{len(latencies)}" if torn is not None else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Patch gain exchange latency (Manager vs. shared memory)")
+    parser.add_argument('--reads', type=int, default=20000, help='Gain reads through shared memory')
+    parser.add_argument('--manager_reads', type=int, default=200, help='Gain reads through Manager proxies')
+    parser.add_argument('--interval', type=float, default=1e-3, help='Seconds between two published gains')
+    args = parser.parse_args()
+
+    print(f"{'':<28}{'p50 (us)':>12}{'p99 (us)':>12}{'max (us)':>12}{'torn':>14}")
+
+    # Current path: Manager values for roll/pitch/yaw and list proxies for the 36 gains
+    manager = mp.Manager()
+    roll, pitch, yaw = manager.Value('d', 0), manager.Value('d', 0), manager.Value('d', 0)
+    f_kp, f_kd = manager.list([0.] * 36), manager.list([0.] * 36)
+    stop = mp.Event()
+    writer = mp.Process(target=_manager_writer, args=(f_kp, f_kd, stop, args.interval), daemon=True)
+    writer.start()
+    time.sleep(0.2)
+
+    def write_manager_request(i):
+        roll.value, pitch.value, yaw.value = 0.01 * i, 0.02 * i, 0.03 * i
+
+    report("manager request", time_calls(write_manager_request, args.manager_reads))
+    report("manager read (element-wise)",
+           *time_reads(lambda: (np.array([f_kp[i] for i in range(36)]), np.array([f_kd[i] for i in range(36)])),
+                       args.manager_reads))
+    report("manager read (slice)", *time_reads(lambda: (np.array(f_kp[:]), np.array(f_kd[:])), args.manager_reads))
+    stop.set()
+    writer.join()
+    manager.shutdown()
+
+    # Shared memory: seqlock-protected request slot and double-buffered gains
+    shared_gain = SharedPatchGain(kp=np.zeros(36), kd=np.zeros(36))
+    stop = mp.Event()
+    writer = mp.Process(target=_shared_writer, args=(shared_gain.name, stop, args.interval), daemon=True)
+    writer.start()
+    time.sleep(0.2)
+
+    report("shared request", time_calls(lambda i: shared_gain.request(0.01 * i, 0.02 * i, 0.03 * i), args.reads))
+    report("shared version poll", time_calls(lambda i: shared_gain.version, args.reads))
+    report("shared read", *time_reads(lambda: shared_gain.read()[:2], args.reads))
+    stop.set()
+    writer.join()
+    print(f"Gains published by the shared-memory writer: {shared_gain.version}")
+    shared_gain.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import sys
 import copy
+import atexit
 import enum
 import time
 import ctypes
@@ -24,6 +25,9 @@ from numpy.linalg import pinv
 from src.physical_design import MATRIX_P
 from scipy.linalg import solve_continuous_are, inv
 from src.utils.utils import energy_value
+from src.ha_teacher.gain_exchange import SharedPatchGain
+from src.ha_teacher.patch_problem import get_patch_problem
+from src.ha_teacher.patch_atlas import PatchAtlas
 from cvxopt import matrix, solvers
 
 
@@ -43,6 +47,10 @@ class HATeacher:
         self.teacher_enable = teacher_cfg.teacher_enable
         self.teacher_learn = teacher_cfg.teacher_learn
 
+        # Offline patch gains (see `patch_atlas`), looked up instead of solving the LMIs at runtime
+        patch_atlas = teacher_cfg.get('patch_atlas', None)
+        self.patch_atlas = PatchAtlas(patch_atlas) if patch_atlas else None
+
         # HAC Runtime
         # self._ref_state = None
         self._plant_state = None
@@ -70,15 +78,10 @@ class HATeacher:
                                    [-0., 0., 0., 0., 0., 68.]])
         self.action_counter = 0
 
-        # Multiprocessing compute for patch
-        manager = mp.Manager()
-        self.lock = manager.Lock()
-        self.triggered_roll = manager.Value('d', 0)
-        self.triggered_pitch = manager.Value('d', 0)
-        self.triggered_yaw = manager.Value('d', 0)
-        state_update_flag = manager.Value('b', 0)
-        self._f_kp = manager.list(copy.deepcopy(self._patch_kp.reshape(36)))
-        self._f_kd = manager.list(copy.deepcopy(self._patch_kd.reshape(36)))
+        # Multiprocessing compute for patch (triggered roll/pitch/yaw and patch gains in shared memory, created by
+        # `mp_start` only)
+        self.shared_gain = None
+        self._gain_version = 0
         self.patch_process = None
 
         if self.teacher_enable:
@@ -91,18 +94,14 @@ class HATeacher:
         # state_triggered = mp.RawArray(ctypes.c_double, np.array([0] * 12))
 
     def mp_start(self):
-        data = {
-            'roll': self.triggered_roll,
-            'pitch': self.triggered_pitch,
-            'yaw': self.triggered_yaw,
-            'kp': self._patch_kp,
-            'kd': self._patch_kd
-        }
+        if self.shared_gain is None:
+            self.shared_gain = SharedPatchGain(kp=self._patch_kp, kd=self._patch_kd)
+            self._gain_version = self.shared_gain.version
+            atexit.register(self.close)  # Unlink the shared memory block even if `close` is never called
+
         print("creating process for patch computing")
         self.patch_process = mp.Process(
-            target=self.patch_compute, args=(self.triggered_roll, self.triggered_pitch, self.triggered_yaw,
-                                             self._f_kp, self._f_kd, self.lock)
-            # target=self.patch_compute, args=(data)
+            target=self.patch_compute, args=(self.shared_gain.name,)
         )
 
         self.patch_process.daemon = True
@@ -119,44 +118,30 @@ class HATeacher:
             print("compute from patch_compute2")
             time.sleep(1)
 
-    # def patch_compute(self, roll, pitch, yaw, _f_kp, _f_kd, lock):
     @staticmethod
-    def patch_compute(roll, pitch, yaw, _f_kp, _f_kd, lock):
+    def patch_compute(shm_name, poll_interval=0.005):
+        shared_gain = SharedPatchGain(name=shm_name)
         try:
             print("Starting a subprocess for LMI computation...")
             path = "./robot/ha_teacher"
             # mat_engine = matlab.engine.start_matlab()
             # mat_engine.cd(path)
             # print("Matlab current working directory is ---->>>", mat_engine.pwd())
+            last_seq = 0
             while True:
-                # _state_trig = await _queue.get()  # get updated trigger state
-                print("LMI process computing...")
-                # print(f"update_flag value: {update_flag.value}")
-                # print(f"roll value: {roll.value}")
-                # print(f"pitch value: {pitch.value}")
-                # print(f"yaw value: {yaw.value}")
-                # print(f"_f_kp value: {_f_kp}")
-                # print(f"_f_kd value: {_f_kd}")
-
-                roll_v, pitch_v, yaw_v = roll.value, pitch.value, yaw.value
+                # Wait for a new triggered state from the control loop
+                request = shared_gain.poll_request(last_seq)
+                if request is None:
+                    time.sleep(poll_interval)
+                    continue
+                last_seq, (roll_v, pitch_v, yaw_v) = request
                 print(f"roll_v: {roll_v}")
                 print(f"pitch_v: {pitch_v}")
                 print(f"yaw_v: {yaw_v}")
                 print("Obtained new state, updating the patch gain with cvxpy")
                 F_kp, F_kd = HATeacher.system_patch(roll_v, pitch_v, yaw_v)
-                # lock.acquire()
-                for i in range(36):
-                    _f_kp[i] = np.asarray(F_kp).reshape(36)[i]
-                    _f_kd[i] = np.asarray(F_kd).reshape(36)[i]
-                # _f_kp.reshape(6, 6)
-                # _f_kd.reshape(6, 6)
-                print(f"type of _f_kp: {type(_f_kp)}")
-                # lock.release()
+                shared_gain.publish(F_kp, F_kd, request_seq=last_seq)
                 print("Patch gain is updated now ---->>>")
-                time.sleep(0.5)
-
-                # _lock.release()
-                # time.sleep(0.04)
         except:
             # traceback.print_exc(file=open("suberror.txt", "w+"))
             error = traceback.format_exc()
@@ -189,6 +174,13 @@ class HATeacher:
                 self._patch_center = self._plant_state * self.chi  # Update patch center
                 print(f"Activate HA-Teacher and updated patch center is: {self._patch_center}")
 
+                # Patch gain at the triggered attitude, from the atlas or asked to the patch process
+                roll, pitch, yaw = self._plant_state[3:6]
+                if self.patch_atlas is not None:
+                    self._patch_kp, self._patch_kd = self.patch_atlas.lookup(roll, pitch, yaw)
+                elif self.patch_process is not None:
+                    self.shared_gain.request(roll, pitch, yaw)
+
     def feedback_law(self, roll, pitch, yaw):
         # roll = matlab.double(roll)s
         # pitch = matlab.double(pitch)
@@ -244,6 +236,11 @@ class HATeacher:
         # print(f"self._patch_center: {self._patch_center}")
         # print(f"self._plant_state: {self._plant_state}")
         # s2 = time.time()
+
+        # Pick up the gain published by the patch process (lock-free)
+        if self.shared_gain is not None and self.shared_gain.version != self._gain_version:
+            self._patch_kp, self._patch_kd, self._gain_version, _ = self.shared_gain.read()
+
         teacher_action = np.squeeze(self._patch_kp @ (self._plant_state[:6] - self._patch_center[:6]) * -1
                                     + self._patch_kd @ (self._plant_state[6:] - self._patch_center[6:]) * -1)
         # s3 = time.time()
@@ -265,6 +262,9 @@ class HATeacher:
         """
          Computes the patch gain with roll pitch yaw.
 
+         The LMIs are built and canonicalized once per process (see `PatchProblem`), each call only
+         substitutes the attitude-dependent Rzyx and re-solves.
+
          Args:
            roll: Roll angle (rad).
            pitch: Pitch angle (rad).
@@ -275,129 +275,19 @@ class HATeacher:
            F_kd: Derivative feedback gain matrix.
          """
 
-        # Rotation matrices
-        Rx = np.array([[1, 0, 0],
-                       [0, np.cos(roll), -np.sin(roll)],
-                       [0, np.sin(roll), np.cos(roll)]])
-        Ry = np.array([[np.cos(pitch), 0, np.sin(pitch)],
-                       [0, 1, 0],
-                       [-np.sin(pitch), 0, np.cos(pitch)]])
-        Rz = np.array([[np.cos(yaw), -np.sin(yaw), 0],
-                       [np.sin(yaw), np.cos(yaw), 0],
-                       [0, 0, 1]])
-        Rzyx = Rz.dot(Ry.dot(Rx))
-        # print(f"Rzyx: {Rzyx}")
-
-        Rzyx = np.array([[np.cos(yaw) / np.cos(pitch), np.sin(yaw) / np.cos(pitch), 0],
-                         [-np.sin(yaw), np.cos(yaw), 0],
-                         [np.cos(yaw) * np.tan(pitch), np.sin(yaw) * np.tan(pitch), 1]])
-
-        bP = np.array([[140.6434, 0, 0, 0, 0, 0, 5.3276, 0, 0, 0],
-                       [0, 134.7596, 0, 0, 0, 0, 0, 6.6219, 0, 0],
-                       [0, 0, 134.7596, 0, 0, 0, 0, 0, 6.622, 0],
-                       [0, 0, 0, 49.641, 0, 0, 0, 0, 0, 6.8662],
-                       [0, 0, 0, 0, 11.1111, 0, 0, 0, 0, 0],
-                       [0, 0, 0, 0, 0, 3.3058, 0, 0, 0, 0],
-                       [5.3276, 0, 0, 0, 0, 0, 3.6008, 0, 0, 0],
-                       [0, 6.6219, 0, 0, 0, 0, 0, 3.6394, 0, 0],
-                       [0, 0, 6.622, 0, 0, 0, 0, 0, 3.6394, 0],
-                       [0, 0, 0, 6.8662, 0, 0, 0, 0, 0, 4.3232]])
-
-        # Sampling period
-        T = 1 / 30  # work in 25 to 30
-
-        # System matrices (continuous-time)
-        aA = np.zeros((10, 10))
-        aA[0, 6] = 1
-        aA[1:4, 7:10] = Rzyx
-        aB = np.zeros((10, 6))
-        aB[4:, :] = np.eye(6)
-
-        # System matrices (discrete-time)
-        B = aB * T
-        A = np.eye(10) + T * aA
-
-        alpha = 0.8
-        kappa = 0.01
-        chi = 0.2
-        # gamma = 1
-        # hd = 0.000
-        gamma1 = 1
-        gamma2 = 1  # 1
-
-        b1 = 1 / 0.15  # height  0.15
-        b2 = 1 / 0.35  # velocity 0.3
-        # b3 = 1 / 0.1   # yaw 0.1
-        # b4 = 1 / 0.5   # yaw rate 1
-
-        D = np.array([[b1, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-                      [0, 0, 0, 0, b2, 0, 0, 0, 0, 0]])
-        # [0, 0, 0, b3, 0, 0, 0, 0, 0, 0],
-        # [0, 0, 0, 0, 0, 0, 0, 0, 0, b4]])
-        c1 = 1 / 45
-        c2 = 1 / 70
-        C = np.array([[c1, 0, 0, 0, 0, 0],
-                      [0, c1, 0, 0, 0, 0],
-                      [0, 0, c1, 0, 0, 0],
-                      [0, 0, 0, c2, 0, 0],
-                      [0, 0, 0, 0, c2, 0],
-                      [0, 0, 0, 0, 0, c2]])
-
-        Q = cp.Variable((10, 10), PSD=True)
-        T = cp.Variable((6, 6), PSD=True)
-        R = cp.Variable((6, 10))
-        mu = cp.Variable((1, 1))
-
-        constraints = [cp.bmat([[(alpha - kappa * (1 + (1 / gamma2))) * Q, Q @ A.T + R.T @ B.T],
-                                [A @ Q + B @ R, Q / (1 + gamma2)]]) >> 0,
-                       cp.bmat([[Q, R.T],
-                                [R, T]]) >> 0,
-                       (1 - chi * gamma1) * mu - (1 - (2 * chi) + (chi / gamma1)) >> 0,
-                       Q - mu * np.linalg.inv(bP) >> 0,
-                       np.identity(2) - D @ Q @ D.transpose() >> 0,
-                       np.identity(6) - C @ T @ C.transpose() >> 0,
-                       # T - hd * np.identity(6) >> 0,
-                       mu - 1.0 >> 0,
-                       ]
-
-        # Define problem and objective
-        problem = cp.Problem(cp.Minimize(0), constraints)
-
-        # Solve the problem
-        problem.solve(solver=cp.CVXOPT)
-
-        # Extract optimal values
+        F_kp, F_kd, status, feasible = get_patch_problem().solve(roll, pitch, yaw)
+
         # Check if the problem is solved successfully
-        if problem.status == 'optimal':
+        if status == 'optimal':
             print("Optimization successful.")
         else:
             print("Optimization failed.")
 
-        optimal_Q = Q.value
-        optimal_R = R.value
-        optimal_mu = mu.value
-
-        # print(mu.value)
-        # print(Q.value)
-
-        P = np.linalg.inv(optimal_Q)
-
-        # Compute aF
-        aF = np.round(aB @ optimal_R @ P, 0)
-        Fb2 = aF[6:10, 0:4]
-
-        # Compute F_kp
-        F_kp = -np.block([
-            [np.zeros((2, 6))],
-            [np.zeros((4, 2)), Fb2]])
-        # Compute F_kd
-        F_kd = -aF[4:10, 4:10]
-
         print(f"F_kp is: {F_kp}")
         print(f"F_kd is: {F_kd}")
 
         # Check if the problem is solved successfully
-        if np.all(np.linalg.eigvals(P) > 0):
+        if feasible:
             print("LMIs feasible")
             print(F_kp)
             print(F_kd)
@@ -407,6 +297,16 @@ class HATeacher:
 
         return F_kp, F_kd
 
+    def close(self):
+        if self.patch_process is not None:
+            self.patch_process.terminate()
+            self.patch_process.join()
+            self.patch_process = None
+        if self.shared_gain is not None:
+            self.shared_gain.close()
+            self.shared_gain = None
+            atexit.unregister(self.close)
+
     @property
     def ref_state(self):
         return self._ref_state
@@ -1,4 +1,5 @@
 import sys
+import atexit
 import copy
 import enum
 import time
@@ -21,6 +22,7 @@ from collections import deque
 from numpy.linalg import pinv
 
 from src.physical_design import MATRIX_P
+from src.ha_teacher.gain_exchange import SharedPatchGain
 # from src.envs.locomotion.robots.motors import MotorCommand
 # from src.envs.locomotion.robots.motors import MotorControlMode
 from scipy.linalg import solve_continuous_are, inv
@@ -47,14 +49,16 @@ default_kd = np.diag((40., 30., 10., 10., 10., 30.))
 #                        [0, 0, 0, -1, 37, 9],
 #                        [0, 0, 0, 0, 0, 40]])
 
-manager = mp.Manager()
-lock = manager.Lock()
-triggered_roll = manager.Value('d', 0)
-triggered_pitch = manager.Value('d', 0)
-triggered_yaw = manager.Value('d', 0)
-state_update_flag = manager.Value('b', 0)
-f_kp = manager.list(copy.deepcopy(default_kp.reshape(36)))
-f_kd = manager.list(copy.deepcopy(default_kd.reshape(36)))
+# Triggered roll/pitch/yaw and feedback gains, shared with the mat process (created on first use)
+shared_gain = None
+
+
+def get_shared_gain():
+    global shared_gain
+    if shared_gain is None:
+        shared_gain = SharedPatchGain(kp=default_kp, kd=default_kd)
+        atexit.register(shared_gain.close)  # Unlink the shared memory block at exit
+    return shared_gain
 
 
 # queue = manager.Queue()
@@ -66,8 +70,7 @@ f_kd = manager.list(copy.deepcopy(default_kd.reshape(36)))
 
 def mp_start():
     print("creating mat process")
-    mat_process = mp.Process(target=update_feedback_gain2,
-                             args=(state_update_flag, triggered_roll, triggered_pitch, triggered_yaw, f_kp, f_kd, lock))
+    mat_process = mp.Process(target=update_feedback_gain2, args=(get_shared_gain().name,))
 
     mat_process.daemon = True
     print("starting mat process")
@@ -128,42 +131,29 @@ def update_feedback_gain(args):
 
 
 async def lmi_run():
-    task = asyncio.create_task(update_feedback_gain2(state_update_flag, triggered_roll, triggered_pitch, triggered_yaw))
+    task = asyncio.create_task(update_feedback_gain2(get_shared_gain().name))
     await asyncio.sleep(2)
     asyncio.gather(task)
 
 
-def update_feedback_gain2(update_flag, roll, pitch, yaw, _f_kp, _f_kd, lock):
+def update_feedback_gain2(shm_name):
+    _shared_gain = SharedPatchGain(name=shm_name)
     try:
         print("Starting a subprocess for LMI computation...")
         path = "./robot/ha_teacher"
         # mat_engine = matlab.engine.start_matlab()
         # mat_engine.cd(path)
         # print("Matlab current working directory is ---->>>", mat_engine.pwd())
+        last_seq = 0
         while True:
-            # _state_trig = await _queue.get()  # get updated trigger state
-            print("LMI process computing...")
-            # print(f"update_flag value: {update_flag.value}")
-            # print(f"roll value: {roll.value}")
-            # print(f"pitch value: {pitch.value}")
-            # print(f"yaw value: {yaw.value}")
-            # print(f"_f_kp value: {_f_kp}")
-            # print(f"_f_kd value: {_f_kd}")
-
-            if update_flag.value == 1:
+            request = _shared_gain.poll_request(last_seq)
+            if request is not None:
                 print("success!!!")
-                roll_v, pitch_v, yaw_v = roll.value, pitch.value, yaw.value
-                print("Obtained new state, updating the feedback gain using matlab engine")
-                F_kp, F_kd = feedback_law2(roll_v, pitch_v, yaw_v)
-                # lock.acquire()
-                for i in range(36):
-                    _f_kp[i] = np.asarray(F_kp).reshape(36)[i]
-                    _f_kd[i] = np.asarray(F_kd).reshape(36)[i]
-                # print(f"np.asarray(F_kp): {np.asarray(F_kp)}")
-                # lock.release()
+                last_seq, (roll_v, pitch_v, yaw_v) = request
+                print("Obtained new state, updating the feedback gain")
+                F_kp, F_kd = system_patch_origin(roll_v, pitch_v, yaw_v)
+                _shared_gain.publish(F_kp, F_kd, request_seq=last_seq)
                 print("Feedback gain is updated now ---->>>")
-
-                # _lock.release()
             time.sleep(0.04)
     except:
         # traceback.print_exc(file=open("suberror.txt", "w+"))
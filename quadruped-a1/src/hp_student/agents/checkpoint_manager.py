@@ -0,0 +1,160 @@
+import os
+import shutil
+import hashlib
+import threading
+import numpy as np
+
+LATEST_FILE = 'latest'
+CHECKPOINT_PREFIX = 'ckpt-'
+WEIGHTS_SUFFIX = '.weights.npz'
+
+
+def weights_digest(snapshot):
+    """
+    Fingerprint of a weights snapshot {model name: [arrays]}
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for name in sorted(snapshot):
+        for w in snapshot[name]:
+            digest.update(np.ascontiguousarray(w).view(np.uint8))
+    return digest.hexdigest()
+
+
+def resolve_checkpoint(path):
+    """
+    Directory holding the model weights: the latest checkpoint of a managed directory, or the path itself
+    """
+    latest = os.path.join(path, LATEST_FILE)
+    if os.path.isfile(latest):
+        with open(latest, 'r') as f:
+            return os.path.join(path, f.read().strip())
+    return path
+
+
+def load_snapshot(path, names):
+    """
+    Weights snapshot {model name: [arrays]} saved by `CheckpointManager`, or None for other (TF) checkpoints
+    """
+    if not all(os.path.isfile(os.path.join(path, name + WEIGHTS_SUFFIX)) for name in names):
+        return None
+    snapshot = {}
+    for name in names:
+        with np.load(os.path.join(path, name + WEIGHTS_SUFFIX)) as data:
+            snapshot[name] = [data[f"arr_{i}"] for i in range(len(data.files))]
+    return snapshot
+
+
+class CheckpointManager:
+    """
+    Asynchronous, deduplicating and atomic checkpoint writer for `DDPGAgent`
+
+    `save` only copies the weights in memory and hands them to a writer thread. Every directory it manages (e.g.,
+    the model dir and its `-best` sibling) holds the last `keep` checkpoints as `ckpt-<step>` sub-directories plus a
+    `latest` pointer. Each checkpoint is first written to a temporary directory and renamed into place, then the
+    pointer is replaced, so a crash never leaves a half-written model behind. Saving the same weights as the last
+    checkpoint of a directory is skipped. Only the newest pending snapshot per directory is kept if the writer falls
+    behind. A failed write is reported and the writer keeps going; the error is raised by the next `flush`/`close`.
+    """
+
+    def __init__(self, agent, keep_last=3, keep_best=1):
+        self.agent = agent
+        self.keep_last = max(int(keep_last), 1)
+        self.keep_best = max(int(keep_best), 1)
+
+        self._digests = {}  # Digest of the last saved (or pending) snapshot per directory
+        self._pending = {}  # Directory -> (step, snapshot, keep)
+        self._cond = threading.Condition()
+        self._stop = False
+        self._writing = False
+        self._error = None  # First write error not raised yet
+        self._thread = threading.Thread(target=self._write_loop, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def save(self, path, step, best=False):
+        """
+        Snapshot the agent weights and schedule them to `path`, returns False when they are unchanged
+        """
+        snapshot = self.agent.get_weights_snapshot()
+        digest = weights_digest(snapshot)
+        with self._cond:
+            if self._digests.get(path) == digest:
+                return False
+            self._digests[path] = digest
+            self._pending[path] = (int(step), snapshot, self.keep_best if best else self.keep_last, digest)
+            self._cond.notify()
+        return True
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stop:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                path, (step, snapshot, keep, digest) = self._pending.popitem()
+                self._writing = True
+            try:
+                self._write(path, step, snapshot, keep)
+            except Exception as e:
+                print(f"Failed to write checkpoint {step} to {path}: {e!r}")
+                with self._cond:
+                    # Not on disk, so the same weights must not be skipped as already saved
+                    if self._digests.get(path) == digest:
+                        del self._digests[path]
+                    if self._error is None:
+                        self._error = e
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    @staticmethod
+    def _write(path, step, snapshot, keep):
+        os.makedirs(path, exist_ok=True)
+        name = f"{CHECKPOINT_PREFIX}{step:09d}"
+        final_dir = os.path.join(path, name)
+        tmp_dir = final_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for model_name, weights in snapshot.items():
+            with open(os.path.join(tmp_dir, model_name + WEIGHTS_SUFFIX), 'wb') as f:
+                np.savez(f, *weights)
+                f.flush()
+                os.fsync(f.fileno())
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+
+        # Point to the new checkpoint, then drop the oldest ones
+        latest_tmp = os.path.join(path, LATEST_FILE + '.tmp')
+        with open(latest_tmp, 'w') as f:
+            f.write(name)
+        os.replace(latest_tmp, os.path.join(path, LATEST_FILE))
+
+        # Oldest by write time, not by step: a reused directory may hold higher steps from an earlier run
+        older = [d for d in os.listdir(path) if d.startswith(CHECKPOINT_PREFIX) and not d.endswith('.tmp') and d != name]
+        older.sort(key=lambda d: os.path.getmtime(os.path.join(path, d)))
+        for old in older[:max(len(older) - (keep - 1), 0)]:
+            shutil.rmtree(os.path.join(path, old), ignore_errors=True)
+
+    def flush(self):
+        """
+        Block until all scheduled checkpoints are written, raises the first write error since the last flush
+        """
+        with self._cond:
+            while (self._pending or self._writing) and self._thread.is_alive():
+                self._cond.wait(timeout=1.)
+            if self._pending and not self._thread.is_alive():
+                print(f"Checkpoint writer is not running, dropping {len(self._pending)} pending checkpoint(s)")
+                self._pending.clear()
+            error, self._error = self._error, None
+        if error is not None:
+            raise RuntimeError("Checkpoint write failed") from error
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            with self._cond:
+                self._stop = True
+                self._cond.notify_all()
+            self._thread.join()
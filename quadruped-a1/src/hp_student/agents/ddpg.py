@@ -9,8 +9,11 @@ from omegaconf import DictConfig
 from src.hp_student.networks.mlp import MLPModel
 from src.hp_student.networks.taylor import TaylorModel
 from src.hp_student.utils.utils import OrnsteinUhlenbeckActionNoise
+from src.hp_student.agents.checkpoint_manager import resolve_checkpoint, load_snapshot
 from src.hp_student.networks.taylor import build_mlp_model, TaylorModel
 
+MODEL_NAMES = ("actor", "actor_target", "critic", "critic_target")
+
 
 class DDPGAgent:
     def __init__(self,
@@ -29,6 +32,9 @@ class DDPGAgent:
         self.optimizer_critic = None
         self.taylor_params = taylor_cfg
         self.exploration_steps = 0
+        self.acting_actor = None  # Separate actor used for interaction when trained asynchronously
+        self._shape_observations = shape_observations
+        self._shape_action = shape_action
 
         # Action Buffer
         self.action_buffer = deque([np.zeros(6), np.zeros(6), np.zeros(6)])
@@ -67,8 +73,35 @@ class DDPGAgent:
         self.critic.save_weights(os.path.join(model_save_path, "critic"))
         self.critic_target.save_weights(os.path.join(model_save_path, "critic_target"))
 
+    def get_weights_snapshot(self):
+        """
+        In-memory copy of all model weights {model name: [arrays]}
+        """
+        return {name: [np.array(w) for w in model.get_weights()]
+                for name, model in zip(MODEL_NAMES, self._models())}
+
+    def _models(self):
+        return self.actor, self.actor_target, self.critic, self.critic_target
+
     def load_weights(self, model_path, mode='train'):
         print(f"model_path: {model_path}")
+
+        # Checkpoints written by `CheckpointManager` (npz weights, latest checkpoint of a directory)
+        model_path = resolve_checkpoint(model_path)
+        names = MODEL_NAMES if mode == "train" else MODEL_NAMES[:1]
+        snapshot = load_snapshot(model_path, names)
+        if snapshot is not None:
+            observations = tf.zeros((1, self._shape_observations))
+            inputs = [observations, observations,
+                      tf.zeros((1, self._shape_observations + self._shape_action)),
+                      tf.zeros((1, self._shape_observations + self._shape_action))]
+            for name, model, x in zip(MODEL_NAMES, self._models(), inputs):
+                if name in snapshot:
+                    model(x)  # Build the weights before setting them
+                    model.set_weights(snapshot[name])
+            print(f"Pretrained weights are loaded from {model_path}")
+            return
+
         self.actor.load_weights(os.path.join(model_path, "actor"))
 
         if mode == "train":
@@ -97,6 +130,20 @@ class DDPGAgent:
             self.actor.summary()
             self.critic.summary()
 
+    def create_acting_actor(self):
+        """
+        Create a copy of the actor for interaction, so the actor itself can be trained on another thread
+        """
+        if self.params.use_taylor_nn:
+            self.acting_actor = TaylorModel(self.taylor_params, self._shape_observations, self._shape_action,
+                                            output_activation='tanh')
+        else:
+            self.acting_actor = MLPModel(self._shape_observations, self._shape_action, name="acting_actor",
+                                         output_activation='tanh').model
+        self.acting_actor(tf.zeros((1, self._shape_observations)))  # Build the weights before copying
+        self.acting_actor.set_weights(self.actor.get_weights())
+        return self.acting_actor
+
     def hard_update(self):
         self.actor_target.set_weights(self.actor.get_weights())
         self.critic_target.set_weights(self.critic.get_weights())
@@ -132,8 +179,9 @@ class DDPGAgent:
         else:
             action_noise = self.action_noise.sample() * self._action_noise_factor
 
+        actor = self.actor if self.acting_actor is None else self.acting_actor
         observations_tensor = tf.expand_dims(observations, 0)
-        action = tf.squeeze(self.actor(observations_tensor)).numpy()  # squeeze to kill batch_size
+        action = tf.squeeze(actor(observations_tensor)).numpy()  # squeeze to kill batch_size
 
         action_saturated = np.clip((action + action_noise), a_min=-1, a_max=1, dtype=float)
 
@@ -147,8 +195,9 @@ class DDPGAgent:
         import time
         s = time.time()
 
+        actor = self.actor if self.acting_actor is None else self.acting_actor
         observations_tensor = tf.expand_dims(observations, 0)
-        action_exploitation = self.actor(observations_tensor)
+        action_exploitation = actor(observations_tensor)
         print(f"action_exploitation: {action_exploitation}")
         e = time.time()
         print(f"get exploitation action time:{e - s}")
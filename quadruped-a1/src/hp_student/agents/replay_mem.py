@@ -1,14 +1,17 @@
 import pickle
 import numpy as np
-from src.hp_student.utils.utils import type_of, shape
 
 
 class ReplayMemory(object):
     """
     Replay memory class to store trajectories
+
+    Transitions (observations, action, reward, observations_next, failed) are kept in preallocated, contiguous
+    float32 arrays (one per field), so that sampled minibatches can be fed to `DDPGAgent.optimize` directly.
     """
 
-    def __init__(self, size, combined_experience_replay=False):
+    def __init__(self, size, combined_experience_replay=False, shape_observations=None, shape_action=None,
+                 seed=None):
         """
         initializing the replay memory
         """
@@ -19,23 +22,36 @@ class ReplayMemory(object):
         self.full = False
         self.size = int(size)
         self.memory = None
+        # Without a seed, drawn from the global NumPy state so that `np.random.seed` still makes runs reproducible
+        self._rng = np.random.default_rng(seed if seed is not None else np.random.randint(2 ** 31 - 1))
+        self._batch = None  # Preallocated minibatch arrays
+
+        # Allocate upfront when the shapes are known, otherwise on the first insertion
+        if shape_observations is not None and shape_action is not None:
+            self.allocate(shape_observations, shape_action)
+
+    def allocate(self, shape_observations, shape_action):
+        n = self.size
+        self.memory = [np.zeros(shape=(n, shape_observations), dtype=np.float32),  # observations
+                       np.zeros(shape=(n, shape_action), dtype=np.float32),  # action
+                       np.zeros(shape=(n, 1), dtype=np.float32),  # reward
+                       np.zeros(shape=(n, shape_observations), dtype=np.float32),  # observations_next
+                       np.zeros(shape=(n, 1), dtype=np.float32)]  # failed (as float for (1 - failed))
+        self._batch = None
 
     def initialize(self, experience):
-        # print(f"exp: {experience}")
-        self.memory = [np.zeros(shape=(self.size, shape(exp)), dtype=type_of(exp)) for exp in experience]
-        self.memory.append(np.zeros(shape=self.size, dtype=float))
+        self.allocate(shape_observations=np.size(experience[0]), shape_action=np.size(experience[1]))
 
     def add(self, experience):
         if self.memory is None:
             self.initialize(experience)
             print("initialized done")
 
-        if len(experience) + 1 != len(self.memory):
+        if len(experience) != len(self.memory):
             raise Exception('Experiment not the same size as memory', len(experience), '!=', len(self.memory))
-        # print(f"self.memory is: {self.memory}")
-        # print(f"experience is: {experience}")
+
         for e, mem in zip(experience, self.memory):
-            mem[self.k] = e
+            mem[self.k] = np.reshape(e, mem.shape[1:])
 
         self.head = self.k
         self.new_head = True
@@ -44,18 +60,61 @@ class ReplayMemory(object):
             self.k = 0  # replace the oldest one with the latest one
             self.full = True
 
+    def add_many(self, experiences):
+        """
+        Insert a batch of transitions at once, e.g., a whole episode
+
+        experiences: (observations, action, reward, observations_next, failed) with a leading batch dimension each
+        """
+        fields = [np.asarray(e, dtype=np.float32) for e in experiences]
+        n = len(fields[0])
+        if n == 0:
+            return
+        if self.memory is None:
+            self.allocate(shape_observations=fields[0].reshape(n, -1).shape[1],
+                          shape_action=fields[1].reshape(n, -1).shape[1])
+
+        if len(fields) != len(self.memory):
+            raise Exception('Experiment not the same size as memory', len(fields), '!=', len(self.memory))
+
+        # Only the latest transitions that fit in the memory survive
+        if n > self.size:
+            fields = [f[-self.size:] for f in fields]
+            self.k = (self.k + n - self.size) % self.size
+            n = self.size
+
+        idx = (self.k + np.arange(n)) % self.size
+        for f, mem in zip(fields, self.memory):
+            mem[idx] = f.reshape((n,) + mem.shape[1:])
+
+        self.head = int(idx[-1])
+        self.new_head = True
+        if self.k + n >= self.size:
+            self.full = True
+        self.k = (self.k + n) % self.size
+
     def sample(self, batch_size):
+        """
+        Sample a minibatch without replacement in O(batch_size)
+
+        The returned float32 arrays are reused by the next call to `sample`
+        """
         r = self.size
         if not self.full:
             r = self.k
-        random_idx = np.random.choice(r, size=batch_size, replace=False)
+        random_idx = self._rng.choice(r, size=batch_size, replace=False, shuffle=False)
 
         if self.combined_experience_replay:
             if self.new_head:
                 random_idx[0] = self.head  # always add the latest one
                 self.new_head = False
 
-        return [mem[random_idx] for mem in self.memory]
+        if self._batch is None or len(self._batch[0]) != batch_size:
+            self._batch = [np.empty((batch_size,) + mem.shape[1:], dtype=mem.dtype) for mem in self.memory]
+
+        for mem, out in zip(self.memory, self._batch):
+            np.take(mem, random_idx, axis=0, out=out)
+        return self._batch
 
     def get(self, start, length):
         return [mem[start:start + length] for mem in self.memory]
@@ -72,26 +131,26 @@ class ReplayMemory(object):
         self.k = 0
         self.head = -1
         self.full = False
-        self.memory = None
         self.new_head = False
 
     def shuffle(self):
         """
         to shuffle the whole memory
         """
-        self.memory = self.sample(self.get_size())
+        n = self.get_size()
+        perm = self._rng.permutation(n)
+        for mem in self.memory:
+            mem[:n] = mem[perm]
 
     def save2file(self, file_path):
         with open(file_path, 'wb') as fp:
-            pickle.dump(self.memory, fp)
+            pickle.dump([mem[:self.get_size()] for mem in self.memory], fp)
 
     def load_memory_caches(self, path):
 
         with open(path, 'rb') as fp:
             memory = pickle.load(fp)
-            if self.memory is None:
-                self.memory = memory
-            else:
-                self.memory = np.hstack((self.memory, memory))
+            # Caches saved by the former list-of-arrays memory may carry an extra trailing field
+            self.add_many([np.asarray(m) for m in memory[:5]])
 
         print("Load memory caches, pre-filled replay memory!")
@@ -0,0 +1,277 @@
+import os
+import time
+import hydra
+import numpy as np
+import tensorflow as tf
+from omegaconf import DictConfig
+
+from src.utils.utils import logger
+from src.hp_student.networks.taylor import TaylorModel, TaylorAugmentLayer, TaylorDenseLayer
+
+BACKENDS = ('keras', 'numpy', 'tflite', 'onnx')
+
+
+def _actor_function(actor, shape_observations):
+    """
+    Concrete single-observation forward pass of the actor, the common entry for the exporters
+    """
+    spec = tf.TensorSpec(shape=(1, shape_observations), dtype=tf.float32, name='observations')
+    return tf.function(lambda observations: actor(observations), input_signature=[spec])
+
+
+def export_tflite(actor, shape_observations, path):
+    forward = _actor_function(actor, shape_observations)
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([forward.get_concrete_function()], actor)
+    converter.target_spec.supported_ops = [
+        tf.lite.OpsSet.TFLITE_BUILTINS,  # enable TensorFlow Lite ops.
+        tf.lite.OpsSet.SELECT_TF_OPS  # enable TensorFlow ops.
+    ]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+    print(f"TFLite actor saved to {path}")
+    return path
+
+
+def export_onnx(actor, shape_observations, path):
+    import tf2onnx  # Only needed for exporting
+
+    forward = _actor_function(actor, shape_observations)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tf2onnx.convert.from_function(forward, input_signature=forward.input_signature, opset=13, output_path=path)
+    print(f"ONNX actor saved to {path}")
+    return path
+
+
+class KerasActor:
+    """
+    The Keras actor itself behind the runtime interface (same as `DDPGAgent.get_exploitation_action`)
+    """
+
+    def __init__(self, actor):
+        self.actor = actor
+
+    def __call__(self, observations):
+        observations_tensor = tf.expand_dims(observations, 0)
+        return tf.squeeze(self.actor(observations_tensor)).numpy()
+
+
+class NumpyActor:
+    """
+    Pure NumPy forward pass of an `MLPModel` or `TaylorModel` actor with the weights extracted once
+
+    Each layer is either ('augment', index_tables) or ('dense', W^T, b, activation, linear), where `linear` is the
+    (A^T, a) physics part of an edited Taylor layer (None otherwise) added after the activation.
+    """
+
+    def __init__(self, layers, input_dtype=np.float32):
+        self.layers = layers
+        self.input_dtype = np.dtype(input_dtype)
+
+    @classmethod
+    def from_keras(cls, actor):
+        """
+        Snapshot the weights of a built actor, call `from_keras` again after the actor is updated
+        """
+        if isinstance(actor, TaylorModel):
+            return cls(layers=[cls._extract_taylor_layer(layer) for layer in actor.layer_list])
+
+        # Functional MLP, whose input layer may quantize the observations (e.g., float16)
+        layers = []
+        for layer in actor.layers:
+            if isinstance(layer, tf.keras.layers.InputLayer):
+                continue
+            if not isinstance(layer, tf.keras.layers.Dense):
+                raise RuntimeError(f"Unsupported layer for the NumPy actor: {layer.__class__.__name__}")
+            kernel, bias = [np.asarray(w, dtype=np.float32) for w in layer.get_weights()]
+            layers.append(('dense', np.ascontiguousarray(kernel), bias, layer.activation.__name__, None))
+        return cls(layers=layers, input_dtype=actor.inputs[0].dtype.as_numpy_dtype)
+
+    @staticmethod
+    def _extract_taylor_layer(layer):
+        if isinstance(layer, TaylorAugmentLayer):
+            return 'augment', layer.index_tables
+
+        if not isinstance(layer, TaylorDenseLayer):
+            raise RuntimeError(f"Unsupported layer for the NumPy actor: {layer.__class__.__name__}")
+
+        weights = layer.weights_variables.numpy().astype(np.float32)
+        biases = layer.biases_variables.numpy().astype(np.float32)
+        if not layer.nn_editing:
+            return 'dense', np.ascontiguousarray(weights.T), biases, layer.activation, None
+
+        # Fold the editing masks into the weights, the editing branch applies no 'lin' activation
+        weights_B = weights * np.asarray(layer.phyweightsB, dtype=np.float32)
+        biases_B = biases * np.squeeze(np.asarray(layer.phybiasesB, dtype=np.float32))
+        weights_A = np.asarray(layer.phyweightsA, dtype=np.float32)
+        biases_A = np.squeeze(np.asarray(layer.phybiasesA, dtype=np.float32))
+        activation = layer.activation if layer.activation in ('sigmoid', 'relu', 'tanh') else None
+        return 'dense', np.ascontiguousarray(weights_B.T), biases_B, activation, \
+            (np.ascontiguousarray(weights_A.T), biases_A)
+
+    @staticmethod
+    def _activate(x, activation):
+        if activation == 'relu':
+            return np.maximum(x, 0, out=x)
+        elif activation == 'tanh':
+            return np.tanh(x, out=x)
+        elif activation == 'sigmoid':
+            return 1. / (1. + np.exp(-x))
+        elif activation == 'lin':
+            return x * 0.001 + 100
+        return x
+
+    def predict(self, observations):
+        """
+        Forward pass of a single observation (dim,) or a batch (N, dim)
+        """
+        x = np.asarray(observations).astype(self.input_dtype).astype(np.float32)
+        for layer in self.layers:
+            if layer[0] == 'augment':
+                exp_tensor = x
+                exp_list = [x]
+                for input_idx, prev_idx in layer[1]:
+                    exp_tensor = x[..., input_idx] * exp_tensor[..., prev_idx]
+                    exp_list.append(exp_tensor)
+                x = np.concatenate(exp_list, axis=-1)
+            else:
+                _, weights_T, biases, activation, linear = layer
+                y = self._activate(x @ weights_T + biases, activation)
+                if linear is not None:
+                    y = y + (x @ linear[0] + linear[1])
+                x = y
+        return x
+
+    def __call__(self, observations):
+        return np.squeeze(self.predict(observations))
+
+
+class TFLiteActor:
+    """
+    TFLite interpreter with the input buffer allocated once
+    """
+
+    def __init__(self, path):
+        self.interpreter = tf.lite.Interpreter(model_path=path)
+        self.interpreter.allocate_tensors()
+        input_details = self.interpreter.get_input_details()[0]
+        self._input_index = input_details['index']
+        self._output_index = self.interpreter.get_output_details()[0]['index']
+        self._input = np.zeros(input_details['shape'], dtype=input_details['dtype'])
+
+    def __call__(self, observations):
+        self._input[0] = observations
+        self.interpreter.set_tensor(self._input_index, self._input)
+        self.interpreter.invoke()
+        return np.squeeze(self.interpreter.get_tensor(self._output_index))
+
+
+class OnnxActor:
+    """
+    ONNX Runtime session on the CPU with the input buffer allocated once
+    """
+
+    def __init__(self, path):
+        import onnxruntime  # Only needed for the onnx backend
+
+        self.session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self._input_name = model_input.name
+        self._input = np.zeros([1, model_input.shape[-1]], dtype=np.float32)
+
+    def __call__(self, observations):
+        self._input[0] = observations
+        return np.squeeze(self.session.run(None, {self._input_name: self._input})[0])
+
+
+def make_actor_runtime(backend, actor=None, path=None, shape_observations=None):
+    """
+    Select the actor inference runtime, `actor` is required by keras/numpy and `path` by tflite/onnx
+
+    Given both the Keras actor and `shape_observations`, a non-Keras runtime is checked against the actor once
+    (`check_actor_equivalence`) and a mismatch, e.g., a stale exported model, is logged as a warning.
+    """
+    if backend == 'keras':
+        return KerasActor(actor)
+    elif backend == 'numpy':
+        runtime = NumpyActor.from_keras(actor)
+    elif backend == 'tflite':
+        runtime = TFLiteActor(path)
+    elif backend == 'onnx':
+        runtime = OnnxActor(path)
+    else:
+        raise RuntimeError(f"Unknown actor runtime backend: {backend}, choose from {BACKENDS}")
+
+    if actor is not None and shape_observations is not None:
+        max_error, passed = check_actor_equivalence(actor, runtime, shape_observations, num_samples=100)
+        if passed:
+            logger.info(f"Actor runtime {backend} matches the Keras actor (max abs error {max_error:.2e})")
+        else:
+            logger.warning(f"Actor runtime {backend} differs from the Keras actor by up to {max_error:.2e}")
+    return runtime
+
+
+def check_actor_equivalence(actor, runtime, shape_observations, num_samples=1000, atol=1e-4, seed=0):
+    """
+    Compare the runtime against the Keras actor on random observations, returns (max abs error, passed)
+    """
+    rng = np.random.default_rng(seed)
+    observations = rng.uniform(-1, 1, size=(num_samples, shape_observations)).astype(np.float32)
+    expected = actor(observations).numpy().reshape(num_samples, -1)
+    actual = np.stack([np.reshape(runtime(ob), -1) for ob in observations])
+    max_error = float(np.max(np.abs(expected - actual)))
+    return max_error, max_error <= atol
+
+
+def benchmark_actor_runtime(runtime, shape_observations, steps=1000, seed=0):
+    """
+    Mean per-step inference time (seconds) of a single observation
+    """
+    observations = np.random.default_rng(seed).uniform(-1, 1, size=(steps, shape_observations)).astype(np.float32)
+    runtime(observations[0])  # Warm up
+    start = time.perf_counter()
+    for ob in observations:
+        runtime(ob)
+    return (time.perf_counter() - start) / steps
+
+
+@hydra.main(version_base=None, config_path="../../../config", config_name="base_config.yaml")
+def main(cfg: DictConfig):
+    from src.hp_student.agents.ddpg import DDPGAgent
+
+    if cfg.hp_student.agents.checkpoint is None:
+        logger.warning("No checkpoint given, exporting a randomly initialized actor")
+
+    shape_observations, shape_action = 12, 6
+    agent = DDPGAgent(agent_cfg=cfg.hp_student.agents,
+                      taylor_cfg=cfg.hp_student.taylor,
+                      shape_observations=shape_observations,
+                      shape_action=shape_action,
+                      mode='test')
+    actor = agent.actor
+    actor(tf.zeros((1, shape_observations)))
+
+    export_dir = hydra.utils.to_absolute_path(cfg.hp_student.agents.inference.export_dir)
+    paths = {'tflite': export_tflite(actor, shape_observations, os.path.join(export_dir, 'actor.tflite'))}
+    try:
+        paths['onnx'] = export_onnx(actor, shape_observations, os.path.join(export_dir, 'actor.onnx'))
+    except ImportError:
+        logger.warning("tf2onnx is not installed, skip the ONNX export")
+
+    # Equivalence and per-step latency of every available runtime
+    for backend in BACKENDS:
+        if backend in ('tflite', 'onnx') and backend not in paths:
+            continue
+        try:
+            runtime = make_actor_runtime(backend, actor=actor, path=paths.get(backend))  # Checked below
+        except ImportError:
+            logger.warning(f"Runtime for {backend} is not installed, skip it")
+            continue
+        max_error, passed = check_actor_equivalence(actor, runtime, shape_observations)
+        step_time = benchmark_actor_runtime(runtime, shape_observations)
+        print(f"{backend:>6}: max abs error {max_error:.2e} ({'pass' if passed else 'FAIL'}), "
+              f"{step_time * 1e6:.1f} us/step")
+
+
+if __name__ == '__main__':
+    main()
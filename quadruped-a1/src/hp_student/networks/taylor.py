@@ -1,4 +1,3 @@
-import copy
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras import Model
@@ -61,33 +60,20 @@ class TaylorAugmentLayer(Layer):
         """
         super(TaylorAugmentLayer, self).__init__()
         self.order = augment_order
+        self.index_tables = None
 
-    def call(self, inputs, *args, **kwargs):
+    def build(self, input_shape):
+        self.index_tables = get_augment_index_tables(input_dim=int(input_shape[-1]), order=self.order)
+        super(TaylorAugmentLayer, self).build(input_shape)
 
-        input_exp = inputs
-        _, c = inputs.shape
-        exp_list = [input_exp]
-        index_list = np.array(range(c))
-        index_next_order = np.zeros(shape=c + 1, dtype=int)
-
-        for i in range(self.order):
-            augment_list = []
-            num_aug_term = 0
-
-            for j in range(c):
-                exp_tensor = exp_list[-1]
-                ind_start = index_list[j]
-                N, len_pre = exp_tensor.shape
-                input_variable = tf.reshape(inputs[:, j], shape=(N, -1))  # n, 1
-                exp_tensor_pre_slice = tf.reshape(exp_tensor[:, ind_start:], shape=(N, -1))
-                exp_tem = input_variable * exp_tensor_pre_slice
-                num_aug_term += exp_tensor_pre_slice.shape[-1]
-                index_next_order[j + 1] = num_aug_term
-                augment_list.append(exp_tem)
-
-            index_list = copy.deepcopy(index_next_order)
-            augment_tensors = tf.concat(augment_list, axis=-1)
-            exp_list.append(augment_tensors)
+    def call(self, inputs, *args, **kwargs):
+        # Every monomial of the next order is (input variable) * (monomial of the previous order), with the
+        # same operands as the former per-column expansion so that the outputs stay bit-identical
+        exp_tensor = inputs
+        exp_list = [inputs]
+        for input_idx, prev_idx in self.index_tables:
+            exp_tensor = tf.gather(inputs, input_idx, axis=1) * tf.gather(exp_tensor, prev_idx, axis=1)
+            exp_list.append(exp_tensor)
 
         exp_all = tf.concat(exp_list, axis=-1)
         return exp_all
@@ -352,3 +338,23 @@ def get_knowledge_matrix():
                                params['phybiasesA'][k], params['phybiasesB'][k]])
 
     return editing_matrix
+
+
+def get_augment_index_tables(input_dim, order):
+    """
+    Gather indices of the Taylor augmentation, one (input_idx, prev_idx) pair per order
+
+    The monomials of the next order are inputs[:, input_idx] * monomials[:, prev_idx], where input variable j
+    multiplies the monomials of the previous order starting from the first one that contains no variable below j
+    """
+    ind_start = np.arange(input_dim)
+    len_pre = input_dim
+    tables = []
+    for _ in range(order):
+        counts = len_pre - ind_start
+        input_idx = np.repeat(np.arange(input_dim), counts)
+        prev_idx = np.concatenate([np.arange(s, len_pre) for s in ind_start])
+        tables.append((input_idx.astype(np.int32), prev_idx.astype(np.int32)))
+        ind_start = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        len_pre = int(counts.sum())
+    return tables
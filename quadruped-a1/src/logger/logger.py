@@ -6,6 +6,8 @@ import distutils.util
 import matplotlib.pyplot as plt
 from omegaconf import OmegaConf, DictConfig
 
+from src.utils.profiler import profiler
+
 
 class Logger:
     def __init__(self, params: DictConfig):
@@ -20,6 +22,9 @@ class Logger:
         self.training_log_writer = tf.summary.create_file_writer(self.log_dir + '/training')
         self.evaluation_log_writer = tf.summary.create_file_writer(self.log_dir + '/eval')
 
+        # Hot path profiler (see src/utils/profiler.py)
+        profiler.enabled = self.params.profiler.apply
+
     def log_training_data(self, average_reward, average_distance_score, critic_loss, failed, global_steps):
         with self.training_log_writer.as_default():
             tf.summary.scalar('train_eval/Average_Reward', average_reward, global_steps)
@@ -28,6 +33,18 @@ class Logger:
             tf.summary.scalar('train_eval/Distance_score_and_survived', average_distance_score * (1 - failed),
                               global_steps)
 
+    def log_profile(self, global_steps):
+        if not profiler.enabled:
+            return
+        with self.training_log_writer.as_default():
+            profiler.write_scalars(tf.summary.scalar, global_steps)
+
+    def save_profile(self):
+        if not profiler.enabled:
+            return
+        print(f"Hot path profile:\n{profiler}")
+        profiler.save_json(self.params.profiler.report_path)
+
     def log_evaluation_data(self, average_reward, average_distance_score, failed, global_steps):
         with self.evaluation_log_writer.as_default():
             tf.summary.scalar('train_eval/Average_Reward', average_reward, global_steps)
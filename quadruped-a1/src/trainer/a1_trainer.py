@@ -10,8 +10,11 @@ from src.coordinator.coordinator import Coordinator
 from src.logger.logger import Logger
 from src.hp_student.agents.replay_mem import ReplayMemory
 from src.hp_student.agents.ddpg import DDPGAgent
+from src.hp_student.agents.async_learner import AsyncLearner
+from src.hp_student.agents.checkpoint_manager import CheckpointManager
 from src.envs.a1_envs import A1Envs
 from src.utils.utils import ActionMode
+from src.utils.profiler import profiler
 
 
 class A1Trainer:
@@ -22,7 +25,9 @@ class A1Trainer:
         self.agent_params = config.hp_student.agents
         self.shape_observations = 12
         self.shape_action = 6
-        self.replay_mem = ReplayMemory(config.hp_student.agents.replay_buffer.buffer_size)
+        self.replay_mem = ReplayMemory(config.hp_student.agents.replay_buffer.buffer_size,
+                                       shape_observations=self.shape_observations,
+                                       shape_action=self.shape_action)
         self.agent = DDPGAgent(agent_cfg=config.hp_student.agents,
                                taylor_cfg=config.hp_student.taylor,
                                shape_observations=self.shape_observations,
@@ -30,6 +35,22 @@ class A1Trainer:
                                mode=config.logger.mode)
         self.agent.agent_warmup()
 
+        # Background learner (optimize decoupled from the control loop)
+        self.async_learner = None
+        if self.agent_params.async_learner.apply:
+            self.async_learner = AsyncLearner(agent=self.agent,
+                                              replay_mem=self.replay_mem,
+                                              batch_size=self.agent_params.replay_buffer.batch_size,
+                                              prefill_size=self.agent_params.replay_buffer.experience_prefill_size,
+                                              updates_per_step=self.agent_params.async_learner.updates_per_step,
+                                              publish_period=self.agent_params.async_learner.publish_period)
+
+        # Checkpoints written on a background thread
+        self.checkpoint_manager = None
+        if self.agent_params.checkpoint_manager.apply:
+            self.checkpoint_manager = CheckpointManager(agent=self.agent,
+                                                        keep_last=self.agent_params.checkpoint_manager.keep_last)
+
         # Environment (Real Plant)
         self.a1_env = A1Envs(a1_envs_cfg=config.envs, agent=self.agent)
 
@@ -58,36 +79,27 @@ class A1Trainer:
 
     def interaction_step(self, mode=None):
 
-        s0 = time.time()
         observations = self.a1_env.locomotion_controller.tracking_error
         s = np.asarray(observations)
 
-        s1 = time.time()
-        self.ha_teacher.update(error_state=s)  # Teacher update
-        self.coordinator.update(state=s)  # Coordinator update
-        s2 = time.time()
+        with profiler.span('teacher_update'):
+            self.ha_teacher.update(error_state=s)  # Teacher update
+        with profiler.span('coordinator_update'):
+            self.coordinator.update(state=s)  # Coordinator update
 
         # self.a1_env.mpc_controller.set_desired_speed(self.target_lin_speed, self.target_ang_speed)
         # self.a1_env.locomotion_controller.update()  # update the clock
 
         motor_action, action_mode, nominal_action = self.get_terminal_action(state=s, mode=mode)
-        s3 = time.time()
 
         # Inject Terminal Action
-        _, termination, abort = self.a1_env.env_step(motor_action)
-        s4 = time.time()
+        with profiler.span('env_step'):
+            _, termination, abort = self.a1_env.env_step(motor_action)
 
         observations_next = self.a1_env.tracking_error
         s_next = np.asarray(observations_next)
 
         reward = self.a1_env.get_reward(s=s, s_next=s_next)
-        s5 = time.time()
-
-        # print(f"interaction part1 time: {s1 - s0}")
-        # print(f"interaction part2 time: {s2 - s1}")
-        # print(f"interaction part3 time: {s3 - s2}")
-        # print(f"interaction part4 time: {s4 - s3}")
-        # print(f"interaction part5 time: {s5 - s4}")
 
         return observations, nominal_action, observations_next, termination, reward, abort
 
@@ -126,6 +138,9 @@ class A1Trainer:
         best_dsas = 0  # Best distance score and survived
         moving_average_dsas = 0.0
 
+        if self.async_learner is not None:
+            self.async_learner.start()
+
         # while global_steps < int(self.agent_params.max_training_episodes):
         for ep_i in range(self._max_training_episodes):
             pbar = tqdm(total=self._max_steps_per_episode, desc="Iteration %d" % ep)
@@ -144,11 +159,9 @@ class A1Trainer:
 
             for step in range(self._max_steps_per_episode):
 
-                s = time.time()
-                observations, action, observations_next, failed, reward, abort = \
-                    self.interaction_step(mode='train')
-                e = time.time()
-                print(f"interaction_step_time: {e - s}")
+                with profiler.span('interaction_step'):
+                    observations, action, observations_next, failed, reward, abort = \
+                        self.interaction_step(mode='train')
                 # print(f"observations: {observations}")
                 # print(f"action is: {action}")
                 # print(f"reward is: {reward}")
@@ -159,15 +172,23 @@ class A1Trainer:
                     print("robot failed, break this loop...")
                     break
 
-                self.replay_mem.add((observations, action, reward, observations_next, failed))
-
                 reward_list.append(reward)
 
-                if self.replay_mem.get_size() > self._buffer_experience_prefill_size:
-                    minibatch = self.replay_mem.sample(self._buffer_batch_size)
-                    critic_loss = self.agent.optimize(minibatch)
+                if self.async_learner is not None:
+                    self.async_learner.add((observations, action, reward, observations_next, failed))
+                    self.async_learner.sync_actor()
+                    critic_loss = self.async_learner.critic_loss
+                    if critic_loss is None:
+                        critic_loss = 100
                 else:
-                    critic_loss = 100
+                    self.replay_mem.add((observations, action, reward, observations_next, failed))
+
+                    if self.replay_mem.get_size() > self._buffer_experience_prefill_size:
+                        with profiler.span('optimize'):
+                            minibatch = self.replay_mem.sample(self._buffer_batch_size)
+                            critic_loss = self.agent.optimize(minibatch)
+                    else:
+                        critic_loss = 100
 
                 critic_loss_list.append(critic_loss)
                 global_steps += 1
@@ -182,6 +203,7 @@ class A1Trainer:
                 mean_critic_loss = np.mean(critic_loss_list)
 
             self.logger.log_training_data(mean_reward, 0, mean_critic_loss, failed, global_steps)
+            self.logger.log_profile(global_steps)
             print(f"Training at {ep} episodes: average_reward: {mean_reward:.6},"
                   f"critic_loss: {mean_critic_loss:.6}, total_steps_ep: {ep_steps} ")
 
@@ -192,10 +214,23 @@ class A1Trainer:
                 moving_average_dsas = 0.95 * moving_average_dsas + 0.05 * eval_mean_distance_score
 
                 if moving_average_dsas > best_dsas:
-                    self.agent.save_weights(self.logger.model_dir + '_best')
+                    self.save_weights(self.logger.model_dir + '_best', global_steps, best=True)
                     best_dsas = moving_average_dsas
 
-            self.agent.save_weights(self.logger.model_dir)
+            self.save_weights(self.logger.model_dir, global_steps)
+
+        if self.async_learner is not None:
+            self.async_learner.stop()
+        self.ha_teacher.close()
+        if self.checkpoint_manager is not None:
+            self.checkpoint_manager.close()
+        self.logger.save_profile()
+
+    def save_weights(self, path, global_steps, best=False):
+        if self.checkpoint_manager is not None:
+            self.checkpoint_manager.save(path, step=global_steps, best=best)
+        else:
+            self.agent.save_weights(path)
 
     def test(self):
         self.evaluation(mode='test')
@@ -206,30 +241,30 @@ class A1Trainer:
     def get_terminal_action(self, state: np.ndarray, mode=None):
         observations = state
 
-        s0 = time.time()
         # DRL Action
-        drl_raw_action = self.agent.get_action(observations, mode)  # All values from [-1, 1]
+        with profiler.span('actor'):
+            drl_raw_action = self.agent.get_action(observations, mode)  # All values from [-1, 1]
         drl_action = drl_raw_action * self._action_magnitude
         # drl_action = np.zeros(6)
         # drl_raw_action = np.zeros(6)
-        s1 = time.time()
 
         # Student Action (Residual form)
-        phy_action = self.a1_env.locomotion_controller.stance_leg_controller.get_model_action()
+        with profiler.span('model_action'):
+            phy_action = self.a1_env.locomotion_controller.stance_leg_controller.get_model_action()
         hp_action = drl_action + phy_action
         # hp_action = phy_action
         # hp_action = drl_action * self.gamma + phy_action * (1 - self.gamma)
-        s2 = time.time()
 
         # Teacher Action
-        ha_action = self.ha_teacher.get_action()
-        s3 = time.time()
+        with profiler.span('teacher_action'):
+            ha_action = self.ha_teacher.get_action()
         # Terminal Action by Coordinator
         # logger.debug(f"ha_action: {ha_action}")
         # logger.debug(f"hp_action: {hp_action}")
-        terminal_stance_ddq, action_mode = self.coordinator.determine_action(hp_action=hp_action, ha_action=ha_action,
-                                                                             epsilon=self.ha_teacher.epsilon)
-        s4 = time.time()
+        with profiler.span('coordinator'):
+            terminal_stance_ddq, action_mode = self.coordinator.determine_action(hp_action=hp_action,
+                                                                                 ha_action=ha_action,
+                                                                                 epsilon=self.ha_teacher.epsilon)
 
         # Decide nominal action to store into replay buffer
         if action_mode == ActionMode.TEACHER:
@@ -242,23 +277,13 @@ class A1Trainer:
         else:
             raise NotImplementedError(f"Unknown action mode: {action_mode}")
 
-        s5 = time.time()
-
-        stance_action, _ = self.a1_env.locomotion_controller.stance_leg_controller.map_ddq_to_action(
-            ddq=terminal_stance_ddq)
-        s51 = time.time()
-        swing_action = self.a1_env.locomotion_controller.swing_leg_controller.get_action()
-        s52 = time.time()
+        with profiler.span('stance_qp'):
+            stance_action, _ = self.a1_env.locomotion_controller.stance_leg_controller.map_ddq_to_action(
+                ddq=terminal_stance_ddq)
+        with profiler.span('swing'):
+            swing_action = self.a1_env.locomotion_controller.swing_leg_controller.get_action()
         motor_action = self.a1_env.locomotion_controller.get_motor_action(swing_action=swing_action,
                                                                           stance_action=stance_action)
-        s6 = time.time()
-        # print(f"get_terminal_action part1 time: {s1 - s0}")
-        # print(f"get_terminal_action part2 time: {s2 - s1}")
-        # print(f"get_terminal_action part3 time: {s3 - s2}")
-        # print(f"get_terminal_action part4 time: {s4 - s3}")
-        # print(f"get_terminal_action part5 time: {s5 - s4}")
-        # print(f"get_terminal_action part6 time: {s6 - s5}")
-        # print(f"get_terminal_action total time: {s6 - s0}")
 
         # print(f"terminal_stance_ddq: {terminal_stance_ddq}")
         # print(f"swing_action: {swing_action}")
@@ -11,11 +11,34 @@ import distutils.util as util
 from types import SimpleNamespace as Namespace
 # from src.ha_teacher import ha_teacher
 import matplotlib.pyplot as plt
+from src.logger.trajectory_recorder import load_trajectory
+
+
+# Fields read from the trajectory recorder logs
+PLOT_FIELDS = ['timestamp', 'tracking_error', 'student_ddq', 'teacher_ddq', 'stance_ddq_limit', 'base_position',
+               'desired_com_height', 'desired_speed', 'desired_twisting_speed', 'base_linear_vel_in_body_frame',
+               'base_angular_vel_in_body_frame', 'base_rpy', 'desired_ground_reaction_forces']
+
+
+def load_logged_frames(log_dir: str):
+    """
+    Frames of a trajectory recorder directory in the layout of the former pickled logs (plotted fields only)
+    """
+    columns = load_trajectory(log_dir, fields=PLOT_FIELDS)
+    frames = []
+    for i in range(len(columns['timestamp'])):
+        frame = {name: column[i] for name, column in columns.items()}
+        frame['desired_speed'] = (frame['desired_speed'], frame.pop('desired_twisting_speed'))
+        frames.append(frame)
+    return frames
 
 
 def plot_robot_trajectory(filepath: str) -> None:
-    with open(filepath, 'rb') as f:
-        phases = pickle.load(f)
+    if os.path.isdir(filepath):
+        phases = load_logged_frames(filepath)
+    else:
+        with open(filepath, 'rb') as f:
+            phases = pickle.load(f)
 
     zero_ref = []
     step = []
@@ -0,0 +1,176 @@
+import os
+import time
+
+from src.utils.profiler import SpanStats, profiler
+
+_monotonic_ns = time.monotonic_ns
+
+# What the control loop may drop while degraded (after an overrun)
+OVERRUN_POLICIES = ('skip_logging', 'reuse_drl_action')
+
+
+class _Stage:
+    __slots__ = ('scheduler', 'name', 'start')
+
+    def __init__(self, scheduler, name):
+        self.scheduler = scheduler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = _monotonic_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ns = _monotonic_ns() - self.start
+        self.scheduler._tick_stages[self.name] += ns
+        profiler.record(self.name, ns)
+        return False
+
+
+class PeriodicScheduler:
+    """
+    Runs a periodic task against absolute deadlines on CLOCK_MONOTONIC
+
+        scheduler = PeriodicScheduler(period=0.002)
+        scheduler.setup()  # From the thread running the loop
+        scheduler.start()
+        while running:
+            with scheduler.stage('get_action'):
+                ...
+            scheduler.wait()
+
+    Deadlines advance by exactly one period per tick, so the time spent in a tick never shifts the later ones. The
+    wait sleeps until `spin_us` before the deadline and spins for the rest (Python has no absolute `clock_nanosleep`,
+    and the sleep alone wakes up tens of us late). A tick that ends past its deadline is an overrun: the next tick
+    starts right away with the deadlines re-anchored on it, the slowest stage of the late tick is blamed, and the
+    scheduler reports `degraded` for `degrade_ticks` ticks so that the loop can drop optional work (`OVERRUN_POLICIES`).
+
+    Recorded per tick: release jitter (tick start - scheduled release), busy time and, on overruns, the time past the
+    deadline. Stages are also recorded in the profiler when it is enabled.
+    """
+
+    def __init__(self, period, cpu=None, fifo_priority=None, spin_us=50., degrade_ticks=10,
+                 overrun_policy=OVERRUN_POLICIES):
+        if period <= 0:
+            raise RuntimeError(f"Scheduler period must be positive, got {period}")
+        unknown = set(overrun_policy) - set(OVERRUN_POLICIES)
+        if unknown:
+            raise RuntimeError(f"Unknown overrun policy {sorted(unknown)}, expected some of {OVERRUN_POLICIES}")
+
+        self.period_ns = int(period * 1e9)
+        self.cpu = cpu
+        self.fifo_priority = fifo_priority
+        self.spin_ns = int(spin_us * 1e3)
+        self.degrade_ticks = degrade_ticks
+        self.overrun_policy = tuple(overrun_policy)
+
+        self.jitter = SpanStats('jitter')
+        self.busy = SpanStats('busy')
+        self.overrun = SpanStats('overrun')
+        self.overrun_stages = {}
+        self.ticks = 0
+
+        self._stages = {}
+        self._tick_stages = {}
+        self._deadline = 0
+        self._tick_start = 0
+        self._degraded = 0
+
+    def setup(self):
+        """
+        Pin the calling thread to `cpu` and raise it to SCHED_FIFO `fifo_priority`, where permitted
+        """
+        if self.cpu is not None:
+            try:
+                os.sched_setaffinity(0, {self.cpu})
+                print(f"Control loop pinned to CPU {self.cpu}")
+            except (AttributeError, OSError) as e:
+                print(f"Cannot pin the control loop to CPU {self.cpu}: {e}")
+        if self.fifo_priority is not None:
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.fifo_priority))
+                print(f"Control loop running with SCHED_FIFO priority {self.fifo_priority}")
+            except (AttributeError, OSError) as e:
+                print(f"Cannot set SCHED_FIFO priority {self.fifo_priority} (needs CAP_SYS_NICE or rtprio): {e}")
+
+    def start(self):
+        self._tick_start = _monotonic_ns()
+        self._deadline = self._tick_start + self.period_ns
+
+    def stage(self, name):
+        """
+        Context timing one stage of the current tick
+        """
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = _Stage(self, name)
+            self._tick_stages[name] = 0
+        return stage
+
+    @property
+    def degraded(self):
+        """
+        Whether a recent tick overran, the loop should then skip what `overrun_policy` allows
+        """
+        return self._degraded > 0
+
+    def skip(self, policy):
+        """
+        Whether the loop should apply `policy` (one of `OVERRUN_POLICIES`) in this tick
+        """
+        return self._degraded > 0 and policy in self.overrun_policy
+
+    def wait(self):
+        """
+        End the current tick: sleep until its deadline (or record the overrun) and start the next one
+        """
+        now = _monotonic_ns()
+        self.busy.add(now - self._tick_start)
+        self.ticks += 1
+        if self._degraded > 0:
+            self._degraded -= 1
+
+        release = self._deadline
+        if now > release:
+            self.overrun.add(now - release)
+            culprit = max(self._tick_stages, key=self._tick_stages.get) if self._tick_stages else 'unstaged'
+            self.overrun_stages[culprit] = self.overrun_stages.get(culprit, 0) + 1
+            self._degraded = self.degrade_ticks
+            release = now
+        else:
+            remaining = release - now - self.spin_ns
+            if remaining > 0:
+                time.sleep(remaining / 1e9)
+            while _monotonic_ns() < release:
+                pass
+            now = _monotonic_ns()
+
+        self.jitter.add(now - release)
+        self._tick_start = now
+        self._deadline = release + self.period_ns
+        for name in self._tick_stages:
+            self._tick_stages[name] = 0
+
+    def summary(self):
+        """
+        {jitter, busy, overrun: {count, mean_us, p50_us, p99_us, max_us}, ticks, overrun_stages}
+        """
+        return {'ticks': self.ticks,
+                'period_us': self.period_ns / 1e3,
+                'jitter': self.jitter.summary(),
+                'busy': self.busy.summary(),
+                'overrun': self.overrun.summary(),
+                'overrun_stages': dict(sorted(self.overrun_stages.items(), key=lambda x: -x[1]))}
+
+    def __str__(self):
+        lines = [f"{self.ticks} ticks of {self.period_ns / 1e3:.0f} us, {self.overrun.count} overruns",
+                 f"{'':<12}{'count':>10}{'p50 (us)':>12}{'p99 (us)':>12}{'max (us)':>12}"]
+        for stats in (self.jitter, self.busy, self.overrun):
+            s = stats.summary()
+            lines.append(f"{stats.name:<12}{s['count']:>10}{s['p50_us']:>12.1f}{s['p99_us']:>12.1f}"
+                         f"{s['max_us']:>12.1f}")
+        if self.overrun_stages:
+            lines.append("Overruns by slowest stage: " +
+                         ", ".join(f"{name} {count}" for name, count in self.summary()['overrun_stages'].items()))
+        return "\n".join(lines)
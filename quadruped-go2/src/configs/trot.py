@@ -19,6 +19,7 @@ def get_env_config():
     ha_teacher_config.correct = True
     ha_teacher_config.epsilon = 1
     ha_teacher_config.cvxpy_solver = "solver"
+    ha_teacher_config.patch_atlas = ""  # Patch gain atlas (.npz), LMIs solved online if empty
     config.ha_teacher = ha_teacher_config
 
     # Gait config
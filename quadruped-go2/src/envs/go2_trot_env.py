@@ -1,6 +1,7 @@
 """Policy outputs desired CoM speed for Go2 to track the desired speed."""
 
 import itertools
+import dataclasses
 import time
 from collections import deque
 from typing import Sequence
@@ -23,6 +24,7 @@ from src.physical_design import MATRIX_P
 from omegaconf import DictConfig
 
 from src.utils.utils import ActionMode, RobotPusher
+from src.utils.profiler import profiler
 
 
 # @torch.jit.script
@@ -228,6 +230,9 @@ class Go2TrotEnv:
 
         self._extras = dict()
 
+        # Trajectory recorder, the per-step logs are returned in `extras["logs"]` when it is not attached
+        self._recorder = None
+
         # Running a few steps with dummy commands to ensure JIT compilation
         if self._num_envs == 1 and self._use_real_robot:
             for state in range(16):
@@ -316,14 +321,14 @@ class Go2TrotEnv:
         self._steps_count += 1
         logs = []
 
-        start = time.time()
         # self._config.env_dt = 0.002
 
         for step in range(max(int(self._config.env_dt / self._robot.control_timestep), 1)):
             # print(f"config.env_dt: {self._config.env_dt}")
             # print(f"self._robot.control_timestep: {self._robot.control_timestep}")
-            self._gait_generator.update()
-            self._swing_leg_controller.update()
+            with profiler.span('gait_swing_update'):
+                self._gait_generator.update()
+                self._swing_leg_controller.update()
 
             # self._robot.state_estimator.update_ground_normal_vec()
             # self._robot.state_estimator.update_foot_contact(self._gait_generator.desired_contact_state)
@@ -339,20 +344,24 @@ class Go2TrotEnv:
             # Get swing leg action
             desired_foot_positions = self._swing_leg_controller.desired_foot_positions
 
-            self._desired_acc, self._solved_acc, self._qp_cost, self._num_clips = self._torque_optimizer.get_model_action(
-                foot_contact_state=self._gait_generator.desired_contact_state,
-                desired_foot_position=desired_foot_positions
-            )
+            with profiler.span('model_action'):
+                self._desired_acc, self._solved_acc, self._qp_cost, self._num_clips = \
+                    self._torque_optimizer.get_model_action(
+                        foot_contact_state=self._gait_generator.desired_contact_state,
+                        desired_foot_position=desired_foot_positions
+                    )
 
             # HP-Student action (residual form)
             # hp_action = self._desired_acc
             hp_action = drl_action + self._desired_acc
 
             # HA-Teacher update
-            self._robot.energy_2d = self.ha_teacher.update(self._torque_optimizer.tracking_error)
+            with profiler.span('teacher_update'):
+                self._robot.energy_2d = self.ha_teacher.update(self._torque_optimizer.tracking_error)
 
             # HA-Teacher action
-            ha_action, dwell_flag = self.ha_teacher.get_action()
+            with profiler.span('teacher_action'):
+                ha_action, dwell_flag = self.ha_teacher.get_action()
             # ha_action = to_torch(ha_action, device=self._device)
 
             # Use Normal Kp Kd
@@ -361,11 +370,13 @@ class Go2TrotEnv:
             print(f"hp_action: {hp_action}")
             print(f"ha_action: {ha_action}")
             print(f"self._torque_optimizer.tracking_error: {self._torque_optimizer.tracking_error}")
-            terminal_stance_ddq, action_mode = self.coordinator.get_terminal_action(hp_action=hp_action,
-                                                                                    ha_action=ha_action,
-                                                                                    plant_state=self._torque_optimizer.tracking_error,
-                                                                                    dwell_flag=dwell_flag,
-                                                                                    epsilon=self.ha_teacher.epsilon)
+            with profiler.span('coordinator'):
+                terminal_stance_ddq, action_mode = self.coordinator.get_terminal_action(
+                    hp_action=hp_action,
+                    ha_action=ha_action,
+                    plant_state=self._torque_optimizer.tracking_error,
+                    dwell_flag=dwell_flag,
+                    epsilon=self.ha_teacher.epsilon)
 
             terminal_stance_ddq = to_torch(terminal_stance_ddq, device=self._device)
             print(f"terminal_stance_ddq: {terminal_stance_ddq}")
@@ -381,6 +392,7 @@ class Go2TrotEnv:
             # print(f"ha_indices: {ha_indices}")
 
             # HP-Student in Control
+            qp_tic = profiler.tic()
             if len(hp_indices) > 0:
                 hp_motor_action, self._desired_acc[hp_indices], self._solved_acc[hp_indices], \
                     self._qp_cost[hp_indices], self._num_clips[hp_indices] = self._torque_optimizer.get_action(
@@ -398,6 +410,8 @@ class Go2TrotEnv:
                     safe_acc=terminal_stance_ddq[ha_indices]
                 )
 
+            profiler.toc('qp_solve', qp_tic)
+
             # Unknown Action Mode
             if len(hp_indices) == 0 and len(ha_indices) == 0:
                 raise RuntimeError(f"Unrecognized Action Mode: {action_mode}")
@@ -410,48 +424,54 @@ class Go2TrotEnv:
             # print(f"solved_acc: {self._solved_acc}")
             # print(f"motor_action: {motor_action}")
             # print(f"self._robot.base_angular_velocity_world_frame: {self._robot.base_angular_velocity_world_frame}")
-            logs.append(
-                dict(timestamp=self._robot.time_since_reset,
-                     base_position=torch.clone(self._robot.base_position),
-                     base_orientation_rpy=torch.clone(
-                         self._robot.base_orientation_rpy),
-                     base_velocity=torch.clone(self._robot.base_velocity_body_frame),
-                     base_angular_velocity=torch.clone(
-                         self._robot.base_angular_velocity_body_frame),
-                     motor_positions=torch.clone(self._robot.motor_positions),
-                     motor_velocities=torch.clone(self._robot.motor_velocities),
-                     motor_action=motor_action,
-                     motor_torques=self._robot.motor_torques,
-                     num_clips=self._num_clips,
-                     foot_contact_state=self._gait_generator.desired_contact_state,
-                     foot_contact_force=self._robot.foot_contact_forces,
-                     desired_swing_foot_position=desired_foot_positions,
-                     desired_acc_body_frame=self._desired_acc,
-                     desired_vx=self.desired_vx,
-                     desired_wz=self.desired_wz,
-                     desired_com_height=self.desired_com_height,
-                     ha_action=ha_action,
-                     hp_action=hp_action,
-                     action_mode=action_mode,
-                     acc_min=self._action_lb,
-                     acc_max=self._action_ub,
-                     energy=to_torch(self._robot.energy_2d, device=self._device),
-                     solved_acc_body_frame=self._solved_acc,
-                     foot_positions_in_base_frame=self._robot.foot_positions_in_base_frame,
-                     env_action=drl_action,
-                     env_obs=torch.clone(self._obs_buf)
-                     )
-            )
+            if self._recorder is not None:
+                self._record_step(desired_foot_positions=desired_foot_positions, motor_action=motor_action,
+                                  hp_action=hp_action, ha_action=ha_action, action_mode=action_mode,
+                                  drl_action=drl_action)
+            else:
+                logs.append(
+                    dict(timestamp=self._robot.time_since_reset,
+                         base_position=torch.clone(self._robot.base_position),
+                         base_orientation_rpy=torch.clone(
+                             self._robot.base_orientation_rpy),
+                         base_velocity=torch.clone(self._robot.base_velocity_body_frame),
+                         base_angular_velocity=torch.clone(
+                             self._robot.base_angular_velocity_body_frame),
+                         motor_positions=torch.clone(self._robot.motor_positions),
+                         motor_velocities=torch.clone(self._robot.motor_velocities),
+                         motor_action=motor_action,
+                         motor_torques=self._robot.motor_torques,
+                         num_clips=self._num_clips,
+                         foot_contact_state=self._gait_generator.desired_contact_state,
+                         foot_contact_force=self._robot.foot_contact_forces,
+                         desired_swing_foot_position=desired_foot_positions,
+                         desired_acc_body_frame=self._desired_acc,
+                         desired_vx=self.desired_vx,
+                         desired_wz=self.desired_wz,
+                         desired_com_height=self.desired_com_height,
+                         ha_action=ha_action,
+                         hp_action=hp_action,
+                         action_mode=action_mode,
+                         acc_min=self._action_lb,
+                         acc_max=self._action_ub,
+                         energy=to_torch(self._robot.energy_2d, device=self._device),
+                         solved_acc_body_frame=self._solved_acc,
+                         foot_positions_in_base_frame=self._robot.foot_positions_in_base_frame,
+                         env_action=drl_action,
+                         env_obs=torch.clone(self._obs_buf)
+                         )
+                )
 
-            if self._use_real_robot:
-                logs[-1]["base_acc"] = np.array(
-                    self._robot.raw_state.imu.accelerometer)  # pytype: disable=attribute-error
+                if self._use_real_robot:
+                    logs[-1]["base_acc"] = np.array(
+                        self._robot.raw_state.imu.accelerometer)  # pytype: disable=attribute-error
 
             # Error in last step
             err_prev = self._torque_optimizer.tracking_error
 
             ####################### Step The Motor Action #######################
-            self._robot.step(motor_action)
+            with profiler.span('robot_step'):
+                self._robot.step(motor_action)
             #####################################################################
 
             self._obs_buf = self._get_observations()
@@ -531,8 +551,6 @@ class Go2TrotEnv:
             if self._show_gui:
                 self._robot.render()
 
-        end = time.time()
-        print(f"***************** step duration: {end - start} *****************")
         return self._obs_buf, self._privileged_obs_buf, sum_reward, dones, self._extras
 
     def _get_observations(self):
@@ -630,6 +648,47 @@ class Go2TrotEnv:
     def device(self):
         return self._device
 
+    def attach_recorder(self, recorder):
+        """
+        Stream the per-step logs to a `TrajectoryRecorder` instead of returning them in `extras["logs"]`
+        """
+        self._recorder = recorder
+
+    def _record_step(self, desired_foot_positions, motor_action, hp_action, ha_action, action_mode, drl_action):
+        # The recorder copies every field into its buffers, so no clones are needed. The motor command is not an
+        # array, its fields are recorded as motor_action_<field> instead
+        frame = dict(timestamp=self._robot.time_since_reset,
+                     base_position=self._robot.base_position,
+                     base_orientation_rpy=self._robot.base_orientation_rpy,
+                     base_velocity=self._robot.base_velocity_body_frame,
+                     base_angular_velocity=self._robot.base_angular_velocity_body_frame,
+                     motor_positions=self._robot.motor_positions,
+                     motor_velocities=self._robot.motor_velocities,
+                     motor_torques=self._robot.motor_torques,
+                     num_clips=self._num_clips,
+                     foot_contact_state=self._gait_generator.desired_contact_state,
+                     foot_contact_force=self._robot.foot_contact_forces,
+                     desired_swing_foot_position=desired_foot_positions,
+                     desired_acc_body_frame=self._desired_acc,
+                     desired_vx=self.desired_vx,
+                     desired_wz=self.desired_wz,
+                     desired_com_height=self.desired_com_height,
+                     ha_action=ha_action,
+                     hp_action=hp_action,
+                     action_mode=action_mode,
+                     acc_min=self._action_lb,
+                     acc_max=self._action_ub,
+                     energy=self._robot.energy_2d,
+                     solved_acc_body_frame=self._solved_acc,
+                     foot_positions_in_base_frame=self._robot.foot_positions_in_base_frame,
+                     env_action=drl_action,
+                     env_obs=self._obs_buf)
+        for field in dataclasses.fields(motor_action):
+            frame[f"motor_action_{field.name}"] = getattr(motor_action, field.name)
+        if self._use_real_robot:
+            frame["base_acc"] = self._robot.raw_state.imu.accelerometer  # pytype: disable=attribute-error
+        self._recorder.record(frame)
+
     @property
     def robot(self):
         return self._robot
@@ -14,6 +14,8 @@ from numpy.linalg import pinv
 
 from src.physical_design import MATRIX_P
 from src.utils.utils import energy_value, energy_value_2d
+from src.ha_teacher.patch_problem import get_patch_problem
+from src.ha_teacher.patch_atlas import PatchAtlas
 
 np.set_printoptions(suppress=True)
 
@@ -33,6 +35,11 @@ class HATeacher:
         self.teacher_correct = torch.full((self._num_envs,), teacher_cfg.correct, dtype=torch.bool, device=device)
 
         self.cvxpy_solver = teacher_cfg.cvxpy_solver
+
+        # Offline patch gains (see `patch_atlas`), looked up instead of solving the LMIs at runtime
+        patch_atlas = teacher_cfg.get('patch_atlas', '')
+        self.patch_atlas = PatchAtlas(patch_atlas) if patch_atlas else None
+
         self.p_mat = to_torch(MATRIX_P, device=device)
 
         # HAC Runtime
@@ -155,6 +162,11 @@ class HATeacher:
 
     def realtime_patch(self, idx):
         roll, pitch, yaw = self._plant_state[idx, 3:6]
+        if self.patch_atlas is not None:
+            kp, kd = self.patch_atlas.lookup(roll, pitch, yaw)
+            self._patch_kp[idx, :] = to_torch(kp, device=self._device)
+            self._patch_kd[idx, :] = to_torch(kd, device=self._device)
+            return
         self._patch_kp[idx, :], self._patch_kd[idx, :] = self.system_patch(roll=roll.cpu(), pitch=pitch.cpu(),
                                                                            yaw=yaw.cpu(),
                                                                            device=self._device)
@@ -168,6 +180,9 @@ class HATeacher:
         """
          Computes the patch gain with roll pitch yaw.
 
+         The LMIs are built and canonicalized once per process (see `PatchProblem`), each call only
+         substitutes the attitude-dependent Rzyx and re-solves.
+
          Args:
            roll: Roll angle (rad).
            pitch: Pitch angle (rad).
@@ -179,129 +194,19 @@ class HATeacher:
            F_kd: Derivative feedback gain matrix.
          """
 
-        # Rotation matrices
-        Rx = np.array([[1, 0, 0],
-                       [0, np.cos(roll), -np.sin(roll)],
-                       [0, np.sin(roll), np.cos(roll)]])
-        Ry = np.array([[np.cos(pitch), 0, np.sin(pitch)],
-                       [0, 1, 0],
-                       [-np.sin(pitch), 0, np.cos(pitch)]])
-        Rz = np.array([[np.cos(yaw), -np.sin(yaw), 0],
-                       [np.sin(yaw), np.cos(yaw), 0],
-                       [0, 0, 1]])
-        Rzyx = Rz.dot(Ry.dot(Rx))
-        # print(f"Rzyx: {Rzyx}")
-
-        Rzyx = np.array([[np.cos(yaw) / np.cos(pitch), np.sin(yaw) / np.cos(pitch), 0],
-                         [-np.sin(yaw), np.cos(yaw), 0],
-                         [np.cos(yaw) * np.tan(pitch), np.sin(yaw) * np.tan(pitch), 1]])
-
-        bP = np.array([[140.6434, 0, 0, 0, 0, 0, 5.3276, 0, 0, 0],
-                       [0, 134.7596, 0, 0, 0, 0, 0, 6.6219, 0, 0],
-                       [0, 0, 134.7596, 0, 0, 0, 0, 0, 6.622, 0],
-                       [0, 0, 0, 49.641, 0, 0, 0, 0, 0, 6.8662],
-                       [0, 0, 0, 0, 11.1111, 0, 0, 0, 0, 0],
-                       [0, 0, 0, 0, 0, 3.3058, 0, 0, 0, 0],
-                       [5.3276, 0, 0, 0, 0, 0, 3.6008, 0, 0, 0],
-                       [0, 6.6219, 0, 0, 0, 0, 0, 3.6394, 0, 0],
-                       [0, 0, 6.622, 0, 0, 0, 0, 0, 3.6394, 0],
-                       [0, 0, 0, 6.8662, 0, 0, 0, 0, 0, 4.3232]])
-
-        # Sampling period
-        T = 1 / 30  # work in 25 to 30
-
-        # System matrices (continuous-time)
-        aA = np.zeros((10, 10))
-        aA[0, 6] = 1
-        aA[1:4, 7:10] = Rzyx
-        aB = np.zeros((10, 6))
-        aB[4:, :] = np.eye(6)
-
-        # System matrices (discrete-time)
-        B = aB * T
-        A = np.eye(10) + T * aA
-
-        alpha = 0.8
-        kappa = 0.01
-        chi = 0.2
-        # gamma = 1
-        # hd = 0.000
-        gamma1 = 1
-        gamma2 = 1  # 1
-
-        b1 = 1 / 0.15  # height  0.15
-        b2 = 1 / 0.35  # velocity 0.3
-        # b3 = 1 / 0.1   # yaw 0.1
-        # b4 = 1 / 0.5   # yaw rate 1
-
-        D = np.array([[b1, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-                      [0, 0, 0, 0, b2, 0, 0, 0, 0, 0]])
-        # [0, 0, 0, b3, 0, 0, 0, 0, 0, 0],
-        # [0, 0, 0, 0, 0, 0, 0, 0, 0, b4]])
-        c1 = 1 / 45
-        c2 = 1 / 70
-        C = np.array([[c1, 0, 0, 0, 0, 0],
-                      [0, c1, 0, 0, 0, 0],
-                      [0, 0, c1, 0, 0, 0],
-                      [0, 0, 0, c2, 0, 0],
-                      [0, 0, 0, 0, c2, 0],
-                      [0, 0, 0, 0, 0, c2]])
-
-        Q = cp.Variable((10, 10), PSD=True)
-        T = cp.Variable((6, 6), PSD=True)
-        R = cp.Variable((6, 10))
-        mu = cp.Variable((1, 1))
-
-        constraints = [cp.bmat([[(alpha - kappa * (1 + (1 / gamma2))) * Q, Q @ A.T + R.T @ B.T],
-                                [A @ Q + B @ R, Q / (1 + gamma2)]]) >> 0,
-                       cp.bmat([[Q, R.T],
-                                [R, T]]) >> 0,
-                       (1 - chi * gamma1) * mu - (1 - (2 * chi) + (chi / gamma1)) >> 0,
-                       Q - mu * np.linalg.inv(bP) >> 0,
-                       np.identity(2) - D @ Q @ D.transpose() >> 0,
-                       np.identity(6) - C @ T @ C.transpose() >> 0,
-                       # T - hd * np.identity(6) >> 0,
-                       mu - 1.0 >> 0,
-                       ]
-
-        # Define problem and objective
-        problem = cp.Problem(cp.Minimize(0), constraints)
-
-        # Solve the problem
-        problem.solve(solver=cp.CVXOPT)
-
-        # Extract optimal values
+        F_kp, F_kd, status, feasible = get_patch_problem().solve(roll, pitch, yaw)
+
         # Check if the problem is solved successfully
-        if problem.status == 'optimal':
+        if status == 'optimal':
             print("Optimization successful.")
         else:
             print("Optimization failed.")
 
-        optimal_Q = Q.value
-        optimal_R = R.value
-        optimal_mu = mu.value
-
-        # print(mu.value)
-        # print(Q.value)
-
-        P = np.linalg.inv(optimal_Q)
-
-        # Compute aF
-        aF = np.round(aB @ optimal_R @ P, 0)
-        Fb2 = aF[6:10, 0:4]
-
-        # Compute F_kp
-        F_kp = -np.block([
-            [np.zeros((2, 6))],
-            [np.zeros((4, 2)), Fb2]])
-        # Compute F_kd
-        F_kd = -aF[4:10, 4:10]
-
         # print(f"Solved F_kp is: {F_kp}")
         # print(f"Solved F_kd is: {F_kd}")
 
         # Check if the problem is solved successfully
-        if np.all(np.linalg.eigvals(P) > 0):
+        if feasible:
             print("LMIs feasible")
         else:
             print("LMIs infeasible")
@@ -0,0 +1,166 @@
+import os
+import time
+import argparse
+import numpy as np
+import multiprocessing as mp
+
+import cvxpy as cp
+
+from src.ha_teacher.patch_problem import get_patch_problem
+
+AXES = ('roll', 'pitch', 'yaw')
+
+
+def _solve_node(args):
+    solver, roll, pitch, yaw = args
+    try:
+        F_kp, F_kd, status, feasible = get_patch_problem(solver).solve(roll, pitch, yaw)
+    except (cp.error.SolverError, np.linalg.LinAlgError):
+        # No solution at all (e.g., an infeasible status leaves Q without a value)
+        return None, None, False
+    return F_kp, F_kd, status == 'optimal' and feasible
+
+
+def build_atlas(roll_grid, pitch_grid, yaw_grid, solver=cp.CVXOPT, workers=None):
+    """
+    Solve the patch LMIs on every (roll, pitch, yaw) grid node in a process pool (one compiled problem per worker)
+    return: kp (R, P, Y, 6, 6), kd (R, P, Y, 6, 6), feasible (R, P, Y)
+    """
+    shape = (len(roll_grid), len(pitch_grid), len(yaw_grid))
+    nodes = [(solver, r, p, y) for r in roll_grid for p in pitch_grid for y in yaw_grid]
+    kp = np.zeros(shape + (6, 6))
+    kd = np.zeros(shape + (6, 6))
+    feasible = np.zeros(shape, dtype=bool)
+
+    start_time = time.time()
+    with mp.Pool(processes=workers) as pool:
+        for i, (F_kp, F_kd, ok) in enumerate(pool.imap(_solve_node, nodes, chunksize=4)):
+            idx = np.unravel_index(i, shape)
+            feasible[idx] = ok
+            if ok:
+                kp[idx], kd[idx] = F_kp, F_kd
+            if (i + 1) % 100 == 0 or i + 1 == len(nodes):
+                print(f"Solved {i + 1}/{len(nodes)} patches ({time.time() - start_time:.1f}s)")
+    return kp, kd, feasible
+
+
+def save_atlas(path, roll_grid, pitch_grid, yaw_grid, kp, kd, feasible):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez_compressed(path, roll=np.asarray(roll_grid), pitch=np.asarray(pitch_grid), yaw=np.asarray(yaw_grid),
+                        kp=kp, kd=kd, feasible=feasible)
+    print(f"Patch atlas saved to {path}, {int(feasible.sum())}/{feasible.size} nodes feasible")
+
+
+class PatchAtlas:
+    """
+    Patch gains (F_kp, F_kd) precomputed on a uniform (roll, pitch, yaw) grid, see `build_atlas`
+
+    `lookup` interpolates trilinearly within the grid cell of the attitude (clamped to the grid range). If a corner
+    of that cell is infeasible, it returns the gains of the feasible node closest to the nearest node instead. An axis
+    with a single node is ignored (e.g., roll, which the patch model does not depend on).
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            grids = [np.asarray(data[axis], dtype=np.float64) for axis in AXES]
+            kp, kd, feasible = data['kp'], data['kd'], data['feasible'].astype(bool)
+        if not feasible.any():
+            raise RuntimeError(f"Patch atlas {path} has no feasible node")
+
+        self.path = path
+        self.shape = feasible.shape
+        self.feasible = feasible
+        self._gains = np.concatenate((kp.reshape(-1, 36), kd.reshape(-1, 36)), axis=1)
+
+        # Per axis: (first node, 1 / spacing, number of nodes, flat index stride of the next node)
+        strides = (self.shape[1] * self.shape[2], self.shape[2], 1)
+        self._axes = []
+        for grid, n, stride in zip(grids, self.shape, strides):
+            inv_step = (n - 1) / (grid[-1] - grid[0]) if n > 1 else 0.
+            self._axes.append((float(grid[0]), inv_step, n, stride if n > 1 else 0))
+
+        # Cells whose 8 corners are feasible, keyed by their lower corner
+        cell_ok = feasible.copy()
+        for axis, n in enumerate(self.shape):
+            if n > 1:
+                upper = np.take(cell_ok, np.append(np.arange(1, n), n - 1), axis=axis)
+                cell_ok &= upper
+        self._cell_ok = cell_ok.ravel().tolist()
+
+        # Nearest feasible node of every node (grid units), in chunks to bound the distance matrix
+        nodes = np.stack(np.meshgrid(*[np.arange(n) for n in self.shape], indexing='ij'), axis=-1).reshape(-1, 3)
+        feasible_nodes = np.flatnonzero(feasible.ravel())
+        self._nearest_feasible = []
+        for chunk in np.array_split(nodes, max(1, len(nodes) // 1024)):
+            distances = ((chunk[:, None, :] - nodes[None, feasible_nodes, :]) ** 2).sum(axis=-1)
+            self._nearest_feasible += feasible_nodes[distances.argmin(axis=1)].tolist()
+
+    @staticmethod
+    def _locate(value, lo, inv_step, n):
+        if n == 1:
+            return 0, 0.
+        x = (value - lo) * inv_step
+        if x <= 0.:
+            return 0, 0.
+        if x >= n - 1:
+            return n - 2, 1.
+        i = int(x)
+        return i, x - i
+
+    def lookup(self, roll, pitch, yaw):
+        """
+        Patch gains (F_kp (6, 6), F_kd (6, 6)) at the given attitude
+        """
+        (r_lo, r_inv, r_n, r_stride), (p_lo, p_inv, p_n, p_stride), (y_lo, y_inv, y_n, y_stride) = self._axes
+        i, u = self._locate(float(roll), r_lo, r_inv, r_n)
+        j, v = self._locate(float(pitch), p_lo, p_inv, p_n)
+        k, w = self._locate(float(yaw), y_lo, y_inv, y_n)
+        base = i * (p_n * y_n) + j * y_n + k
+
+        if self._cell_ok[base]:
+            corners = [base, base + y_stride, base + p_stride, base + p_stride + y_stride]
+            corners += [c + r_stride for c in corners]
+            vw, v_w, _vw, _v_w = (1 - v) * (1 - w), (1 - v) * w, v * (1 - w), v * w
+            weights = [(1 - u) * vw, (1 - u) * v_w, (1 - u) * _vw, (1 - u) * _v_w, u * vw, u * v_w, u * _vw, u * _v_w]
+            gains = np.dot(weights, self._gains[corners])
+        else:
+            nearest = (i + (u >= 0.5)) * (p_n * y_n) + (j + (v >= 0.5)) * y_n + (k + (w >= 0.5))
+            gains = self._gains[self._nearest_feasible[nearest]]
+
+        return gains[:36].reshape(6, 6), gains[36:].reshape(6, 6)
+
+
+def _grid(bounds, num):
+    return np.linspace(bounds[0], bounds[1], num) if num > 1 else np.array([0.5 * (bounds[0] + bounds[1])])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the (roll, pitch, yaw) patch gain atlas")
+    parser.add_argument('--out', type=str, default='models/patch_atlas.npz', help='Output .npz path')
+    parser.add_argument('--roll', type=float, nargs=2, default=(-0.3, 0.3), help='Roll range (rad)')
+    parser.add_argument('--pitch', type=float, nargs=2, default=(-0.3, 0.3), help='Pitch range (rad)')
+    parser.add_argument('--yaw', type=float, nargs=2, default=(-0.5, 0.5), help='Yaw range (rad)')
+    parser.add_argument('--roll_num', type=int, default=1,
+                        help='Roll nodes (the patch model does not depend on roll, so one is enough)')
+    parser.add_argument('--pitch_num', type=int, default=25, help='Pitch nodes')
+    parser.add_argument('--yaw_num', type=int, default=41, help='Yaw nodes')
+    parser.add_argument('--solver', type=str, default=cp.CVXOPT, help='cvxpy solver')
+    parser.add_argument('--workers', type=int, default=None, help='Pool size (all cores by default)')
+    args = parser.parse_args()
+
+    grids = _grid(args.roll, args.roll_num), _grid(args.pitch, args.pitch_num), _grid(args.yaw, args.yaw_num)
+    kp, kd, feasible = build_atlas(*grids, solver=args.solver, workers=args.workers)
+    save_atlas(args.out, *grids, kp, kd, feasible)
+
+    # Lookup latency
+    atlas = PatchAtlas(args.out)
+    rng = np.random.default_rng(0)
+    attitudes = rng.uniform([b[0] for b in (args.roll, args.pitch, args.yaw)],
+                            [b[1] for b in (args.roll, args.pitch, args.yaw)], (10000, 3))
+    latencies = np.zeros(len(attitudes))
+    for n, (roll, pitch, yaw) in enumerate(attitudes):
+        start = time.perf_counter_ns()
+        atlas.lookup(roll, pitch, yaw)
+        latencies[n] = time.perf_counter_ns() - start
+    latencies /= 1e3
+    print(f"Lookup: p50 {np.percentile(latencies, 50):.1f} us, p99 {np.percentile(latencies, 99):.1f} us")
@@ -0,0 +1,171 @@
+import time
+import argparse
+import numpy as np
+import cvxpy as cp
+
+# Constants of the patch LMIs
+BP = np.array([[140.6434, 0, 0, 0, 0, 0, 5.3276, 0, 0, 0],
+               [0, 134.7596, 0, 0, 0, 0, 0, 6.6219, 0, 0],
+               [0, 0, 134.7596, 0, 0, 0, 0, 0, 6.622, 0],
+               [0, 0, 0, 49.641, 0, 0, 0, 0, 0, 6.8662],
+               [0, 0, 0, 0, 11.1111, 0, 0, 0, 0, 0],
+               [0, 0, 0, 0, 0, 3.3058, 0, 0, 0, 0],
+               [5.3276, 0, 0, 0, 0, 0, 3.6008, 0, 0, 0],
+               [0, 6.6219, 0, 0, 0, 0, 0, 3.6394, 0, 0],
+               [0, 0, 6.622, 0, 0, 0, 0, 0, 3.6394, 0],
+               [0, 0, 0, 6.8662, 0, 0, 0, 0, 0, 4.3232]])
+
+SAMPLING_PERIOD = 1 / 30  # work in 25 to 30
+ALPHA = 0.8
+KAPPA = 0.01
+CHI = 0.2
+GAMMA1 = 1
+GAMMA2 = 1
+
+B1 = 1 / 0.15  # height  0.15
+B2 = 1 / 0.35  # velocity 0.3
+D = np.array([[B1, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+              [0, 0, 0, 0, B2, 0, 0, 0, 0, 0]])
+C1 = 1 / 45
+C2 = 1 / 70
+C = np.diag([C1, C1, C1, C2, C2, C2])
+
+
+def rotation_rate_matrix(roll, pitch, yaw):
+    """
+    Rzyx of the patch model, the only part of the LMIs that depends on the attitude
+    """
+    del roll
+    pitch, yaw = float(pitch), float(yaw)  # Also accepts 0-d tensors
+    return np.array([[np.cos(yaw) / np.cos(pitch), np.sin(yaw) / np.cos(pitch), 0],
+                     [-np.sin(yaw), np.cos(yaw), 0],
+                     [np.cos(yaw) * np.tan(pitch), np.sin(yaw) * np.tan(pitch), 1]])
+
+
+class PatchProblem:
+    """
+    The patch LMIs with Rzyx as a `cp.Parameter`
+
+    The problem is DPP, so cvxpy canonicalizes it on the first solve only and later solves just substitute the new
+    Rzyx. Q, R and mu keep their values between solves and are passed as a warm start to solvers that support it
+    (e.g., SCS); CVXOPT always starts from scratch.
+    """
+
+    def __init__(self, solver=cp.CVXOPT):
+        self.solver = solver
+        self.Rzyx = cp.Parameter((3, 3), name='Rzyx')
+
+        # System matrices (continuous-time), Rzyx enters aA[1:4, 7:10]
+        aA = np.zeros((10, 10))
+        aA[0, 6] = 1
+        rows = np.zeros((10, 3))
+        rows[1:4] = np.eye(3)
+        cols = np.zeros((3, 10))
+        cols[:, 7:10] = np.eye(3)
+        self.aB = np.zeros((10, 6))
+        self.aB[4:, :] = np.eye(6)
+
+        # System matrices (discrete-time)
+        B = self.aB * SAMPLING_PERIOD
+        A = np.eye(10) + SAMPLING_PERIOD * aA + SAMPLING_PERIOD * (rows @ self.Rzyx @ cols)
+
+        self.Q = cp.Variable((10, 10), PSD=True)
+        self.T = cp.Variable((6, 6), PSD=True)
+        self.R = cp.Variable((6, 10))
+        self.mu = cp.Variable((1, 1))
+        Q, T, R, mu = self.Q, self.T, self.R, self.mu
+
+        constraints = [cp.bmat([[(ALPHA - KAPPA * (1 + (1 / GAMMA2))) * Q, Q @ A.T + R.T @ B.T],
+                                [A @ Q + B @ R, Q / (1 + GAMMA2)]]) >> 0,
+                       cp.bmat([[Q, R.T],
+                                [R, T]]) >> 0,
+                       (1 - CHI * GAMMA1) * mu - (1 - (2 * CHI) + (CHI / GAMMA1)) >> 0,
+                       Q - mu * np.linalg.inv(BP) >> 0,
+                       np.identity(2) - D @ Q @ D.transpose() >> 0,
+                       np.identity(6) - C @ T @ C.transpose() >> 0,
+                       mu - 1.0 >> 0,
+                       ]
+        self.problem = cp.Problem(cp.Minimize(0), constraints)
+        if not self.problem.is_dpp():
+            raise RuntimeError("Patch problem is not DPP, it would be canonicalized on every solve")
+
+    def solve(self, roll, pitch, yaw):
+        """
+        Returns (F_kp, F_kd, problem status, LMIs feasible)
+        """
+        self.Rzyx.value = rotation_rate_matrix(roll, pitch, yaw)
+        self.problem.solve(solver=self.solver, warm_start=True)
+
+        P = np.linalg.inv(self.Q.value)
+
+        # Compute aF
+        aF = np.round(self.aB @ self.R.value @ P, 0)
+        Fb2 = aF[6:10, 0:4]
+
+        # Compute F_kp
+        F_kp = -np.block([
+            [np.zeros((2, 6))],
+            [np.zeros((4, 2)), Fb2]])
+        # Compute F_kd
+        F_kd = -aF[4:10, 4:10]
+
+        return F_kp, F_kd, self.problem.status, bool(np.all(np.linalg.eigvals(P) > 0))
+
+
+_patch_problems = {}
+
+
+def get_patch_problem(solver=cp.CVXOPT):
+    """
+    Process-wide patch problem per solver, built on first use (e.g., within the patch process)
+    """
+    if solver not in _patch_problems:
+        _patch_problems[solver] = PatchProblem(solver=solver)
+    return _patch_problems[solver]
+
+
+def _percentiles(times):
+    times = np.asarray(times) * 1e3
+    return (f"p50 {np.percentile(times, 50):7.1f} ms  p90 {np.percentile(times, 90):7.1f} ms  "
+            f"p99 {np.percentile(times, 99):7.1f} ms  max {times.max():7.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Patch solve time: rebuilt on every call vs. compiled once")
+    parser.add_argument('--num', type=int, default=50, help='Number of patches')
+    parser.add_argument('--solver', type=str, default=cp.CVXOPT, help='cvxpy solver')
+    parser.add_argument('--max_angle', type=float, default=0.2, help='Roll/pitch/yaw sampled in +-max_angle (rad)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    attitudes = rng.uniform(-args.max_angle, args.max_angle, (args.num, 3))
+
+    # Per patch: total time and the part spent outside the solver (problem construction and canonicalization)
+    rebuilt_times, rebuilt_overheads, rebuilt_gains = [], [], []
+    for roll, pitch, yaw in attitudes:
+        start = time.perf_counter()
+        rebuilt = PatchProblem(solver=args.solver)
+        build_time = time.perf_counter() - start
+        rebuilt_gains.append(rebuilt.solve(roll, pitch, yaw)[:2])
+        rebuilt_times.append(time.perf_counter() - start)
+        rebuilt_overheads.append(build_time + rebuilt.problem.compilation_time)
+
+    start = time.perf_counter()
+    patch_problem = PatchProblem(solver=args.solver)
+    patch_problem.solve(0., 0., 0.)
+    first_time = time.perf_counter() - start
+
+    cached_times, cached_overheads, max_diff = [], [], 0.
+    for (roll, pitch, yaw), (kp, kd) in zip(attitudes, rebuilt_gains):
+        start = time.perf_counter()
+        F_kp, F_kd, _, _ = patch_problem.solve(roll, pitch, yaw)
+        cached_times.append(time.perf_counter() - start)
+        cached_overheads.append(patch_problem.problem.compilation_time)
+        max_diff = max(max_diff, np.abs(F_kp - kp).max(), np.abs(F_kd - kd).max())
+
+    print(f"{args.num} patches with {args.solver}")
+    print(f"Rebuilt per call, total:          {_percentiles(rebuilt_times)}")
+    print(f"Rebuilt per call, canonicalize:   {_percentiles(rebuilt_overheads)}")
+    print(f"Compiled once, total:             {_percentiles(cached_times)}")
+    print(f"Compiled once, canonicalize:      {_percentiles(cached_overheads)}")
+    print(f"Build + first solve: {first_time * 1e3:.1f} ms, max gain difference: {max_diff}")
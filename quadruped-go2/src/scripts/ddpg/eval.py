@@ -22,6 +22,7 @@ import yaml
 
 from isaacgym.terrain_utils import *
 from src.envs import env_wrappers
+from src.utils.trajectory_recorder import TrajectoryRecorder
 
 torch.set_printoptions(precision=2, sci_mode=False)
 
@@ -35,6 +36,7 @@ flags.DEFINE_bool("use_real_robot", False, "whether to use real robot.")
 flags.DEFINE_integer("num_envs", 1,
                      "number of environments to evaluate in parallel.")
 flags.DEFINE_bool("save_traj", True, "whether to save trajectory.")
+flags.DEFINE_bool("stream_traj", False, "whether to stream the trajectory to chunked npz files.")
 flags.DEFINE_bool("use_contact_sensor", True, "whether to use contact sensor.")
 FLAGS = flags.FLAGS
 
@@ -84,6 +86,14 @@ def main(argv):
                            show_gui=FLAGS.show_gui,
                            use_real_robot=FLAGS.use_real_robot)
 
+    # Stream the trajectory to disk instead of keeping all the logs in memory
+    recorder = None
+    if FLAGS.stream_traj:
+        mode = "real" if FLAGS.use_real_robot else "sim"
+        recorder = TrajectoryRecorder(path=os.path.join(os.path.dirname(FLAGS.traj_dir),
+                                                        f"eval_{mode}_{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}"))
+        env.attach_recorder(recorder)
+
     # Robot pusher
     if FLAGS.enable_pusher:
         env._pusher.push_enable = True
@@ -168,7 +178,10 @@ def main(argv):
 
     print(f"Total reward: {total_reward}")
     print(f"Time elapsed: {time.time() - start_time}")
-    if FLAGS.use_real_robot or FLAGS.save_traj:
+    if recorder is not None:
+        recorder.close()
+        print(f"Data logged to: {recorder.path}")
+    elif FLAGS.use_real_robot or FLAGS.save_traj:
         mode = "real" if FLAGS.use_real_robot else "sim"
         output_dir = (
             f"eval_{mode}_{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}.pkl")
@@ -21,6 +21,7 @@ import yaml
 
 from isaacgym.terrain_utils import *
 from src.envs import env_wrappers
+from src.utils.profiler import profiler
 
 torch.set_printoptions(precision=2, sci_mode=False)
 
@@ -33,6 +34,7 @@ flags.DEFINE_integer("num_envs", 1,
                      "number of environments to evaluate in parallel.")
 flags.DEFINE_bool("save_traj", True, "whether to save trajectory.")
 flags.DEFINE_bool("use_contact_sensor", True, "whether to use contact sensor.")
+flags.DEFINE_bool("profile", False, "whether to time each phase of the control step.")
 FLAGS = flags.FLAGS
 
 
@@ -52,6 +54,7 @@ def get_latest_policy_path(logdir):
 
 def main(argv):
     del argv  # unused
+    profiler.enabled = FLAGS.profile
     # print(f"flag: {FLAGS.save_traj}")
     # time.sleep(123)
 
@@ -155,7 +158,8 @@ def main(argv):
             # print(f"state is: {type(action2)}")
 
             # Original A1 Policy
-            action = to_torch(ddpg_agent.actor(state.cpu().numpy()).numpy(), device=device)
+            with profiler.span('actor'):
+                action = to_torch(ddpg_agent.actor(state.cpu().numpy()).numpy(), device=device)
 
             # Add beta noise
             print(f"pre action is: {action}")
@@ -167,7 +171,8 @@ def main(argv):
             # print(f"action is: {to_torch(action.numpy())}")
             # print(f"action is: {type(to_torch(action))}")
             # action = torch.zeros(6).unsqueeze(dim=0)
-            state, _, reward, done, info = env.step(action)
+            with profiler.span('env_step'):
+                state, _, reward, done, info = env.step(action)
             print(f"Time: {env.robot.time_since_reset}, Reward: {reward}")
 
             total_reward += reward
@@ -195,6 +200,10 @@ def main(argv):
             pickle.dump(logs, fh)
         print(f"Data logged to: {output_path}")
 
+    if profiler.enabled:
+        print(f"Hot path profile:\n{profiler}")
+        profiler.save_json(os.path.join(os.path.dirname(FLAGS.traj_dir), "profile.json"))
+
 
 if __name__ == "__main__":
     app.run(main)
@@ -13,6 +13,7 @@ from ml_collections.config_flags import config_flags
 from rsl_rl.runners import OffPolicyRunner
 
 from src.envs import env_wrappers
+from src.utils.profiler import profiler
 
 config_flags.DEFINE_config_file("config", "src/configs/trot.py", "experiment configuration.")
 flags.DEFINE_integer("num_envs", 4, "number of parallel environments.")
@@ -22,11 +23,13 @@ flags.DEFINE_bool("enable_pusher", False, "whether to enable the robot pusher.")
 flags.DEFINE_bool("show_gui", True, "whether to show GUI.")
 flags.DEFINE_string("logdir", "logs", "logdir.")
 flags.DEFINE_string("load_checkpoint", None, "checkpoint to load.")
+flags.DEFINE_bool("profile", False, "whether to time each phase of the control step.")
 FLAGS = flags.FLAGS
 
 
 def main(argv):
     del argv  # unused
+    profiler.enabled = FLAGS.profile
     device = "cuda" if FLAGS.use_gpu else "cpu"
     config = FLAGS.config
 
@@ -61,6 +64,14 @@ def main(argv):
     ddpg_runner.learn(num_learning_iterations=config.training.runner.max_iterations,
                       init_at_random_ep_len=True)
 
+    if profiler.enabled:
+        from torch.utils.tensorboard import SummaryWriter
+        writer = SummaryWriter(logdir)
+        profiler.write_scalars(writer.add_scalar, config.training.runner.max_iterations)
+        writer.close()
+        print(f"Hot path profile:\n{profiler}")
+        profiler.save_json(os.path.join(logdir, "profile.json"))
+
 
 if __name__ == "__main__":
     app.run(main)
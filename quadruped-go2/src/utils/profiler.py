@@ -0,0 +1,208 @@
+import json
+import time
+import functools
+
+_perf_counter_ns = time.perf_counter_ns
+
+# Log-linear histogram buckets: exact below 16 ns, then 8 buckets per power of two (<= 12.5% relative error)
+SUB_BUCKETS = 8
+NUM_BUCKETS = 64 * SUB_BUCKETS
+
+
+def _bucket(ns):
+    if ns < 2 * SUB_BUCKETS:
+        return ns if ns > 0 else 0
+    shift = ns.bit_length() - 4
+    return (shift + 1) * SUB_BUCKETS + (ns >> shift) - SUB_BUCKETS
+
+
+def _bucket_bounds(idx):
+    if idx < 2 * SUB_BUCKETS:
+        return idx, idx + 1
+    shift = idx // SUB_BUCKETS - 1
+    low = (idx % SUB_BUCKETS + SUB_BUCKETS) << shift
+    return low, low + (1 << shift)
+
+
+class SpanStats:
+    """
+    Preallocated duration histogram of one span
+    """
+    __slots__ = ('name', 'counts', 'count', 'total_ns', 'max_ns')
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add(self, ns):
+        self.counts[_bucket(ns)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, q):
+        """
+        Approximate q-th percentile (ns), the midpoint of the bucket holding it
+        """
+        if self.count == 0:
+            return 0.
+        rank = q / 100. * self.count
+        cumulative = 0
+        for idx, c in enumerate(self.counts):
+            cumulative += c
+            if c and cumulative >= rank:
+                low, high = _bucket_bounds(idx)
+                return min(0.5 * (low + high), self.max_ns)
+        return float(self.max_ns)
+
+    def summary(self):
+        return {'count': self.count,
+                'mean_us': self.total_ns / max(self.count, 1) / 1e3,
+                'p50_us': self.percentile(50) / 1e3,
+                'p99_us': self.percentile(99) / 1e3,
+                'max_us': self.max_ns / 1e3}
+
+
+class _Span:
+    __slots__ = ('stats', 'start')
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.start = 0
+
+    def __enter__(self):
+        self.start = _perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stats.add(_perf_counter_ns() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    """
+    Named spans over the hot path, timed with `perf_counter_ns`
+
+        with profiler.span('actor'):
+            action = agent.get_action(observations)
+
+        @profiler.profile('env_step')
+        def step(...): ...
+
+    When disabled, `span` hands out a shared no-op context (a few hundred ns per use). A span keeps one start time,
+    so the same name should not be nested in itself or entered from several threads at once.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._spans = {}
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        span = self._spans.get(name)
+        if span is None:
+            span = self._spans[name] = _Span(SpanStats(name))
+        return span
+
+    def profile(self, name=None):
+        """
+        Decorator timing every call of a function as one span (named after the function by default)
+        """
+
+        def decorator(fn):
+            span_name = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.span(span_name):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def tic(self):
+        """
+        Start time for `toc`, for phases that are not a single block
+        """
+        return _perf_counter_ns() if self.enabled else 0
+
+    def toc(self, name, tic):
+        """
+        Record the time since `tic` as one sample of span `name`
+        """
+        if self.enabled and tic:
+            self.span(name).stats.add(_perf_counter_ns() - tic)
+
+    def record(self, name, ns):
+        """
+        Add a duration (ns) measured elsewhere
+        """
+        if self.enabled:
+            self.span(name).stats.add(int(ns))
+
+    def reset(self):
+        self._spans.clear()
+
+    def summary(self):
+        """
+        {span: {count, mean_us, p50_us, p99_us, max_us}}
+        """
+        return {name: span.stats.summary() for name, span in sorted(self._spans.items())}
+
+    def write_scalars(self, add_scalar, step, prefix='profiler'):
+        """
+        Export p50/p99/max per span through `add_scalar(tag, value, step)`, e.g., `tf.summary.scalar` within a writer
+        context or `SummaryWriter.add_scalar`
+        """
+        for name, stats in self.summary().items():
+            for key in ('p50_us', 'p99_us', 'max_us'):
+                add_scalar(f"{prefix}/{name}/{key}", stats[key], step)
+
+    def save_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        return path
+
+    def __str__(self):
+        lines = [f"{'span':<24}{'count':>10}{'p50 (us)':>12}{'p99 (us)':>12}{'max (us)':>12}"]
+        for name, s in self.summary().items():
+            lines.append(f"{name:<24}{s['count']:>10}{s['p50_us']:>12.1f}{s['p99_us']:>12.1f}{s['max_us']:>12.1f}")
+        return "\n".join(lines)
+
+
+# Process-wide profiler, enabled from the config at startup
+profiler = Profiler()
+
+
+def _overhead_ns(prof, n=200000):
+    start = _perf_counter_ns()
+    for _ in range(n):
+        with prof.span('overhead'):
+            pass
+    return (_perf_counter_ns() - start) / n
+
+
+if __name__ == '__main__':
+    print(f"Disabled span: {_overhead_ns(Profiler(enabled=False)):.0f} ns")
+    print(f"Enabled span: {_overhead_ns(Profiler(enabled=True)):.0f} ns")
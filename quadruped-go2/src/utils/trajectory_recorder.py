@@ -0,0 +1,171 @@
+import os
+import enum
+import glob
+import json
+import queue
+import threading
+import numpy as np
+
+SCHEMA_FILE = 'schema.json'
+
+
+def to_numpy(value):
+    """
+    Convert a logged value (scalar, enum, array or tensor) to a NumPy array
+    """
+    if isinstance(value, enum.Enum):
+        value = value.value
+    if hasattr(value, 'detach'):  # torch tensors
+        value = value.detach().cpu().numpy()
+    elif hasattr(value, 'numpy'):  # tf tensors
+        value = value.numpy()
+    return np.asarray(value)
+
+
+def infer_schema(frame: dict):
+    """
+    Fixed schema {field: (shape, dtype)} from a sample frame
+    """
+    schema = {}
+    for name, value in frame.items():
+        value = to_numpy(value)
+        if value.dtype == object:
+            raise RuntimeError(f"Field {name} cannot be recorded as a fixed-shape array: {value}")
+        schema[name] = (value.shape, value.dtype)
+    return schema
+
+
+class TrajectoryRecorder:
+    """
+    Streaming trajectory recorder with a fixed schema
+
+    Every field is written into a preallocated (chunk_size, *shape) buffer. Full chunks are handed to a writer thread
+    which appends them as `chunk_XXXXXX.npz` files (one array per field) to the recorder directory, while the
+    recording side continues with the next free buffer. Only `num_buffers` chunks are ever held in memory, so the
+    memory stays bounded no matter how long the run is. Use `load_trajectory` to read selected fields back.
+
+    A chunk that cannot be written (e.g., disk full) is dropped with a warning and its buffer is reused, so recording
+    never blocks on a failed writer; the first such error is raised by `close`.
+    """
+
+    def __init__(self, path, schema=None, chunk_size=1024, num_buffers=2):
+        self.path = path
+        self.chunk_size = int(chunk_size)
+        self.num_buffers = max(int(num_buffers), 2)
+        self.schema = None
+
+        self._free = queue.Queue()
+        self._pending = queue.Queue()
+        self._buffers = None
+        self._row = 0
+        self._chunk_idx = 0
+        self._num_flushed = 0
+        self._writer = None
+        self._error = None  # First write error
+        self.dropped_frames = 0
+
+        # Otherwise the schema is inferred from the first recorded frame
+        if schema is not None:
+            self._allocate(schema)
+
+    def _allocate(self, schema):
+        os.makedirs(self.path, exist_ok=True)
+        self.schema = {name: (tuple(shape), np.dtype(dtype)) for name, (shape, dtype) in schema.items()}
+        with open(os.path.join(self.path, SCHEMA_FILE), 'w') as f:
+            json.dump({name: {'shape': list(shape), 'dtype': dtype.str} for name, (shape, dtype) in
+                       self.schema.items()}, f, indent=2)
+
+        for _ in range(self.num_buffers):
+            self._free.put({name: np.empty((self.chunk_size,) + shape, dtype=dtype)
+                            for name, (shape, dtype) in self.schema.items()})
+        self._buffers = self._free.get()
+
+        self._writer = threading.Thread(target=self._write_loop, name="trajectory-writer", daemon=True)
+        self._writer.start()
+
+    def record(self, frame: dict):
+        """
+        Record one frame {field: value}, every field of the schema is required
+        """
+        if self.schema is None:
+            self._allocate(infer_schema(frame))
+
+        row = self._row
+        for name, buffer in self._buffers.items():
+            buffer[row] = to_numpy(frame[name]).reshape(buffer.shape[1:])
+        self._row += 1
+
+        if self._row == self.chunk_size:
+            self._submit()
+
+    def _submit(self):
+        self._pending.put((self._chunk_idx, self._buffers, self._row))
+        self._chunk_idx += 1
+        self._num_flushed += self._row
+        self._row = 0
+        self._buffers = self._free.get()  # Blocks only if the writer falls behind
+
+    def _write_loop(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            chunk_idx, buffers, n = item
+            file_path = os.path.join(self.path, f"chunk_{chunk_idx:06d}.npz")
+            try:
+                with open(file_path + '.tmp', 'wb') as f:
+                    np.savez(f, **{name: buffer[:n] for name, buffer in buffers.items()})
+                os.replace(file_path + '.tmp', file_path)  # Readers never see a partial chunk
+            except Exception as e:
+                print(f"Failed to write trajectory chunk {chunk_idx} ({n} frames dropped): {e!r}")
+                self.dropped_frames += n
+                if self._error is None:
+                    self._error = e
+            finally:
+                self._free.put(buffers)
+
+    def flush(self):
+        """
+        Hand the partially filled chunk to the writer
+        """
+        if self._row > 0:
+            self._submit()
+
+    def close(self):
+        """
+        Write the remaining frames and stop the writer, raises the first write error if chunks were dropped
+        """
+        if self._writer is None:
+            return
+        self.flush()
+        self._pending.put(None)
+        self._writer.join()
+        self._writer = None
+        if self._error is not None:
+            raise RuntimeError(f"{self.dropped_frames} frames could not be written to {self.path}") from self._error
+
+    def __len__(self):
+        return self._num_flushed + self._row
+
+
+def load_trajectory(path, fields=None, start_chunk=0):
+    """
+    Load the recorded trajectory as {field: array}, reading only the given fields (all by default)
+    """
+    with open(os.path.join(path, SCHEMA_FILE), 'r') as f:
+        schema = json.load(f)
+    if fields is None:
+        fields = list(schema.keys())
+    for name in fields:
+        if name not in schema:
+            raise RuntimeError(f"Field {name} is not recorded in {path}")
+
+    columns = {name: [] for name in fields}
+    for chunk_path in sorted(glob.glob(os.path.join(path, 'chunk_*.npz')))[start_chunk:]:
+        with np.load(chunk_path) as data:
+            for name in fields:
+                columns[name].append(data[name])
+
+    return {name: np.concatenate(chunks) if chunks else
+            np.empty([0] + schema[name]['shape'], dtype=np.dtype(schema[name]['dtype']))
+            for name, chunks in columns.items()}